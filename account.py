@@ -0,0 +1,143 @@
+import math
+import threading
+import time
+
+# Au-delà, le dernier tick n'est plus un prix exécutable : on redemande getSymbol
+TICK_MAX_AGE = 10.0
+# keepAlive toutes les ~3 s : au-delà, le flux est coupé ou en reconnexion, solde et marge
+# ne sont plus tenus à jour
+STREAM_MAX_AGE = 10.0
+# Champs du message `balance` du streaming -> noms de getMarginLevel
+BALANCE_FIELDS = {
+    "balance": "balance",
+    "credit": "credit",
+    "equity": "equity",
+    "margin": "margin",
+    "marginFree": "margin_free",
+    "marginLevel": "margin_level",
+}
+
+
+class AccountState:
+    """État du compte en mémoire, tenu à jour par le streaming.
+
+    Le solde et la marge viennent des messages `balance` (après un
+    getMarginLevel initial), les prix des messages `tickPrices`, les
+    caractéristiques des symboles d'un getSymbol mis en cache. Les
+    contrôles de risque et le calcul du volume n'envoient donc aucune
+    requête : ils ne lisent que cet état.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.margin = {}  # au format de getMarginLevel
+        self.updated_at = None
+        self.symbols = {}
+        self.ticks = {}  # symbole -> (bid, ask, instant local)
+        self.balance_updates = 0
+        self.stream_seen_at = None  # dernier message balance ou keepAlive
+
+    @property
+    def ready(self):
+        return self.updated_at is not None
+
+    def load_margin_level(self, data):
+        """Réponse getMarginLevel (état initial, ou repli sans streaming)"""
+        with self._lock:
+            self.margin = dict(data)
+            self.updated_at = time.time()
+
+    def on_balance(self, message):
+        data = message.get('data') or {}
+        with self._lock:
+            margin = dict(self.margin)
+            for field, name in BALANCE_FIELDS.items():
+                if field in data:
+                    margin[name] = data[field]
+            self.margin = margin
+            self.updated_at = self.stream_seen_at = time.time()
+            self.balance_updates += 1
+
+    def on_keep_alive(self, message):
+        self.stream_seen_at = time.time()
+
+    def stream_fresh(self, max_age=STREAM_MAX_AGE):
+        """Vrai si le streaming a donné signe de vie récemment (balance ou keepAlive)"""
+        seen = self.stream_seen_at
+        return seen is not None and time.time() - seen <= max_age
+
+    def on_tick(self, message):
+        data = message.get('data') or {}
+        symbol = data.get('symbol')
+        if symbol is not None and data.get('bid') is not None and data.get('ask') is not None:
+            self.ticks[symbol] = (float(data['bid']), float(data['ask']), time.time())
+
+    def set_symbol(self, info):
+        if info and info.get('symbol'):
+            self.symbols[info['symbol']] = info
+            if info.get('bid') and info.get('ask'):
+                self.ticks.setdefault(info['symbol'], (float(info['bid']), float(info['ask']), time.time()))
+
+    def prices(self, symbol, max_age=TICK_MAX_AGE):
+        """(bid, ask) du dernier tick s'il est assez récent, sinon None"""
+        tick = self.ticks.get(symbol)
+        if tick is None or time.time() - tick[2] > max_age:
+            return None
+        return tick[0], tick[1]
+
+    def snapshot(self):
+        return dict(self.margin, updated_at=self.updated_at)
+
+    def position_size(self, symbol, risk_percentage, stop_distance, price, min_volume=0.0):
+        """Volume tel qu'une perte au stop coûte `risk_percentage` des fonds propres.
+
+        Renvoie (volume, None) ou (None, raison du refus). Le volume est
+        arrondi au pas de lot, borné par lotMin/lotMax puis réduit à ce
+        que la marge libre permet.
+        """
+        info = self.symbols.get(symbol)
+        if info is None:
+            return None, f"symbole {symbol} inconnu"
+        if not self.ready:
+            return None, "état du compte indisponible"
+        equity = float(self.margin.get('equity') or self.margin.get('balance') or 0.0)
+        margin_free = float(self.margin.get('margin_free') or 0.0)
+        if equity <= 0 or stop_distance <= 0 or price <= 0:
+            return None, f"paramètres invalides (equity={equity}, stop={stop_distance}, prix={price})"
+
+        lot_min = max(float(info.get('lotMin', 0.01)), min_volume)
+        lot_max = float(info.get('lotMax', 100.0))
+        lot_step = float(info.get('lotStep', 0.01))
+        tick_size = float(info.get('tickSize') or 10.0 ** -int(info.get('precision', 5)))
+        tick_value = float(info.get('tickValue') or 1.0)
+        # Perte par lot si le stop est touché
+        loss_per_lot = stop_distance / tick_size * tick_value
+        volume = equity * risk_percentage / loss_per_lot
+
+        # Marge requise par lot : `leverage` est le pourcentage de marge xAPI (3.33 = 1:30).
+        # Le nominal (contractSize x prix) est dans la devise de cotation ; tickValue / tickSize
+        # est la valeur d'une unité de prix par lot dans la devise du compte, ce qui donne
+        # directement le nominal converti, comparable à margin_free. Sans tickValue, on
+        # suppose la devise de cotation égale à celle du compte.
+        if info.get('tickValue'):
+            notional = price / tick_size * tick_value
+        else:
+            notional = float(info.get('contractSize', 100000)) * price
+        margin_per_lot = notional * float(info.get('leverage', 100.0)) / 100.0
+        if margin_per_lot > 0:
+            volume = min(volume, margin_free / margin_per_lot)
+
+        volume = min(math.floor(volume / lot_step + 1e-9) * lot_step, lot_max)
+        if volume < lot_min:
+            return None, f"volume {volume:.4f} inférieur au lot minimum {lot_min} (risque ou marge insuffisants)"
+        return round(volume, 8), None
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "updated_at": self.updated_at,
+            "balance_updates": self.balance_updates,
+            "stream_seen_at": self.stream_seen_at,
+            "symbols": sorted(self.symbols),
+            "ticks": {s: {"bid": t[0], "ask": t[1], "age": round(time.time() - t[2], 3)} for s, t in self.ticks.items()},
+        }
@@ -0,0 +1,445 @@
+import argparse
+import calendar
+import collections
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+logger = logging.getLogger('trading_bot')
+
+# Intervalle d'écriture groupée : une transaction par lot d'événements
+FLUSH_INTERVAL = 0.5
+MAX_BATCH = 5000
+# Un signal BUY/SELL est jugé sur la clôture du N-ième instantané d'indicateurs suivant
+SIGNAL_HORIZON = 5
+# Types d'événements du bot conservés par le magasin
+ANALYTICS_EVENTS = ("trade", "signal", "indicators")
+# Connexions de lecture gardées ouvertes entre deux requêtes
+MAX_IDLE_READERS = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trades (
+    position INTEGER PRIMARY KEY,
+    symbol TEXT NOT NULL,
+    side TEXT,
+    volume REAL,
+    open_time INTEGER,
+    close_time INTEGER NOT NULL,
+    open_price REAL,
+    close_price REAL,
+    profit REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS trades_symbol_time ON trades(symbol, close_time);
+CREATE INDEX IF NOT EXISTS trades_time ON trades(close_time);
+
+CREATE TABLE IF NOT EXISTS signals (
+    id INTEGER PRIMARY KEY,
+    symbol TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    signal_type TEXT,
+    sma_condition INTEGER,
+    price_condition INTEGER,
+    rsi_condition INTEGER,
+    hit INTEGER
+);
+CREATE INDEX IF NOT EXISTS signals_symbol_time ON signals(symbol, ts);
+CREATE INDEX IF NOT EXISTS signals_time ON signals(ts);
+CREATE INDEX IF NOT EXISTS signals_pending ON signals(symbol, ts)
+    WHERE hit IS NULL AND signal_type IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS indicators (
+    symbol TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    close REAL,
+    sma20 REAL,
+    sma50 REAL,
+    rsi REAL,
+    periods INTEGER,
+    PRIMARY KEY (symbol, ts)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS daily (
+    day TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    pnl REAL NOT NULL DEFAULT 0,
+    trades INTEGER NOT NULL DEFAULT 0,
+    wins INTEGER NOT NULL DEFAULT 0,
+    gross_profit REAL NOT NULL DEFAULT 0,
+    gross_loss REAL NOT NULL DEFAULT 0,
+    signals INTEGER NOT NULL DEFAULT 0,
+    resolved INTEGER NOT NULL DEFAULT 0,
+    hits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, symbol)
+) WITHOUT ROWID;
+"""
+
+_UPSERT_DAILY = """
+INSERT INTO daily (day, symbol, pnl, trades, wins, gross_profit, gross_loss, signals, resolved, hits)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (day, symbol) DO UPDATE SET
+    pnl = pnl + excluded.pnl,
+    trades = trades + excluded.trades,
+    wins = wins + excluded.wins,
+    gross_profit = gross_profit + excluded.gross_profit,
+    gross_loss = gross_loss + excluded.gross_loss,
+    signals = signals + excluded.signals,
+    resolved = resolved + excluded.resolved,
+    hits = hits + excluded.hits
+"""
+
+# Clôture du N-ième instantané qui suit chaque signal encore en attente
+_PENDING_SIGNALS = """
+SELECT s.id, s.symbol, s.ts, s.signal_type, i.close,
+       (SELECT n.close FROM indicators n WHERE n.symbol = s.symbol AND n.ts > s.ts
+        ORDER BY n.ts LIMIT 1 OFFSET ?)
+FROM signals s JOIN indicators i ON i.symbol = s.symbol AND i.ts = s.ts
+WHERE s.hit IS NULL AND s.signal_type IS NOT NULL
+"""
+
+_DAILY_COLUMNS = "pnl, trades, wins, gross_profit, gross_loss, signals, resolved, hits"
+
+
+def day_of_ms(ms):
+    return time.strftime('%Y-%m-%d', time.gmtime(ms / 1000.0))
+
+
+def day_start_ms(day):
+    """'AAAA-MM-JJ' (UTC) -> millisecondes"""
+    return calendar.timegm(time.strptime(day, '%Y-%m-%d')) * 1000
+
+
+def bar_time_ms(value):
+    """Heure de bougie des événements du bot ('AAAA-MM-JJ HH:MM:SS', UTC) ou déjà en ms"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    return calendar.timegm(time.strptime(value, '%Y-%m-%d %H:%M:%S')) * 1000
+
+
+def _ratio(num, den):
+    return round(num / den, 4) if den else None
+
+
+def _with_rates(row):
+    row["win_rate"] = _ratio(row["wins"], row["trades"])
+    row["hit_rate"] = _ratio(row["hits"], row["resolved"])
+    row["profit_factor"] = _ratio(row["gross_profit"], -row["gross_loss"])
+    return row
+
+
+class AnalyticsStore:
+    """Historique des trades clôturés, signaux et indicateurs dans SQLite, avec agrégats par jour.
+
+    `record` (abonné aux événements du bot) ne fait que mettre l'événement
+    en file ; un thread écrit les lots dans une transaction, au plus
+    `flush_interval` secondes après le premier événement en attente. Les
+    agrégats journaliers (PnL, gains, signaux jugés) sont tenus à jour dans
+    la même transaction : résumés et séries par jour ne relisent jamais
+    l'historique brut. Base en WAL : les lectures (routes HTTP, autres
+    workers) ne bloquent pas l'écriture.
+    """
+
+    def __init__(self, path, flush_interval=FLUSH_INTERVAL, max_batch=MAX_BATCH,
+                 horizon=SIGNAL_HORIZON, events=ANALYTICS_EVENTS):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.horizon = horizon
+        self.events = set(events)
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._queued = 0  # numéro du dernier événement mis en file
+        self._written = 0  # numéro du dernier événement validé en base
+        self._waiters = 0
+        self._running = False
+        self._thread = None
+        self._readers = []  # connexions de lecture libres, réutilisées d'une requête à l'autre
+        self._readers_lock = threading.Lock()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+        self.batches = 0
+        self.rows = 0
+        self.failures = 0
+        self.last_batch_ms = None
+
+    # -- connexions -------------------------------------------------------------
+
+    def _connect(self):
+        with self._schema_lock:
+            if not self._schema_ready:
+                # Mode WAL (persistant dans le fichier) et schéma : une fois à l'ouverture,
+                # pas à chaque nouvelle connexion de lecture
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                conn = self._open()
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(SCHEMA)
+                self._schema_ready = True
+                return conn
+        return self._open()
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _query(self, sql, params=()):
+        # Les threads HTTP sont éphémères : une connexion par thread laisserait
+        # ses descripteurs (.db, -wal) ouverts jusqu'au passage du ramasse-miettes
+        with self._readers_lock:
+            conn = self._readers.pop() if self._readers else None
+        if conn is None:
+            conn = self._connect()
+            conn.row_factory = sqlite3.Row
+        try:
+            return [dict(row) for row in conn.execute(sql, params)]
+        finally:
+            with self._readers_lock:
+                if len(self._readers) < MAX_IDLE_READERS:
+                    self._readers.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+
+    # -- écriture ---------------------------------------------------------------
+
+    def record(self, event_type, data):
+        """Abonné aux événements du bot (cf. XTBTradingBot.event_listeners)"""
+        if event_type not in self.events or not data:
+            return
+        if event_type == "trade" and not data.get("closed"):
+            return
+        self._enqueue((event_type, data))
+
+    def record_trades(self, trades):
+        """Trades clôturés d'une réponse getTradesHistory (repli sans streaming)"""
+        for trade in trades:
+            self._enqueue(("trade", dict(trade, closed=True)))
+
+    def _enqueue(self, item):
+        with self._cond:
+            if not self._running:
+                self._start()
+            self._queue.append(item)
+            self._queued += 1
+            if len(self._queue) == 1 or len(self._queue) >= self.max_batch:
+                self._cond.notify_all()
+
+    def _start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='analytics-writer', daemon=True)
+        self._thread.start()
+
+    def flush(self, timeout=10.0):
+        """Attend que tout ce qui est en file soit en base ; False si le délai expire"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            target = self._queued
+            # Le writer n'attend pas la fin de l'intervalle quand quelqu'un attend
+            self._waiters += 1
+            self._cond.notify_all()
+            try:
+                while self._written < target and self._running:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            finally:
+                self._waiters -= 1
+            return self._written >= target
+
+    def _run(self):
+        conn = self._connect()
+        while True:
+            with self._cond:
+                while self._running and not self._queue:
+                    self._cond.wait()
+                if not self._running and not self._queue:
+                    break
+                deadline = time.monotonic() + self.flush_interval
+                while self._running and not self._waiters and len(self._queue) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.max_batch))]
+                target = self._written + len(batch)
+            t0 = time.perf_counter()
+            try:
+                self._write_batch(conn, batch)
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Écriture du lot d'analyse ({len(batch)} événements): {str(e)}")
+            with self._cond:
+                self._written = target
+                self.batches += 1
+                self.rows += len(batch)
+                self.last_batch_ms = round((time.perf_counter() - t0) * 1000.0, 3)
+                self._cond.notify_all()
+        conn.close()
+
+    def _write_batch(self, conn, batch):
+        trades, signals, snapshots = [], [], {}
+        for event_type, data in batch:
+            try:
+                if event_type == "trade":
+                    trades.append(self._trade_row(data))
+                elif event_type == "signal":
+                    signals.append(self._signal_row(data))
+                else:
+                    row = self._indicator_row(data)
+                    snapshots[row[:2]] = row  # même bougie : seul le dernier instantané compte
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(f"Événement {event_type} ignoré par l'analyse: {str(e)}")
+        daily = collections.defaultdict(lambda: [0.0, 0, 0, 0.0, 0.0, 0, 0, 0])
+        with conn:
+            for row in trades:
+                inserted = conn.execute("INSERT OR IGNORE INTO trades VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", row).rowcount
+                if inserted:
+                    # Un trade déjà reçu (streaming puis historique) n'est compté qu'une fois
+                    profit = row[8]
+                    agg = daily[(day_of_ms(row[5]), row[1])]
+                    agg[0] += profit
+                    agg[1] += 1
+                    agg[2] += profit > 0
+                    agg[3] += max(profit, 0.0)
+                    agg[4] += min(profit, 0.0)
+            if signals:
+                conn.executemany("INSERT INTO signals (symbol, ts, signal_type, sma_condition, price_condition, "
+                                 "rsi_condition) VALUES (?, ?, ?, ?, ?, ?)", signals)
+                for symbol, ts, signal_type, *_ in signals:
+                    if signal_type:
+                        daily[(day_of_ms(ts), symbol)][5] += 1
+            if snapshots:
+                conn.executemany("INSERT OR REPLACE INTO indicators VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                 list(snapshots.values()))
+                self._resolve_signals(conn, daily)
+            if daily:
+                conn.executemany(_UPSERT_DAILY, [key + tuple(agg) for key, agg in daily.items()])
+
+    def _resolve_signals(self, conn, daily):
+        """Juge les signaux dont le N-ième instantané suivant est arrivé : BUY touché si le prix a monté"""
+        resolved = []
+        for signal_id, symbol, ts, signal_type, close, later in conn.execute(_PENDING_SIGNALS, (self.horizon - 1,)):
+            if later is None or close is None:
+                continue
+            hit = int((later - close) * (1 if signal_type == "BUY" else -1) > 0)
+            resolved.append((hit, signal_id))
+            agg = daily[(day_of_ms(ts), symbol)]
+            agg[6] += 1
+            agg[7] += hit
+        if resolved:
+            conn.executemany("UPDATE signals SET hit = ? WHERE id = ?", resolved)
+
+    @staticmethod
+    def _trade_row(data):
+        cmd = data.get("cmd")
+        return (int(data.get("position") or data["order"]), data["symbol"],
+                "BUY" if cmd == 0 else "SELL" if cmd == 1 else None,
+                data.get("volume"), data.get("open_time"), int(data["close_time"]),
+                data.get("open_price"), data.get("close_price"), float(data.get("profit") or 0.0))
+
+    @staticmethod
+    def _signal_row(data):
+        return (data["symbol"], bar_time_ms(data["time"]), data.get("signal_type"),
+                data.get("sma_condition"), data.get("price_condition"), data.get("rsi_condition"))
+
+    @staticmethod
+    def _indicator_row(data):
+        return (data["symbol"], bar_time_ms(data["time"]), data.get("close"), data.get("sma20"),
+                data.get("sma50"), data.get("rsi"), data.get("periods"))
+
+    def close(self):
+        with self._cond:
+            if not self._running:
+                return
+            self._running = False
+            self._cond.notify_all()
+        self._thread.join(timeout=10)
+        with self._readers_lock:
+            readers, self._readers = self._readers, []
+        for conn in readers:
+            conn.close()
+
+    # -- requêtes ---------------------------------------------------------------
+
+    @staticmethod
+    def _where(clauses):
+        clauses = [(sql, value) for sql, value in clauses if value is not None]
+        where = " WHERE " + " AND ".join(sql for sql, _ in clauses) if clauses else ""
+        return where, tuple(value for _, value in clauses)
+
+    def daily(self, symbol=None, start=None, end=None):
+        """Agrégats par jour (UTC), tous symboles confondus si `symbol` est None ; bornes 'AAAA-MM-JJ'"""
+        where, params = self._where([("symbol = ?", symbol), ("day >= ?", start), ("day <= ?", end)])
+        if symbol is not None:
+            sql = f"SELECT day, symbol, {_DAILY_COLUMNS} FROM daily{where} ORDER BY day"
+        else:
+            sums = ", ".join(f"SUM({column}) AS {column}" for column in _DAILY_COLUMNS.split(", "))
+            sql = f"SELECT day, {sums} FROM daily{where} GROUP BY day ORDER BY day"
+        return [_with_rates(row) for row in self._query(sql, params)]
+
+    def summary(self, symbol=None, start=None, end=None):
+        """Totaux sur la période : PnL, taux de gain, taux de réussite des signaux"""
+        where, params = self._where([("symbol = ?", symbol), ("day >= ?", start), ("day <= ?", end)])
+        sums = ", ".join(f"COALESCE(SUM({column}), 0) AS {column}" for column in _DAILY_COLUMNS.split(", "))
+        row = self._query(f"SELECT COUNT(DISTINCT day) AS days, MIN(day) AS first_day, MAX(day) AS last_day, "
+                          f"{sums} FROM daily{where}", params)[0]
+        row["symbol"] = symbol
+        row["pnl"] = round(row["pnl"], 2)
+        return _with_rates(row)
+
+    def trades(self, symbol=None, start=None, end=None, limit=100):
+        """Trades clôturés, plus récents d'abord ; bornes en millisecondes"""
+        where, params = self._where([("symbol = ?", symbol), ("close_time >= ?", start), ("close_time < ?", end)])
+        return self._query(f"SELECT * FROM trades{where} ORDER BY close_time DESC LIMIT ?", params + (limit,))
+
+    def signals(self, symbol=None, start=None, end=None, signal_type=None, limit=100):
+        """Signaux évalués, plus récents d'abord ; `signal_type` 'BUY', 'SELL' ou 'NONE'"""
+        where, params = self._where([("symbol = ?", symbol), ("ts >= ?", start), ("ts < ?", end),
+                                     ("signal_type = ?", None if signal_type == "NONE" else signal_type)])
+        if signal_type == "NONE":
+            where += (" AND " if where else " WHERE ") + "signal_type IS NULL"
+        return self._query(f"SELECT * FROM signals{where} ORDER BY ts DESC LIMIT ?", params + (limit,))
+
+    def indicators(self, symbol, start=None, end=None, limit=500):
+        """Instantanés d'indicateurs d'un symbole, plus récents d'abord"""
+        where, params = self._where([("symbol = ?", symbol), ("ts >= ?", start), ("ts < ?", end)])
+        return self._query(f"SELECT * FROM indicators{where} ORDER BY ts DESC LIMIT ?", params + (limit,))
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "queued": len(self._queue),
+            "written": self._written,
+            "batches": self.batches,
+            "rows": self.rows,
+            "failures": self.failures,
+            "last_batch_ms": self.last_batch_ms,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Statistiques des trades et signaux enregistrés par le bot")
+    parser.add_argument('--db', default=os.getenv('ANALYTICS_DB', 'analytics.db'), help="base SQLite")
+    parser.add_argument('--symbol', help="symbole (défaut : tous)")
+    parser.add_argument('--from', dest='start', help="premier jour AAAA-MM-JJ")
+    parser.add_argument('--to', dest='end', help="dernier jour AAAA-MM-JJ")
+    parser.add_argument('--daily', action='store_true', help="une ligne par jour")
+    args = parser.parse_args(argv)
+
+    store = AnalyticsStore(args.db)
+    if args.daily:
+        for row in store.daily(args.symbol, args.start, args.end):
+            print(json.dumps(row))
+    else:
+        print(json.dumps(store.summary(args.symbol, args.start, args.end), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
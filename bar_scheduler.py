@@ -0,0 +1,81 @@
+import threading
+import time
+from collections import deque
+
+from bars import MINUTE_MS, period_minutes, timeframe_name
+
+# Marge après la clôture : la dernière bougie doit être disponible chez le broker
+SETTLE_MS = 5
+
+
+class BarCloseScheduler:
+    """Réveille la stratégie juste après chaque clôture de bougie.
+
+    Les frontières de bougies sont calculées en heure serveur (`ServerClock`),
+    puis converties en heure locale pour l'attente : le cycle reste en phase
+    avec les bougies quelle que soit sa durée, au lieu de dériver comme une
+    pause fixe. Le retard de chaque réveil est mesuré.
+    """
+
+    def __init__(self, timeframes, clock, settle_ms=SETTLE_MS):
+        self.periods = {timeframe_name(tf): period_minutes(tf) * MINUTE_MS for tf in timeframes}
+        self.clock = clock
+        self.settle_ms = settle_ms
+        self.wakeups = 0
+        self.last_close = None
+        self._lateness = deque(maxlen=1000)
+        self._pending = None
+        self._stop = threading.Event()
+
+    def next_close(self, server_ms):
+        """(heure serveur de la prochaine clôture, timeframes qui clôturent à cet instant)"""
+        closes = {tf: (int(server_ms) // period + 1) * period for tf, period in self.periods.items()}
+        close = min(closes.values())
+        return close, [tf for tf, at in closes.items() if at == close]
+
+    def wait(self, timeout=None):
+        """Attend la prochaine clôture ; renvoie (heure serveur, timeframes), None si arrêté,
+        ou (None, []) si `timeout` secondes passent avant la clôture.
+
+        Une clôture attendue reste due après un timeout : elle est rendue à l'appel
+        suivant, même si celui-ci arrive après elle.
+        """
+        if self._pending is None:
+            self._pending = self.next_close(self.clock.now_ms())
+        close, timeframes = self._pending
+        target = self.clock.to_local(close + self.settle_ms)
+        deadline = time.time() + timeout if timeout is not None else None
+        while True:
+            remaining = target - time.time()
+            if remaining <= 0:
+                break
+            if deadline is not None:
+                if time.time() >= deadline:
+                    return None, []
+                remaining = min(remaining, deadline - time.time())
+            if self._stop.wait(remaining):
+                return None
+        self._pending = None
+        self._lateness.append((time.time() - target) * 1000.0)
+        self.wakeups += 1
+        self.last_close = close
+        return close, timeframes
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        lateness = sorted(self._lateness)
+
+        def pct(p):
+            if not lateness:
+                return None
+            return round(lateness[min(len(lateness) - 1, int(p / 100.0 * len(lateness)))], 3)
+
+        return {
+            "timeframes": list(self.periods),
+            "wakeups": self.wakeups,
+            "last_close": self.last_close,
+            "lateness_ms": {"p50": pct(50), "p99": pct(99), "max": pct(100)},
+            "clock": self.clock.stats(),
+        }
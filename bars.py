@@ -0,0 +1,265 @@
+import threading
+from array import array
+
+# Périodes xAPI (minutes) ; les deux notations sont acceptées : '1h' et 'H1'
+TIMEFRAMES = {
+    '1m': 1, 'M1': 1,
+    '5m': 5, 'M5': 5,
+    '15m': 15, 'M15': 15,
+    '30m': 30, 'M30': 30,
+    '1h': 60, 'H1': 60,
+    '4h': 240, 'H4': 240,
+    '1d': 1440, 'D1': 1440,
+}
+NAMES = {1: 'M1', 5: 'M5', 15: 'M15', 30: 'M30', 60: 'H1', 240: 'H4', 1440: 'D1'}
+DEFAULT_TIMEFRAMES = ('M1', 'M5', 'H1', 'D1')
+MINUTE_MS = 60 * 1000
+FIELDS = ('open', 'high', 'low', 'close', 'vol')
+
+
+def period_minutes(timeframe):
+    """Période xAPI (minutes) d'un timeframe ; ValueError s'il est inconnu"""
+    try:
+        return TIMEFRAMES[timeframe]
+    except KeyError:
+        raise ValueError(f"Timeframe inconnu: {timeframe} (attendu: {', '.join(TIMEFRAMES)})")
+
+
+def timeframe_name(timeframe):
+    """Nom canonique ('1h' -> 'H1')"""
+    return NAMES[period_minutes(timeframe)]
+
+
+class BarSeries:
+    """Bougies closes d'un timeframe dans un tampon circulaire de taille fixe.
+
+    Une colonne `array` par champ, préallouée : ajouter une bougie n'alloue
+    rien, la plus ancienne est écrasée une fois la capacité atteinte. Les
+    lectures de colonnes remettent d'abord la fenêtre au début du tampon
+    (rotation en place) puis rendent des vues, sans copie.
+    """
+
+    def __init__(self, period, capacity=1000):
+        self.period = period
+        self.period_ms = period * MINUTE_MS
+        self.capacity = capacity
+        self.ctm = array('q', bytes(8 * capacity))
+        self.columns = {name: array('d', bytes(8 * capacity)) for name in FIELDS}
+        self._start = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def _index(self, i):
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("BarSeries index out of range")
+        return (self._start + i) % self.capacity
+
+    def append(self, ctm, open_, high, low, close, vol=0.0):
+        if self._count < self.capacity:
+            slot = (self._start + self._count) % self.capacity
+            self._count += 1
+        else:
+            slot = self._start
+            self._start = (self._start + 1) % self.capacity
+        self._write(slot, ctm, open_, high, low, close, vol)
+
+    def replace_last(self, ctm, open_, high, low, close, vol=0.0):
+        self._write(self._index(-1), ctm, open_, high, low, close, vol)
+
+    def _write(self, slot, ctm, open_, high, low, close, vol):
+        self.ctm[slot] = ctm
+        columns = self.columns
+        columns['open'][slot] = open_
+        columns['high'][slot] = high
+        columns['low'][slot] = low
+        columns['close'][slot] = close
+        columns['vol'][slot] = vol
+
+    @property
+    def last_ctm(self):
+        return self.ctm[self._index(-1)] if self._count else None
+
+    def bar(self, i=-1):
+        slot = self._index(i)
+        bar = {name: column[slot] for name, column in self.columns.items()}
+        bar['ctm'] = self.ctm[slot]
+        return bar
+
+    def _linearize(self):
+        """Rotation en place : la plus ancienne bougie revient à l'indice 0.
+
+        Le tampon ne se replie qu'une fois plein ; seule la plus petite des deux
+        parties est copiée à part, l'autre est déplacée (memmove) dans le tampon.
+        Entre deux lectures, cette partie se limite aux bougies ajoutées depuis.
+        """
+        start, n = self._start, self.capacity
+        if start + self._count <= n:
+            return
+        for column in (self.ctm, *self.columns.values()):
+            view = memoryview(column)
+            if start <= n - start:
+                head = column[:start]
+                view[:n - start] = view[start:]
+                view[n - start:] = head
+            else:
+                tail = column[start:]
+                view[n - start:] = view[:start]
+                view[:n - start] = tail
+            view.release()
+        self._start = 0
+
+    def _ordered(self, column):
+        return memoryview(column)[self._start:self._start + self._count]
+
+    def column(self, name):
+        """Vue (memoryview) sur une colonne ('ctm' ou un champ) dans l'ordre chronologique.
+
+        Sans copie : elle suit le tampon et n'est valable que jusqu'au prochain ajout.
+        """
+        self._linearize()
+        return self._ordered(self.ctm if name == 'ctm' else self.columns[name])
+
+    def to_columns(self):
+        """{champ: memoryview} dans l'ordre chronologique (vues, comme `column`)"""
+        self._linearize()
+        columns = {name: self._ordered(column) for name, column in self.columns.items()}
+        columns['ctm'] = self._ordered(self.ctm)
+        return columns
+
+    def to_dataframe(self):
+        import numpy as np  # imports différés : seul ce chemin en a besoin
+        import pandas as pd
+        # Une seule copie, celle du DataFrame, directement depuis les vues
+        df = pd.DataFrame({name: np.array(column) for name, column in self.to_columns().items()})
+        df['timestamp'] = pd.to_datetime(df['ctm'], unit='ms')
+        return df.set_index('timestamp')
+
+
+class BarAggregator:
+    """Construit les bougies OHLC de plusieurs timeframes à partir d'un flux de ticks.
+
+    Chaque tick met à jour la bougie en cours de chaque timeframe ; quand un
+    tick tombe dans une période suivante, la bougie en cours est close,
+    rangée dans sa `BarSeries` et annoncée aux `listeners` (timeframe, bougie).
+    `seed()` charge les bougies du broker au démarrage : les ticks d'une
+    période déjà close chez le broker sont ignorés, pour ne pas la réécrire.
+    """
+
+    def __init__(self, symbol, timeframes=DEFAULT_TIMEFRAMES, capacity=1000):
+        self.symbol = symbol
+        timeframes = dict.fromkeys(timeframe_name(tf) for tf in timeframes)
+        self.series = {tf: BarSeries(period_minutes(tf), capacity) for tf in timeframes}
+        self.current = {tf: None for tf in timeframes}  # [ctm, open, high, low, close, vol]
+        self.listeners = []
+        # Ticks du thread de streaming, clôtures et chargement depuis le thread de trading
+        self._lock = threading.RLock()
+        self.ticks = 0
+        self.late_ticks = 0
+        self.candles = 0
+        self.closed_bars = 0
+
+    def add_tick(self, timestamp, price, volume=0.0):
+        with self._lock:
+            self._add_tick(timestamp, price, volume)
+
+    def _add_tick(self, timestamp, price, volume):
+        self.ticks += 1
+        for tf, series in self.series.items():
+            ctm = timestamp - timestamp % series.period_ms
+            bar = self.current[tf]
+            if bar is not None and ctm == bar[0]:
+                if price > bar[2]:
+                    bar[2] = price
+                elif price < bar[3]:
+                    bar[3] = price
+                bar[4] = price
+                bar[5] += volume
+                continue
+            if (bar is not None and ctm < bar[0]) or (len(series) and ctm <= series.last_ctm):
+                # Tick en retard sur une bougie déjà close
+                self.late_ticks += 1
+                continue
+            if bar is not None:
+                self._close(tf, bar)
+            self.current[tf] = [ctm, price, price, price, price, volume]
+
+    def add_candle(self, ctm, open_, high, low, close, vol=0.0, period=1):
+        """Bougie close du broker (M1 rattrapée après une coupure du streaming).
+
+        Fusionnée dans chaque timeframe comme les ticks qu'elle résume :
+        ouverture, extrêmes et clôture dans l'ordre, le volume avec la clôture.
+        """
+        last = ctm + period * MINUTE_MS - 1
+        with self._lock:
+            for timestamp, price, volume in ((ctm, open_, 0.0), (ctm, high, 0.0), (ctm, low, 0.0),
+                                             (last, close, vol)):
+                self._add_tick(timestamp, price, volume)
+            # Ce ne sont pas des ticks reçus
+            self.ticks -= 4
+            self.candles += 1
+
+    def flush(self, now_ms):
+        """Clôt les bougies dont la période est écoulée sans nouveau tick"""
+        with self._lock:
+            for tf, bar in list(self.current.items()):
+                if bar is not None and bar[0] + self.series[tf].period_ms <= now_ms:
+                    self.current[tf] = None
+                    self._close(tf, bar)
+
+    def _close(self, tf, bar):
+        self.series[tf].append(*bar)
+        self.closed_bars += 1
+        if self.listeners:
+            event = {"symbol": self.symbol, "timeframe": tf, "ctm": bar[0], "open": bar[1],
+                     "high": bar[2], "low": bar[3], "close": bar[4], "vol": bar[5]}
+            for listener in self.listeners:
+                listener(tf, event)
+
+    def seed(self, timeframe, ctm, open_, high, low, close, vol=None, now_ms=None):
+        """Charge des bougies du broker (colonnes alignées, ordre chronologique).
+
+        Les bougies déjà connues sont remplacées (le broker fait foi), celles
+        qui ne sont pas closes à `now_ms` sont ignorées : elles se
+        reconstruiront à partir des ticks.
+        """
+        with self._lock:
+            return self._seed(timeframe_name(timeframe), ctm, open_, high, low, close, vol, now_ms)
+
+    def _seed(self, timeframe, ctm, open_, high, low, close, vol, now_ms):
+        series = self.series[timeframe]
+        loaded = 0
+        for i in range(len(ctm)):
+            bar_ctm = int(ctm[i])
+            if now_ms is not None and bar_ctm + series.period_ms > now_ms:
+                break
+            bar = (bar_ctm, open_[i], high[i], low[i], close[i], vol[i] if vol is not None else 0.0)
+            last = series.last_ctm
+            if last is None or bar_ctm > last:
+                series.append(*bar)
+            elif bar_ctm == last:
+                series.replace_last(*bar)
+            else:
+                continue
+            loaded += 1
+        current = self.current[timeframe]
+        if current is not None and len(series) and current[0] <= series.last_ctm:
+            self.current[timeframe] = None
+        return loaded
+
+    def bars(self, timeframe):
+        """Série des bougies closes d'un timeframe ('1h' ou 'H1')"""
+        return self.series[timeframe_name(timeframe)]
+
+    def stats(self):
+        return {
+            "symbol": self.symbol,
+            "ticks": self.ticks,
+            "late_ticks": self.late_ticks,
+            "candles": self.candles,
+            "closed_bars": self.closed_bars,
+            "bars": {tf: len(series) for tf, series in self.series.items()},
+        }
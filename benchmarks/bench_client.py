@@ -0,0 +1,258 @@
+"""Benchmarks du transport xAPI : allers-retours de commandes et débit du streaming."""
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.common import latency_result, measure, rate_result, value_result
+
+
+def run(ctx):
+    from xapi.client import Client
+    from xapi.streaming import Streaming
+
+    results = []
+    broker = ctx.broker
+    # Transport seul : l'espacement xAPI est mesuré à part, plus bas
+    client = Client(command_rate=0)
+    client.connect()
+    client.login('bench', 'bench')
+
+    results.append(latency_result("client.ping", measure(lambda: client.commandExecute("ping"), ctx.repeat(500))))
+    results.append(latency_result("client.getSymbol", measure(
+        lambda: client.commandExecute("getSymbol", {"symbol": "EURUSD"}), ctx.repeat(200))))
+
+    end = int(time.time() * 1000)
+    for bars in ctx.sizes([1000, 10000, 50000]):
+        info = {"info": {"symbol": "EURUSD", "period": 1, "start": end - bars * 60000, "end": end}}
+        samples = measure(lambda: client.commandExecute("getChartRangeRequest", info), ctx.repeat(5 if bars > 10000 else 20))
+        results.append(latency_result("client.getChartRangeRequest[%d]" % bars, samples, bars=bars))
+
+    # Streaming : le faux broker envoie des ticks aussi vite que le socket les accepte
+    count = ctx.repeat(20000)
+    broker.tick_interval = 0
+    broker.max_stream_messages = count
+    streaming = Streaming(client)
+    streaming.connect()
+    streaming.sock.sendall(json.dumps({"command": "getTickPrices", "streamSessionId": client.stream_session_id,
+                                       "symbol": "EURUSD"}).encode('utf-8') + b'\n')
+    received = 0
+    t0 = time.perf_counter()
+    for _ in streaming.read_stream():
+        received += 1
+        if received >= count:
+            break
+    elapsed = time.perf_counter() - t0
+    streaming.disconnect()
+    broker.tick_interval = 0.01
+    broker.max_stream_messages = None
+    results.append(rate_result("streaming.read_stream", received, elapsed, unit="msgs/s"))
+
+    client.disconnect()
+    results.extend(scheduler_results(ctx))
+    results.extend(chart_results(ctx))
+    return results
+
+
+def scheduler_results(ctx):
+    from xapi.client import Client
+    from xapi.scheduler import MAX_COMMANDS_PER_SECOND, PRIORITY_DATA, PRIORITY_TRADE
+
+    results = []
+    client = Client()
+    client.connect()
+    interval = 1.0 / MAX_COMMANDS_PER_SECOND
+
+    # Précision de l'espacement : écart entre deux envois consécutifs à la limite xAPI
+    count = ctx.repeat(20)
+    stamps = []
+    for _ in range(count):
+        client.commandExecute("ping")
+        stamps.append(time.perf_counter())
+    gaps = [b - a for a, b in zip(stamps, stamps[1:])]
+    results.append(latency_result("scheduler.dispatch_interval", gaps, target_ms=interval * 1000.0))
+
+    # Un ordre mis en file derrière des requêtes de bougies passe en tête
+    end = int(time.time() * 1000)
+    info = {"info": {"symbol": "EURUSD", "period": 1, "start": end - 100 * 60000, "end": end}}
+    backlog = [client.scheduler.submit({"command": "getChartRangeRequest", "arguments": info}, PRIORITY_DATA)
+               for _ in range(10)]
+    t0 = time.perf_counter()
+    client.scheduler.submit({"command": "ping"}, PRIORITY_TRADE).result()
+    results.append(latency_result("scheduler.priority_wait[trade_behind_10_data]", [time.perf_counter() - t0],
+                                  queued_after=client.scheduler_stats()["queue_depth"]))
+    for future in backlog:
+        future.result()
+    results.extend(clock_results(ctx, client))
+    client.disconnect()
+    return results
+
+
+def clock_results(ctx, client):
+    from bar_scheduler import BarCloseScheduler
+    from xapi.clock import ServerClock
+
+    # Même machine que le faux broker : le vrai décalage est 0, |offset| est donc l'erreur
+    clock = ServerClock()
+    t0 = time.perf_counter()
+    clock.sync(client)
+    results = [latency_result("clock.sync", [time.perf_counter() - t0], offset_error_ms=abs(clock.offset_ms),
+                              rtt_ms=clock.rtt_ms)]
+
+    # Réveils aux clôtures d'un pseudo-timeframe de 100 ms, avec 30 ms de travail par cycle :
+    # une pause fixe dériverait du temps de travail à chaque cycle, pas le scheduler
+    scheduler = BarCloseScheduler(['M1'], clock)
+    scheduler.periods = {'T100': 100}
+    phases = []
+    for _ in range(ctx.repeat(50)):
+        close, _ = scheduler.wait()
+        phases.append((clock.now_ms() - close) / 1000.0)
+        time.sleep(0.03)
+    lateness = scheduler.stats()["lateness_ms"]
+    results.append(latency_result("bar_scheduler.wake_phase", phases, settle_ms=scheduler.settle_ms,
+                                  lateness_p99_ms=lateness["p99"]))
+
+    # Réveil anticipé (resynchronisation, nouvel essai) : la clôture attendue n'est pas perdue,
+    # même si le travail fait entre-temps la dépasse
+    expected, _ = scheduler.next_close(clock.now_ms())
+    if scheduler.wait(0.0) != (None, []):
+        raise RuntimeError("bar_scheduler.wait(timeout) n'a pas expiré avant la clôture")
+    time.sleep(0.15)
+    close, _ = scheduler.wait(0.0)
+    if close != expected:
+        raise RuntimeError("clôture %s perdue après un timeout (reçu %s)" % (expected, close))
+    return results
+
+
+# -- réponses de bougies : délai jusqu'aux tableaux et pic de RSS, lecture historique contre décodage incrémental --
+
+LINK_BYTES_PER_SECOND = 50e6  # lien broker simulé, pour que transfert et décodage se chevauchent
+SEND_CHUNK = 64 * 1024
+
+
+def chart_payload(candles):
+    start = 1_700_000_000_000
+    rate_infos = [{"close": float((i * 7) % 40 - 20), "ctm": start + i * 60000,
+                   "ctmString": time.strftime('%b %d, %Y, %I:%M:%S %p', time.gmtime((start + i * 60000) / 1000)),
+                   "high": float((i * 3) % 25), "low": float(-((i * 5) % 25)), "open": 108000.0 + (i * 13) % 900,
+                   "vol": float(i % 500)} for i in range(candles)]
+    return json.dumps({"status": True, "returnData": {"digits": 5, "rateInfos": rate_infos}}).encode('utf-8') + b'\n\n'
+
+
+class PayloadServer(object):
+    """Répond à chaque ligne de requête par la même réponse de bougies, au rythme de LINK_BYTES_PER_SECOND"""
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.listener = socket.socket()
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(8)
+        self.port = self.listener.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        pause = SEND_CHUNK / LINK_BYTES_PER_SECOND
+        with conn:
+            reader = conn.makefile('rb')
+            for _ in reader:
+                t0 = time.perf_counter()
+                for i in range(0, len(self.payload), SEND_CHUNK):
+                    conn.sendall(self.payload[i:i + SEND_CHUNK])
+                    delay = t0 + (i + SEND_CHUNK) / LINK_BYTES_PER_SECOND - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(min(delay, pause))
+
+    def close(self):
+        self.listener.close()
+
+
+def read_legacy(sock):
+    """L'ancien Client._read_response, puis le DataFrame qu'en construisait get_historical_data"""
+    import pandas as pd
+    buffer = bytearray()
+    while True:
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        buffer.extend(chunk)
+        if b'\n' in buffer and buffer.strip():
+            response = json.loads(buffer.decode('utf-8').strip())
+            break
+    df = pd.DataFrame(response['returnData']['rateInfos'])
+    return {name: df[name].to_numpy() for name in ('ctm', 'open', 'close', 'high', 'low', 'vol')}
+
+
+def read_incremental(sock, candles):
+    from xapi.client import Client
+    client = Client(command_rate=0)
+    client.sock = sock
+    return client._read_chart_response(candles)['returnData']['rateInfos'].columns()
+
+
+def chart_request(port, mode, candles):
+    """Secondes entre l'envoi de la requête et l'obtention des colonnes numériques"""
+    with socket.create_connection(('127.0.0.1', port)) as sock:
+        t0 = time.perf_counter()
+        sock.sendall(b'{"command":"getChartRangeRequest"}\n')
+        columns = read_legacy(sock) if mode == 'legacy' else read_incremental(sock, candles)
+        seconds = time.perf_counter() - t0
+    if len(columns['ctm']) != candles:
+        raise RuntimeError("%s : %d bougies décodées sur %d" % (mode, len(columns['ctm']), candles))
+    return seconds
+
+
+def proc_status_kb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    return None
+
+
+def chart_child(mode, port, candles):
+    """Interpréteur neuf : hausse du pic de RSS causée par une réponse de bougies"""
+    import pandas  # noqa: F401  (les imports ne font pas partie de la mesure)
+    import xapi.client  # noqa: F401
+    # Remise à zéro du pic : ceux des imports ne masquent pas le décodage
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+    before = proc_status_kb('VmRSS')
+    seconds = chart_request(port, mode, candles)
+    print(json.dumps({"peak_rss_kb": proc_status_kb('VmHWM') - before, "seconds": seconds}))
+
+
+def chart_results(ctx):
+    results = []
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for candles in ctx.sizes([10000, 50000, 100000]):
+        server = PayloadServer(chart_payload(candles))
+        try:
+            transfer = len(server.payload) / LINK_BYTES_PER_SECOND
+            for mode in ('legacy', 'incremental'):
+                samples = measure(lambda: chart_request(server.port, mode, candles), ctx.repeat(3 if candles > 10000 else 10))
+                child = subprocess.run([sys.executable, '-c', 'import sys; from benchmarks.bench_client import chart_child; '
+                                        'chart_child(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]))',
+                                        mode, str(server.port), str(candles)],
+                                       cwd=repo, capture_output=True, text=True, timeout=300)
+                peak = json.loads(child.stdout.strip().splitlines()[-1])["peak_rss_kb"] if child.returncode == 0 else None
+                results.append(latency_result("chart.time_to_array[%s,%d]" % (mode, candles), samples,
+                                              payload_bytes=len(server.payload), transfer_ms=transfer * 1000.0))
+                results.append(value_result("chart.peak_rss[%s,%d]" % (mode, candles),
+                                            round(peak / 1024.0, 2) if peak is not None else None, "MB"))
+        finally:
+            server.close()
+    return results
@@ -0,0 +1,333 @@
+"""Latence des routes Flask sous charge concurrente, servies par un serveur WSGI local."""
+import json
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import latency_result, rate_result, value_result
+
+ENDPOINTS = ["/", "/status", "/logs", "/debug", "/analytics/summary"]
+# Les routes qui n'interrogent jamais le broker reçoivent plus de requêtes
+LOCAL_ENDPOINTS = ("/", "/analytics/summary")
+REQUEST_TIMEOUT = 10
+
+
+def serve(app):
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def hit(url):
+    t0 = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=REQUEST_TIMEOUT) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = None
+    return time.perf_counter() - t0, status
+
+
+def load(url, requests, concurrency):
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        t0 = time.perf_counter()
+        outcomes = list(pool.map(hit, [url] * requests))
+        elapsed = time.perf_counter() - t0
+    return outcomes, elapsed
+
+
+def run(ctx):
+    # Processus unique : cet interpréteur sert et trade, sans élection de leader
+    os.environ['LEADER_ELECTION'] = '0'
+    import start
+    from benchmarks.bench_strategy import keep_session
+
+    from rate_limiter import GCRALimiter
+
+    # Mesure des routes, pas des budgets de requêtes par client
+    start.rate_limiters = {budget: GCRALimiter(10 ** 9, 60) for budget in start.RATE_LIMITS}
+    # Connexion et préchauffage en arrière-plan, comme le hook post_worker_init de gunicorn
+    start.start_worker()
+    deadline = time.time() + 60
+    while not start.startup_state["ready"]:
+        if start.startup_state["error"] or time.time() > deadline:
+            raise RuntimeError("échec du démarrage : %s" % start.startup_state["error"])
+        time.sleep(0.05)
+    server = serve(start.app)
+    base = "http://127.0.0.1:%d" % server.server_port
+
+    results = []
+    concurrency = ctx.concurrency
+    try:
+        for path in ENDPOINTS:
+            # Nouvelle session broker par route : des routes non synchronisées peuvent
+            # désaligner le socket de commandes partagé après une série d'erreurs
+            start.bot.disconnect()
+            start.bot.connect()
+            keep_session(start.bot)
+            requests = ctx.repeat(400 if path in LOCAL_ENDPOINTS else 40)
+            outcomes, elapsed = load(base + path, requests, concurrency)
+            samples = [latency for latency, status in outcomes if status == 200]
+            errors = sum(1 for _, status in outcomes if status != 200)
+            results.append(latency_result("http%s[c=%d]" % (path, concurrency), samples, errors=errors))
+            results.append(rate_result("http%s[c=%d].throughput" % (path, concurrency), len(samples), elapsed,
+                                       unit="req/s", errors=errors))
+    finally:
+        server.shutdown()
+        start.bot.disconnect()
+        start.bot = None
+    results.append(limiter_result(ctx))
+    results.extend(client_key_results(start))
+    results.extend(feed_results(ctx))
+    results.extend(stream_server_results(ctx))
+    results.extend(worker_results(ctx))
+    return results
+
+
+def get_json(url):
+    try:
+        with urllib.request.urlopen(url, timeout=REQUEST_TIMEOUT) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, None
+    except (OSError, ValueError):
+        return None, None
+
+
+def wait_ready(base, deadline, exclude_leader=None):
+    """Pid du leader une fois que /ready a répondu 200 plusieurs fois de suite (n'importe quel worker)"""
+    streak = 0
+    while time.time() < deadline:
+        status, body = get_json(base + "/metrics")
+        leader = ((body or {}).get("leader") or {}).get("leader_pid")
+        ready, _ = get_json(base + "/ready")
+        if ready == 200 and leader and leader != exclude_leader:
+            streak += 1
+            if streak >= 5:
+                return leader
+        else:
+            streak = 0
+        time.sleep(0.02)
+    return None
+
+
+def worker_results(ctx):
+    """gunicorn avec plusieurs workers : un leader trade, tous servent /status"""
+    if not shutil.which('gunicorn'):
+        return []
+    from benchmarks.bench_startup import REPO
+    from benchmarks.fake_broker import free_port
+
+    results = []
+    broker = ctx.broker
+    for workers in ctx.sizes([1, 2, 4]):
+        port = free_port()
+        workdir = tempfile.mkdtemp(prefix='xtb-workers-')
+        env = dict(os.environ, PORT=str(port), PYTHONPATH=REPO, LEADER_DIR=os.path.join(workdir, 'leader'))
+        # Mesure des workers, pas des budgets de requêtes par client
+        env.update({"RATE_LIMIT_%s" % budget.upper(): "1000000000/60" for budget in ("default", "debug", "trade")})
+        env.pop('LEADER_ELECTION', None)
+        # Ordre de test au démarrage : désactivé par défaut, activé avec plusieurs workers
+        # pour vérifier qu'il ne part qu'une fois malgré la bascule
+        test_order = workers > 1
+        env['FORCE_TEST_ORDER'] = '1' if test_order else '0'
+        orders_before = broker.next_order
+        proc = subprocess.Popen(['gunicorn', '--config', os.path.join(REPO, 'gunicorn.conf.py'),
+                                 '--bind', '127.0.0.1:%d' % port, '--workers', str(workers),
+                                 '--threads', '8', '--timeout', '0', 'start:app'],
+                                cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        base = "http://127.0.0.1:%d" % port
+        try:
+            leader = wait_ready(base, time.time() + 120)
+            if leader is None:
+                raise RuntimeError("aucun leader prêt avec %d workers" % workers)
+            outcomes, elapsed = load(base + "/status", ctx.repeat(2000), ctx.concurrency)
+            samples = [latency for latency, status in outcomes if status == 200]
+            errors = len(outcomes) - len(samples)
+            leaders = {(get_json(base + "/metrics")[1] or {}).get("leader", {}).get("leader_pid")
+                       for _ in range(4 * workers)}
+            results.append(rate_result("workers[%d]/status.throughput" % workers, len(samples), elapsed,
+                                       unit="req/s", errors=errors, leaders=len(leaders - {None})))
+            results.append(latency_result("workers[%d]/status" % workers, samples, errors=errors))
+
+            if test_order:
+                # Le leader envoie l'ordre de test à son premier passage : la bascule vient après
+                deadline = time.time() + 30
+                while time.time() < deadline and broker.next_order == orders_before:
+                    time.sleep(0.05)
+            if workers > 1:
+                # Bascule : le leader est tué, un follower reprend depuis l'instantané
+                t0 = time.time()
+                os.kill(leader, signal.SIGKILL)
+                successor = wait_ready(base, time.time() + 120, exclude_leader=leader)
+                results.append(value_result("workers[%d].failover_seconds" % workers,
+                                            round(time.time() - t0, 3) if successor else None, "s",
+                                            successor=successor))
+            # L'ordre de test forcé part une fois par déploiement s'il est demandé, jamais sinon
+            time.sleep(1.0)
+            results.append(value_result("workers[%d].orders_sent" % workers, broker.next_order - orders_before,
+                                        "orders", expected=1 if test_order else 0,
+                                        force_test_order=test_order))
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+    return results
+
+
+def feed_results(ctx):
+    """Diffusion SSE : coût d'une publication avec des centaines d'abonnés, et coupure des abonnés lents"""
+    from event_feed import EventFeed
+    subscribers = 500
+    events = ctx.repeat(200)
+    feed = EventFeed(max_queue=events + 1, max_subscribers=subscribers)
+    subs = [feed.subscribe() for _ in range(subscribers)]
+    snapshot = {"symbol": "EURUSD", "time": "2024-01-01 00:00:00", "close": 1.08, "sma20": 1.079,
+                "sma50": 1.078, "rsi": 55.0, "periods": 6000}
+    samples = []
+    for _ in range(events):
+        t0 = time.perf_counter()
+        feed.publish("indicators", snapshot)
+        samples.append(time.perf_counter() - t0)
+    delivered = sum(len(s.queue) for s in subs)
+    results = [latency_result("feed.publish[subscribers=%d]" % subscribers, samples, delivered=delivered)]
+
+    # Les abonnés qui ne lisent jamais sont coupés une fois leur file pleine
+    slow = EventFeed(max_queue=16)
+    for _ in range(subscribers):
+        slow.subscribe()
+    for _ in range(32):
+        slow.publish("indicators", snapshot)
+    results.append(value_result("feed.slow_consumers_dropped", slow.stats()["dropped_subscribers"], "subscribers",
+                                higher_is_better=True, expected=subscribers))
+    return results
+
+
+def client_key_results(start):
+    """Identité des clients limités : ni un X-Forwarded-For falsifié ni une clé inconnue n'ouvrent un budget neuf"""
+    from rate_limiter import GCRALimiter
+    limit, attempts = 5, 20
+    saved = (start.rate_limiters, start.API_KEYS, start.RATE_LIMIT_EXEMPT_KEYS, start.TRUSTED_PROXY_HOPS)
+    start.API_KEYS, start.RATE_LIMIT_EXEMPT_KEYS = {"cle-connue"}, {"cle-supervision"}
+    client = start.app.test_client()
+    scenarios = {
+        # Le client choisit l'entrée de gauche, le proxy de confiance ajoute l'IP réelle
+        "spoofed_xff": (1, lambda i: {"X-Forwarded-For": "198.51.100.%d, 203.0.113.7" % i}),
+        "unknown_key": (1, lambda i: {"X-API-Key": "cle-%d" % i, "X-Forwarded-For": "203.0.113.8"}),
+        "no_proxy_xff": (0, lambda i: {"X-Forwarded-For": "198.51.100.%d" % i}),
+        "known_key": (1, lambda i: {"X-API-Key": "cle-connue"}),
+        "exempt_key": (1, lambda i: {"X-API-Key": "cle-supervision"}),
+    }
+    expected = {"spoofed_xff": attempts - limit, "unknown_key": attempts - limit, "no_proxy_xff": attempts - limit,
+                "known_key": attempts - limit, "exempt_key": 0}
+    results = []
+    try:
+        for name, (hops, headers) in scenarios.items():
+            start.TRUSTED_PROXY_HOPS = hops
+            start.rate_limiters = {budget: GCRALimiter(limit, 3600) for budget in start.RATE_LIMITS}
+            limited = sum(1 for i in range(attempts)
+                          if client.get("/", headers=headers(i),
+                                        environ_base={"REMOTE_ADDR": "10.0.0.1"}).status_code == 429)
+            if limited != expected[name]:
+                raise RuntimeError("client_key %s : %d requêtes limitées sur %d, %d attendues"
+                                   % (name, limited, attempts, expected[name]))
+            results.append(value_result("client_key.%s.limited" % name, limited, "requests",
+                                        higher_is_better=True, expected=expected[name]))
+    finally:
+        start.rate_limiters, start.API_KEYS, start.RATE_LIMIT_EXEMPT_KEYS, start.TRUSTED_PROXY_HOPS = saved
+    return results
+
+
+def stream_server_results(ctx):
+    """SSE sur HTTP via le serveur asynchrone : des centaines d'abonnés sur un seul thread"""
+    import re
+    import selectors
+    import socket
+    from event_feed import EventFeed
+    from sse_server import StreamServer
+
+    subscribers = 200 if ctx.quick else 500
+    events = ctx.repeat(50)
+    feed = EventFeed(max_queue=events + 16)
+    threads_before = threading.active_count()
+    server = StreamServer(feed, 0, host='127.0.0.1', max_subscribers=subscribers).start()
+    selector = selectors.DefaultSelector()
+    buffers = {}
+    samples = []
+    pattern = re.compile(rb'data: (\{[^\n]*\})\n')
+    try:
+        for _ in range(subscribers):
+            sock = socket.create_connection(('127.0.0.1', server.port))
+            sock.sendall(b"GET /stream HTTP/1.0\r\nHost: bench\r\n\r\n")
+            sock.setblocking(False)
+            selector.register(sock, selectors.EVENT_READ)
+            buffers[sock] = b''
+        deadline = time.time() + 30
+        while server.stats()["subscribers"] < subscribers and time.time() < deadline:
+            time.sleep(0.01)
+        threads = threading.active_count() - threads_before
+
+        def publish():
+            for i in range(events):
+                feed.publish("indicators", {"i": i, "sent": time.perf_counter()})
+                time.sleep(0.005)
+        publisher = threading.Thread(target=publish)
+        publisher.start()
+        deadline = time.time() + 60
+        while len(samples) < subscribers * events and time.time() < deadline:
+            for key, _ in selector.select(timeout=0.5):
+                chunk = key.fileobj.recv(65536)
+                received = time.perf_counter()
+                if not chunk:
+                    selector.unregister(key.fileobj)
+                    continue
+                data = buffers[key.fileobj] + chunk
+                end = 0
+                for match in pattern.finditer(data):
+                    samples.append(received - json.loads(match.group(1))["sent"])
+                    end = match.end()
+                buffers[key.fileobj] = data[end:]
+        publisher.join()
+    finally:
+        for sock in buffers:
+            sock.close()
+        server.stop()
+    if len(samples) != subscribers * events:
+        raise RuntimeError("SSE asynchrone : %d trames reçues sur %d" % (len(samples), subscribers * events))
+    return [
+        latency_result("sse.async.delivery[subscribers=%d]" % subscribers, samples, delivered=len(samples),
+                       events=events),
+        value_result("sse.async.threads[subscribers=%d]" % subscribers, threads, "threads", expected=1,
+                     dropped=server.stats()["dropped_subscribers"]),
+    ]
+
+
+def limiter_result(ctx):
+    """Débit brut du limiteur : threads concurrents sur 1000 clients distincts"""
+    from rate_limiter import GCRALimiter
+    limiter = GCRALimiter(30, 60)
+    per_thread = ctx.repeat(50000)
+
+    def work(offset):
+        for i in range(per_thread):
+            limiter.hit("ip:10.0.%d.%d" % ((i + offset) % 4, (i * 7) % 250))
+
+    with ThreadPoolExecutor(max_workers=ctx.concurrency) as pool:
+        t0 = time.perf_counter()
+        list(pool.map(work, range(ctx.concurrency)))
+        elapsed = time.perf_counter() - t0
+    return rate_result("rate_limiter.hit[c=%d]" % ctx.concurrency, per_thread * ctx.concurrency, elapsed,
+                       unit="hits/s", clients=limiter.stats()["clients"])
@@ -0,0 +1,111 @@
+"""Benchmarks de démarrage à froid : détail ``-X importtime`` et délai avant la première réponse.
+
+Chaque mesure part d'un interpréteur neuf, comme un démarrage à froid Cloud Run.
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks.common import latency_result, value_result
+from benchmarks.fake_broker import free_port
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_importtime(stderr):
+    """{module: (self_us, cumulative_us)} depuis la sortie de ``python -X importtime``"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            modules[name.strip()] = (int(self_us), int(cumulative_us))
+        except ValueError:
+            continue
+    return modules
+
+
+def importtime(module, env):
+    env = dict(env, PYTHONPATH=REPO)
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import %s' % module],
+                          cwd=tempfile.gettempdir(), env=env, capture_output=True, text=True, timeout=120)
+    modules = parse_importtime(proc.stderr)
+    heaviest = sorted(((cum, name) for name, (_, cum) in modules.items() if '.' not in name), reverse=True)[:10]
+    return modules.get(module, (0, 0))[1] / 1000.0, [{"module": n, "cumulative_ms": c / 1000.0} for c, n in heaviest]
+
+
+def server_command(port):
+    if shutil.which('gunicorn'):
+        # Même point d'entrée que le Dockerfile
+        return ['gunicorn', '--config', os.path.join(REPO, 'gunicorn.conf.py'),
+                '--bind', '127.0.0.1:%d' % port, '--workers', '1', '--threads', '8',
+                '--timeout', '0', '--chdir', REPO, 'start:app']
+    return [sys.executable, os.path.join(REPO, 'start.py')]
+
+
+def poll(url, deadline):
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter(), response.read()
+        except urllib.error.HTTPError:
+            pass
+        except OSError:
+            pass
+        time.sleep(0.005)
+    return None, None
+
+
+def cold_start(env):
+    port = free_port()
+    workdir = tempfile.mkdtemp(prefix='xtb-coldstart-')
+    # Répertoire d'élection propre : aucun leader restant d'une autre exécution
+    env = dict(env, PORT=str(port), PYTHONPATH=REPO, LEADER_DIR=os.path.join(workdir, 'leader'))
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(server_command(port), cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = t0 + 120
+        first, _ = poll("http://127.0.0.1:%d/" % port, deadline)
+        ready, body = poll("http://127.0.0.1:%d/ready" % port, deadline)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    stages = json.loads(body)["stages"] if body else None
+    return (first - t0) if first else None, (ready - t0) if ready else None, stages
+
+
+def run(ctx):
+    env = dict(os.environ)
+    results = []
+
+    samples = []
+    heaviest = []
+    for _ in range(ctx.repeat(5) if not ctx.quick else 1):
+        total_ms, heaviest = importtime('start', env)
+        samples.append(total_ms / 1000.0)
+    results.append(latency_result("startup.import[start]", samples, heaviest=heaviest))
+
+    firsts, readies, stages = [], [], None
+    runs = ctx.repeat(5) if not ctx.quick else 1
+    for _ in range(runs):
+        first, ready, stages = cold_start(env)
+        if first is not None:
+            firsts.append(first)
+        if ready is not None:
+            readies.append(ready)
+    results.append(latency_result("startup.time_to_first_response", firsts))
+    results.append(latency_result("startup.time_to_ready", readies, stages=stages))
+    results.append(value_result("startup.failed_cold_starts", runs - len(readies), "runs"))
+    return results
@@ -0,0 +1,475 @@
+"""Benchmarks du cycle de stratégie : run_strategy, décodage des bougies, indicateurs, signaux, ordres."""
+import os
+import time
+
+from benchmarks.common import latency_result, measure, rate_result, value_result
+from benchmarks.fake_broker import PriceModel
+
+
+def make_bot(ctx):
+    from bot_cloud import XTBTradingBot
+    bot = XTBTradingBot(symbol='EURUSD', timeframe='1h')
+    if not bot.connect():
+        raise RuntimeError("échec de la connexion au faux broker")
+    return bot
+
+
+def keep_session(bot):
+    # Sans flux actif, check_connection force une reconnexion (et une pause de 2 s)
+    # toutes les 30 s : le benchmark mesure le cycle en régime établi, pas ce minuteur.
+    bot.last_reconnect = time.time()
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def synthetic_frame(rows):
+    import pandas as pd
+    prices = PriceModel()
+    start = 1_700_000_000_000
+    ctm = [start + i * 60000 for i in range(rows)]
+    df = pd.DataFrame([prices.candle('EURUSD', t, 1) for t in ctm], columns=['open', 'high', 'low', 'close'])
+    df['ctm'] = ctm
+    df['vol'] = 100.0
+    df['timestamp'] = pd.to_datetime(df['ctm'], unit='ms')
+    return df.set_index('timestamp').sort_index()
+
+
+def run(ctx):
+    results = []
+    broker = ctx.broker
+    bot = make_bot(ctx)
+
+    # Cycle complet sur un marché plat : toute l'analyse tourne, aucun ordre n'est envoyé
+    broker.prices = PriceModel(flat=True)
+    broker.hold_positions = False
+
+    def cycle():
+        keep_session(bot)
+        if not bot.run_strategy():
+            raise RuntimeError("échec de run_strategy")
+    results.append(latency_result("strategy.run_strategy[no_signal]", measure(cycle, ctx.repeat(20))))
+
+    broker.prices = PriceModel()
+
+    def history():
+        # Chargement à froid : toute la fenêtre, comme un redémarrage sans instantané
+        keep_session(bot)
+        bot.history = None
+        return bot.get_historical_data()
+    df = history()
+    samples = measure(history, ctx.repeat(20))
+    results.append(latency_result("strategy.get_historical_data", samples, rows=len(df)))
+    results.append(rate_result("strategy.get_historical_data.decode", len(df) * len(samples), sum(samples),
+                               unit="candles/s"))
+
+    def delta():
+        keep_session(bot)
+        return bot.get_historical_data()
+    results.append(latency_result("strategy.get_historical_data[delta]", measure(delta, ctx.repeat(20))))
+
+    # Reprise à chaud : écriture de l'instantané (atomique, fsync) et chargement dans un bot neuf
+    bot.snapshot_path = os.path.join(os.getcwd(), 'bench_state.snap')
+    results.append(latency_result("snapshot.save", measure(lambda: bot.save_snapshot(force=True), ctx.repeat(20)),
+                                  bytes=os.path.getsize(bot.snapshot_path) if bot.save_snapshot(force=True) else None))
+
+    def load():
+        from bot_cloud import XTBTradingBot
+        fresh = XTBTradingBot(symbol='EURUSD', timeframe='1h')
+        fresh.snapshot_path = bot.snapshot_path
+        if not fresh.load_snapshot():
+            raise RuntimeError("échec du chargement de l'instantané")
+    results.append(latency_result("snapshot.load", measure(load, ctx.repeat(20))))
+
+    for rows in ctx.sizes([100, 1000, 10000, 100000]):
+        frame = synthetic_frame(rows)
+        samples = measure(lambda: bot.calculate_indicators(frame), ctx.repeat(20 if rows < 100000 else 5))
+        results.append(latency_result("strategy.calculate_indicators[%d]" % rows, samples, rows=rows))
+
+    with_indicators = bot.calculate_indicators(synthetic_frame(6000))
+    results.append(latency_result("strategy.check_trading_signals",
+                                  measure(lambda: bot.check_trading_signals(with_indicators), ctx.repeat(200))))
+
+    # Agrégation des ticks en OHLC M1/M5/H1/D1 depuis un seul flux
+    from bars import BarAggregator
+    aggregator = BarAggregator('EURUSD')
+    ticks = ctx.repeat(200000)
+    prices = PriceModel()
+    start = 1_700_000_000_000
+    feed = [(start + i * 250, prices.price('EURUSD', start + i * 250)) for i in range(ticks)]
+    t0 = time.perf_counter()
+    for timestamp, price in feed:
+        aggregator.add_tick(timestamp, price)
+    results.append(rate_result("bars.add_tick", ticks, time.perf_counter() - t0, unit="ticks/s",
+                               closed_bars=aggregator.closed_bars))
+
+    # Les contrôles avant ordre lisent l'état du compte streamé : aucune requête sur le chemin de l'ordre
+    wait_until(lambda: bot.streaming_live() and bot.account.prices('EURUSD') is not None)
+    results.append(latency_result("account.check_account_status",
+                                  measure(bot.check_account_status, ctx.repeat(2000)),
+                                  streamed=bot.streaming_live()))
+    results.append(latency_result("account.position_size",
+                                  measure(lambda: bot.account.position_size('EURUSD', 0.02, 0.0163, 1.0852, 0.01),
+                                          ctx.repeat(20000))))
+
+    def trade():
+        keep_session(bot)
+        if not bot.execute_trade("BUY"):
+            raise RuntimeError("échec de execute_trade")
+    results.append(latency_result("strategy.execute_trade", measure(trade, ctx.repeat(5))))
+
+    bot.disconnect()
+    results.extend(reconnect_results(ctx))
+    results.extend(journal_results(ctx))
+    results.extend(scanner_results(ctx))
+    results.extend(market_data_results(ctx))
+    results.extend(analytics_results(ctx))
+    results.extend(robustness_results(ctx))
+    return results
+
+
+def reconnect_results(ctx):
+    """Reconnexions de check_connection : l'ancienne session est arrêtée avant d'en ouvrir une autre,
+    et un flux muet ne sert plus l'état du compte"""
+    bot = make_bot(ctx)
+    wait_until(bot.streaming_live)
+    keep_session(bot)
+    results = []
+
+    # Ping en exception : l'ancien dispatcher (et son flux) ne doit pas survivre à la reconnexion
+    old_dispatcher, old_streaming = bot.dispatcher, bot.streaming
+
+    def failing_ping(command, arguments=None, priority=None):
+        raise ConnectionError("ping perdu")
+    bot.client.commandExecute = failing_ping
+    t0 = time.perf_counter()
+    reconnected = bot.check_connection()
+    elapsed = time.perf_counter() - t0
+    if not reconnected or bot.dispatcher is old_dispatcher:
+        raise RuntimeError("check_connection n'a pas rouvert de session après l'exception du ping")
+    if old_dispatcher.running or old_streaming.sock is not None:
+        raise RuntimeError("ancien dispatcher encore actif après la reconnexion sur exception du ping")
+    results.append(latency_result("connection.reconnect[ping_exception]", [elapsed],
+                                  old_dispatcher_running=old_dispatcher.running))
+
+    # Flux sans balance ni keepAlive récent (reconnexion en cours) : repli sur getMarginLevel
+    wait_until(bot.streaming_live)
+    bot.account.stream_seen_at = time.time() - 60
+    updated_at = bot.account.updated_at
+    bot.check_account_status()
+    results.append(value_result("account.stale_stream_fallback", bot.account.updated_at != updated_at, "bool",
+                                higher_is_better=True, expected=True, streamed=bot.streaming_live()))
+    bot.disconnect()
+    return results
+
+
+def journal_results(ctx):
+    import threading
+    from journal import Journal, JournalReader
+
+    directory = os.path.join(os.getcwd(), 'bench_journal')
+    journal = Journal(directory)
+    event = {"symbol": "EURUSD", "signal_type": None, "sma_condition": True, "price_condition": False,
+             "rsi_condition": True, "time": "2024-01-02 10:00:00"}
+    results = [latency_result("journal.append", measure(lambda: journal.append("signal", event), ctx.repeat(20000)))]
+
+    # Ajouts durables depuis plusieurs threads : un fsync partagé (validation groupée)
+    order = {"symbol": "EURUSD", "signal": "BUY", "price": 1.08, "volume": 0.01, "status": "accepted"}
+    samples = []
+    lock = threading.Lock()
+
+    def writer(n):
+        for i in range(n):
+            t0 = time.perf_counter()
+            journal.append("order", dict(order, order_id=i % 500), wait=True)
+            with lock:
+                samples.append(time.perf_counter() - t0)
+    threads = [threading.Thread(target=writer, args=(ctx.repeat(100),)) for _ in range(8)]
+    commits = journal.commits
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    results.append(latency_result("journal.append[durable,threads=8]", samples,
+                                  events_per_fsync=len(samples) / max(1, journal.commits - commits)))
+    journal.close()
+
+    reader = JournalReader(directory)
+    day = reader.days()[-1]
+    results.append(latency_result("journal.index[build]", measure(
+        lambda: (os.path.exists(os.path.join(directory, 'journal-%s.idx.json' % day)) and
+                 os.remove(os.path.join(directory, 'journal-%s.idx.json' % day)), reader.index(day)),
+        ctx.repeat(5))))
+    results.append(latency_result("journal.order_lookup", measure(lambda: list(reader.order(42)), ctx.repeat(50))))
+    return results
+
+
+def scanner_results(ctx):
+    import numpy as np
+    import pandas as pd
+    from scanner import FEATURES, SignalScanner
+
+    results = []
+    rng = np.random.default_rng(7)
+    for count in ctx.sizes([100, 1000, 5000]):
+        symbols = ["SYM%04d" % i for i in range(count)]
+        close = 1.0 + rng.random(count)
+        values = np.column_stack([
+            close,
+            close * (1 + rng.normal(0, 0.002, count)),
+            close * (1 + rng.normal(0, 0.004, count)),
+            rng.uniform(10, 90, count),
+            np.full(count, 100.0),
+        ])
+        scanner = SignalScanner(capacity=count)
+        scanner.update_many(symbols, values)
+        candidates = scanner.scan()
+        results.append(latency_result("scanner.scan[%d]" % count, measure(scanner.scan, ctx.repeat(2000)),
+                                      candidates=len(candidates)))
+        results.append(latency_result("scanner.scan[%d,top=20]" % count,
+                                      measure(lambda: scanner.scan(top=20), ctx.repeat(2000))))
+
+        if count == 1000:
+            # Référence : le contrôle par symbole de check_trading_signals sur la dernière ligne de chaque DataFrame
+            frames = [pd.DataFrame([row] * 2, columns=FEATURES) for row in values]
+
+            def per_symbol():
+                found = []
+                for symbol, df in zip(symbols, frames):
+                    last = df.iloc[-1]
+                    if last['SMA20'] > last['SMA50'] and last['close'] > last['SMA20'] and last['RSI'] < 70:
+                        found.append((symbol, "BUY"))
+                    elif last['SMA20'] < last['SMA50'] and last['close'] < last['SMA20'] and last['RSI'] > 30:
+                        found.append((symbol, "SELL"))
+                return found
+            if len(per_symbol()) != len(candidates):
+                raise RuntimeError("le scanner et le contrôle par symbole divergent")
+            results.append(latency_result("scanner.per_symbol_iloc[%d]" % count, measure(per_symbol, ctx.repeat(5))))
+
+            row = values[0]
+            results.append(latency_result("scanner.update",
+                                          measure(lambda: scanner.update("SYM0000", *row), ctx.repeat(20000))))
+    return results
+
+
+def market_data_results(ctx):
+    """Mémoire résidente et coût du GC des fenêtres de bougies et des ticks de nombreux symboles :
+    DataFrames et dicts json.loads contre les conteneurs du bot (BarAggregator, AccountState)"""
+    import gc
+    import json
+    import tracemalloc
+    import pandas as pd
+    from account import AccountState
+    from bars import NAMES, BarAggregator
+    from xapi.chart_decoder import decode_prices
+
+    symbols = ["SYM%03d" % i for i in range(100 if ctx.quick else 500)]
+    timeframes = (1, 5, 15, 60, 1440)
+    candles = 100 if ctx.quick else 300
+    prices = PriceModel()
+    start = 1_700_000_000_000
+    # Chaque fenêtre est décodée de sa propre réponse, comme un getChart*
+    windows = {period: json.dumps({"status": True, "returnData": {"digits": 5, "rateInfos": [
+        prices.rate_info('EURUSD', start + i * period * 60000, period) for i in range(candles)]}})
+        for period in timeframes}
+    tick_messages = [json.dumps({"command": "tickPrices", "data": {
+        "symbol": symbol, "ask": 1.0852, "bid": 1.085, "askVolume": 1000, "bidVolume": 1000,
+        "high": 1.09, "low": 1.08, "level": 0, "spreadRaw": 0.0002, "spreadTable": 2.0,
+        "timestamp": start, "quoteId": 1}}) for symbol in symbols]
+
+    def decode_frame(rate_infos):
+        # Comme XTBTradingBot._decode_rate_infos
+        df = pd.DataFrame(decode_prices(rate_infos, 5))
+        df['timestamp'] = pd.to_datetime(df['ctm'], unit='ms')
+        return df.set_index('timestamp').sort_index()
+
+    def as_frames():
+        frames = {(symbol, period): decode_frame(json.loads(windows[period])['returnData']['rateInfos'])
+                  for symbol in symbols for period in timeframes}
+        ticks = {}
+        for message in tick_messages:
+            data = json.loads(message)['data']
+            ticks[data['symbol']] = data
+        return frames, ticks
+
+    def as_series():
+        # Bougies décodées rangées dans les BarSeries d'un agrégateur par symbole, ticks en tuples
+        aggregators = {symbol: BarAggregator(symbol, [NAMES[period] for period in timeframes], capacity=candles)
+                       for symbol in symbols}
+        for aggregator in aggregators.values():
+            for period in timeframes:
+                columns = decode_prices(json.loads(windows[period])['returnData']['rateInfos'], 5)
+                aggregator.seed(NAMES[period], *(columns[name].tolist() for name in
+                                                 ('ctm', 'open', 'high', 'low', 'close', 'vol')))
+        account = AccountState()
+        for message in tick_messages:
+            account.on_tick(json.loads(message))
+        return aggregators, account
+
+    results = []
+    label = "[%dx%d]" % (len(symbols), len(timeframes))
+    footprint = {}
+    for name, build in (("dataframe", as_frames), ("series", as_series)):
+        gc.collect()
+        objects = len(gc.get_objects())
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        held = build()
+        seconds = time.perf_counter() - t0
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        t0 = time.perf_counter()
+        gc.collect()
+        gc_seconds = time.perf_counter() - t0
+        footprint[name] = current
+        results.append(value_result("market_data.memory.%s%s" % (name, label), round(current / 1e6, 3), "MB",
+                                    candles=len(symbols) * len(timeframes) * candles,
+                                    gc_objects=len(gc.get_objects()) - objects,
+                                    build_seconds=round(seconds, 3)))
+        results.append(latency_result("market_data.gc_collect.%s%s" % (name, label), [gc_seconds]))
+        del held
+    results.append(value_result("market_data.memory_ratio" + label,
+                                round(footprint["dataframe"] / footprint["series"], 2), "x", higher_is_better=True))
+
+    aggregators, _ = as_series()
+    series = aggregators[symbols[0]].bars('H1')
+    # Tampon plein puis décalé : la colonne reste une vue contiguë, dans l'ordre chronologique
+    for i in range(candles // 3):
+        series.append(series.last_ctm + series.period_ms, 1.0, 1.1, 0.9, 1.05, 1.0)
+    view = series.column('ctm')
+    if not isinstance(view, memoryview) or len(view) != candles or \
+            list(view) != [view[-1] - (candles - 1 - i) * series.period_ms for i in range(candles)]:
+        raise RuntimeError("BarSeries.column ne rend pas une vue chronologique")
+    results.append(latency_result("market_data.series.append",
+                                  measure(lambda: series.append(start, 1.0, 1.1, 0.9, 1.05, 1.0), ctx.repeat(20000))))
+    results.append(latency_result("market_data.series.column",
+                                  measure(lambda: series.column('close'), ctx.repeat(20000)), copy=False))
+    results.append(latency_result("market_data.series.to_dataframe",
+                                  measure(series.to_dataframe, ctx.repeat(200))))
+    return results
+
+
+def analytics_results(ctx):
+    import random
+    from analytics import AnalyticsStore
+
+    # Des mois d'historique M5 : un instantané d'indicateurs et un signal par bougie, quelques trades par jour
+    days = 30 if ctx.quick else 180
+    symbols = ["EURUSD", "GBPUSD", "USDJPY"][:2 if ctx.quick else 3]
+    rng = random.Random(11)
+    start_ms = 1_700_006_400_000  # minuit UTC
+    events = []
+    position = 0
+    for symbol in symbols:
+        close = 1.0
+        for bar in range(days * 288):
+            ts = start_ms + bar * 300_000
+            close += rng.gauss(0, 0.0005)
+            events.append(("indicators", {"symbol": symbol, "time": ts, "close": close, "sma20": close,
+                                          "sma50": close, "rsi": 50.0, "periods": 100}))
+            events.append(("signal", {"symbol": symbol, "time": ts, "signal_type": rng.choice(("BUY", "SELL", None)),
+                                      "sma_condition": True, "price_condition": False, "rsi_condition": True}))
+            if bar % 48 == 0:
+                position += 1
+                events.append(("trade", {"position": position, "symbol": symbol, "cmd": bar % 2, "closed": True,
+                                         "volume": 0.01, "close_time": ts, "profit": rng.gauss(0.5, 10)}))
+
+    path = os.path.join(os.getcwd(), 'bench_analytics.db')
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    store = AnalyticsStore(path)
+    t0 = time.perf_counter()
+    for event_type, data in events:
+        store.record(event_type, data)
+    enqueued = time.perf_counter() - t0
+    if not store.flush(timeout=600):
+        raise RuntimeError("l'écriture de l'analyse n'a pas rattrapé son retard")
+    elapsed = time.perf_counter() - t0
+    results = [
+        rate_result("analytics.ingest", len(events), elapsed, unit="events/s", batches=store.batches, days=days,
+                    symbols=len(symbols)),
+        value_result("analytics.record_us", enqueued / len(events) * 1e6, "us"),
+    ]
+
+    repeat = ctx.repeat(200)
+    last_day = store.daily()[-1]["day"]
+    day_ms = start_ms + (days - 1) * 86_400_000
+    queries = [
+        ("analytics.summary", lambda: store.summary()),
+        ("analytics.summary[symbol,month]", lambda: store.summary("EURUSD", "2023-12-01", "2023-12-31")),
+        ("analytics.daily", lambda: store.daily()),
+        ("analytics.trades[100]", lambda: store.trades(limit=100)),
+        ("analytics.signals[symbol,day]", lambda: store.signals("EURUSD", day_ms, day_ms + 86_400_000,
+                                                                 limit=500)),
+        ("analytics.indicators[symbol,last_day]", lambda: store.indicators("EURUSD", day_ms, limit=500)),
+    ]
+    for name, query in queries:
+        results.append(latency_result(name, measure(query, repeat), history_days=days, last_day=last_day))
+
+    # Référence : les mêmes totaux recalculés sur l'historique brut à chaque requête
+    conn = store._connect()
+
+    def raw_summary():
+        trades = conn.execute("SELECT COUNT(*), SUM(profit), SUM(profit > 0) FROM trades").fetchone()
+        signals = conn.execute("SELECT COUNT(*), SUM(hit), COUNT(hit) FROM signals "
+                               "WHERE signal_type IS NOT NULL").fetchone()
+        return trades, signals
+    summary = store.summary()
+    trades, signals = raw_summary()
+    if (trades[0], signals[0], signals[1]) != (summary["trades"], summary["signals"], summary["hits"]):
+        raise RuntimeError("les agrégats journaliers divergent de l'historique brut")
+    results.append(latency_result("analytics.summary[raw_scan]", measure(raw_summary, ctx.repeat(20))))
+    conn.close()
+    store.close()
+    return results
+
+
+def robustness_results(ctx):
+    import numpy as np
+    import pandas as pd
+    import robustness
+    from bot_cloud import XTBTradingBot
+
+    # Des années de bougies H1 en marche aléatoire ; assez de trades pour un bootstrap significatif
+    bars = 20_000 if ctx.quick else 100_000
+    rng = np.random.default_rng(7)
+    close = 1.1 * np.exp(np.cumsum(rng.normal(0, 0.002, bars)))
+    wick = np.abs(rng.normal(0, 0.001, (2, bars)))
+    candles = {"ctm": 1_700_000_000_000 + np.arange(bars) * 3_600_000, "open": close, "high": close * (1 + wick[0]),
+               "low": close * (1 - wick[1]), "close": close}
+
+    # Les indicateurs vectorisés doivent égaler calculate_indicators pour que leur mesure ait un sens
+    frame = pd.DataFrame({"close": close})
+    reference = XTBTradingBot.calculate_indicators(None, frame)
+    sma20, sma50, rsi = robustness.indicators(close)
+    error = max(np.abs(reference[name].to_numpy() - values).max()
+                for name, values in (("SMA20", sma20), ("SMA50", sma50), ("RSI", rsi)))
+    if error > 1e-6:
+        raise RuntimeError("indicateurs de robustness différents de calculate_indicators (%g)" % error)
+    results = [
+        latency_result("robustness.prepare", measure(lambda: robustness.prepare(candles), ctx.repeat(20)), bars=bars),
+        latency_result("robustness.calculate_indicators[pandas]",
+                       measure(lambda: XTBTradingBot.calculate_indicators(None, frame), ctx.repeat(20)), bars=bars),
+    ]
+
+    resamples = 2000 if ctx.quick else 10000
+    grid = [(0.01, 0.02), (0.015, 0.02), (0.02, 0.03)]
+    workers = sorted({1, 2, os.cpu_count() or 1})
+    report = robustness.scaling(candles, 2000, 500, workers=workers, grid=grid, resamples=resamples)
+    if not all(row["consistent"] for row in report["scaling"]):
+        raise RuntimeError("les résultats de robustness dépendent du nombre de workers")
+    for row in report["scaling"]:
+        results.append(value_result("robustness.wall_s[workers=%d]" % row["workers"], row["wall_s"], "s",
+                                    speedup=row["speedup"], efficiency=row["efficiency"], cpu_count=os.cpu_count()))
+    # Débits par phase de l'exécution mono-processus (rapport du premier nombre de workers)
+    timings, walk_forward = report["timings"], report["walk_forward"]
+    results.append(rate_result("robustness.walk_forward", walk_forward["splits"], timings["walk_forward_s"],
+                               unit="splits/s", grid=len(grid), trades=walk_forward["trades"],
+                               shared_indicators=report["indicators"]["shared"]))
+    results.append(rate_result("robustness.bootstrap", resamples, timings["bootstrap_s"], unit="resamples/s",
+                               trades=walk_forward["trades"]))
+    return results
@@ -0,0 +1,221 @@
+"""Benchmarks du streaming : rafale de ticks, diffusion de bout en bout, reprise après coupure, enregistreur."""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from benchmarks.common import latency_result, rate_result, value_result
+
+
+def consume(subscription, done, pause=0.0, received=None):
+    """Vide `subscription` jusqu'à ce que `done` soit levé et qu'il ne reste rien en attente"""
+    while True:
+        message = subscription.get(timeout=0.05)
+        if message is None:
+            if done.is_set() or subscription.closed:
+                return
+            continue
+        if received is not None:
+            received.append(message)
+        if pause:
+            time.sleep(pause)
+
+
+def tick_storm(ctx):
+    from xapi.dispatcher import MODE_QUEUE, StreamDispatcher
+
+    dispatcher = StreamDispatcher()
+    symbols = ['SYM%03d' % i for i in range(50)]
+    # Un abonné lent sur tous les symboles (façon tableau de bord), des abonnés rapides
+    # sur quelques-uns, et une file de trades vidée moins vite qu'elle ne se remplit (contre-pression).
+    slow = dispatcher.subscribe('tickPrices')
+    fast = [dispatcher.subscribe('tickPrices', s) for s in symbols[:5]]
+    trades = dispatcher.subscribe('trade', mode=MODE_QUEUE, maxsize=64)
+
+    done = threading.Event()
+    trade_messages = []
+    consumers = [threading.Thread(target=consume, args=(slow, done, 0.001))]
+    consumers += [threading.Thread(target=consume, args=(s, done)) for s in fast]
+    consumers.append(threading.Thread(target=consume, args=(trades, done, 0.0002, trade_messages)))
+    for t in consumers:
+        t.start()
+
+    count = ctx.repeat(200000)
+    sent_trades = 0
+    t0 = time.perf_counter()
+    for i in range(count):
+        symbol = symbols[i % len(symbols)]
+        dispatcher.dispatch({"command": "tickPrices", "data": {"symbol": symbol, "bid": 1.0 + i * 1e-7,
+                                                               "ask": 1.00007 + i * 1e-7, "timestamp": i}})
+        if i % 20 == 0:
+            dispatcher.dispatch({"command": "trade", "data": {"symbol": symbol, "order": i, "state": "Modified"}})
+            sent_trades += 1
+    elapsed = time.perf_counter() - t0
+    done.set()
+    for t in consumers:
+        t.join(timeout=30)
+
+    orders = [m["data"]["order"] for m in trade_messages]
+    return [
+        rate_result("dispatcher.tick_storm", dispatcher.received, elapsed, unit="msgs/s", symbols=len(symbols)),
+        latency_result("dispatcher.latency[latest_slow]", list(slow.latencies)),
+        latency_result("dispatcher.latency[latest_fast]", [x for s in fast for x in s.latencies]),
+        latency_result("dispatcher.latency[queue]", list(trades.latencies)),
+        value_result("dispatcher.coalesced[latest_slow]", slow.coalesced, "msgs",
+                     delivered=slow.delivered, ticks=count),
+        value_result("dispatcher.trade_drops", sent_trades - len(orders), "msgs", sent=sent_trades,
+                     in_order=orders == sorted(orders), blocked=trades.blocked,
+                     blocked_seconds=trades.blocked_seconds),
+    ]
+
+
+def end_to_end(ctx):
+    from xapi.client import Client
+    from xapi.dispatcher import StreamDispatcher
+    from xapi.streaming import Streaming
+
+    broker = ctx.broker
+    client = Client(command_rate=0)
+    client.connect()
+    client.login('bench', 'bench')
+
+    symbols = ['EURUSD', 'GBPUSD', 'USDJPY', 'EURGBP']
+    per_symbol = ctx.repeat(20000)
+    broker.tick_interval = 0
+    broker.max_stream_messages = per_symbol
+    streaming = Streaming(client)
+    streaming.connect()
+    dispatcher = StreamDispatcher(streaming)
+    subscription = dispatcher.subscribe('tickPrices')
+    dispatcher.start()
+    t0 = time.perf_counter()
+    for symbol in symbols:
+        streaming.subscribe_ticks(symbol)
+    total = per_symbol * len(symbols)
+    deadline = time.monotonic() + 60
+    while dispatcher.received < total and time.monotonic() < deadline:
+        subscription.get(timeout=0.05)
+    elapsed = time.perf_counter() - t0
+    received = dispatcher.received
+    dispatcher.stop()
+    broker.tick_interval = 0.01
+    broker.max_stream_messages = None
+    client.disconnect()
+    return [rate_result("streaming.dispatcher", received, elapsed, unit="msgs/s", expected=total,
+                        coalesced=subscription.coalesced, delivered=subscription.delivered)]
+
+
+def reconnect_recovery(ctx, gap_bars=30):
+    from xapi.client import Client
+    from xapi.dispatcher import MODE_QUEUE, StreamDispatcher
+    from xapi.streaming import CANDLE_PERIOD_MS, Streaming
+
+    broker = ctx.broker
+    client = Client(command_rate=0)
+    client.connect()
+    client.login('bench', 'bench')
+    streaming = Streaming(client)
+    streaming.connect()
+    dispatcher = StreamDispatcher(streaming)
+    candles = dispatcher.subscribe('candle', 'EURUSD', mode=MODE_QUEUE)
+    trades = dispatcher.subscribe('trade', mode=MODE_QUEUE)
+    streaming.subscribe_candles('EURUSD')
+    streaming.subscribe_trades()
+    streaming.subscribe_balance()
+    streaming.subscribe_keep_alive()
+    dispatcher.start()
+    live = candles.get(timeout=5)
+    if live is None:
+        raise RuntimeError("aucune bougie du faux broker")
+
+    missing, trade_losses, price_gap = 0, 0, 0.0
+    rounds = ctx.repeat(10)
+    for _ in range(rounds):
+        # La dernière bougie vue date de `gap_bars` bougies, comme après une longue coupure
+        streaming.last_candle['EURUSD'] -= gap_bars * CANDLE_PERIOD_MS
+        recovered = len(streaming.recoveries)
+        broker.drop_streams()
+        deadline = time.monotonic() + 10
+        while len(streaming.recoveries) == recovered and time.monotonic() < deadline:
+            time.sleep(0.001)
+        if len(streaming.recoveries) == recovered:
+            raise RuntimeError("le flux n'a pas repris")
+        backfilled = 0
+        while True:
+            message = candles.get(timeout=0.2)
+            if message is None:
+                break
+            if message.get('backfill'):
+                backfilled += 1
+                # Décodées des points de getChartRangeRequest : même échelle de prix que le flux
+                price_gap = max(price_gap, abs(message['data']['close'] / live['data']['close'] - 1))
+        missing += max(0, gap_bars - backfilled)
+        # Abonnements rejoués : un nouvel ordre apparaît dans le flux des trades
+        client.commandExecute('tradeTransaction', {'tradeTransInfo': {'cmd': 0, 'symbol': 'EURUSD', 'volume': 0.01,
+                                                                      'price': 1.0, 'type': 0}})
+        trade_losses += 0 if trades.get(timeout=5) is not None else 1
+
+    recoveries = list(streaming.recoveries)[-rounds:]
+    dispatcher.stop()
+    client.disconnect()
+    if price_gap > 0.05:
+        raise RuntimeError("bougies rattrapées à %.0f%% des prix du flux" % (price_gap * 100))
+    return [
+        latency_result("streaming.recovery", [r["recovery_seconds"] for r in recoveries],
+                       gap_bars=gap_bars, backfilled=[r["backfilled"] for r in recoveries]),
+        latency_result("streaming.reconnect", [r["reconnect_seconds"] for r in recoveries]),
+        value_result("streaming.backfill_missing", missing, "bars", rounds=rounds),
+        value_result("streaming.resubscribe_failures", trade_losses, "rounds", rounds=rounds),
+    ]
+
+
+def recorder_results(ctx):
+    from xapi.recorder import CHANNEL_STREAM, Recorder, RecordReader
+
+    directory = tempfile.mkdtemp(prefix='xtb-recorder-', dir=os.getcwd())
+    recorder = Recorder(directory, segment_bytes=4 * 1024 * 1024).start()
+    count = ctx.repeat(500000)
+    base = 1_700_000_000.0
+    lines = [json.dumps({"command": "tickPrices", "data": {
+        "symbol": "EURUSD", "ask": 1.08007 + (i % 100) * 1e-5, "bid": 1.08 + (i % 100) * 1e-5, "askVolume": 1000,
+        "bidVolume": 1000, "high": 1.081, "low": 1.079, "level": 0, "quoteId": 0, "spreadRaw": 0.00007,
+        "spreadTable": 0.7, "timestamp": 1_700_000_000_000 + i}}).encode('utf-8') for i in range(1000)]
+
+    # Côté producteur : ce que paie le lecteur du flux par message
+    t0 = time.perf_counter()
+    for i in range(count):
+        recorder.record(CHANNEL_STREAM, lines[i % 1000], base + i * 1e-4)
+    produced = time.perf_counter() - t0
+    while recorder.stats()["pending"]:
+        time.sleep(0.01)
+    drained = time.perf_counter() - t0
+    recorder.close()
+    stats = recorder.stats()
+
+    reader = RecordReader(directory)
+    t0 = time.perf_counter()
+    replayed = sum(1 for _ in reader.replay())
+    replay = time.perf_counter() - t0
+
+    # Recherche : premier message d'une fenêtre de 1 s au milieu de l'enregistrement
+    middle = base + count * 1e-4 / 2
+    seeks = []
+    for _ in range(ctx.repeat(20)):
+        t0 = time.perf_counter()
+        next(reader.replay(start=middle, end=middle + 1.0))
+        seeks.append(time.perf_counter() - t0)
+    shutil.rmtree(directory, ignore_errors=True)
+
+    return [
+        rate_result("recorder.record", count, produced, unit="msgs/s"),
+        rate_result("recorder.sustained", stats["recorded"], drained, unit="msgs/s", dropped=stats["dropped"],
+                    compression_ratio=stats["compression_ratio"], segments=recorder.segments),
+        rate_result("recorder.replay", replayed, replay, unit="msgs/s", expected=count),
+        latency_result("recorder.seek", seeks),
+    ]
+
+
+def run(ctx):
+    return tick_storm(ctx) + end_to_end(ctx) + reconnect_recovery(ctx) + recorder_results(ctx)
@@ -0,0 +1,88 @@
+"""Outils communs des benchmarks : mesures, résumés et enregistrements de résultats."""
+import contextlib
+import logging
+import os
+import statistics
+import time
+import warnings
+
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    k = (len(ordered) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def summarize(samples):
+    """Résumé de latence en millisecondes, à partir d'échantillons en secondes"""
+    ms = [s * 1000.0 for s in samples]
+    return {
+        "count": len(ms),
+        "mean": statistics.fmean(ms) if ms else None,
+        "min": min(ms) if ms else None,
+        "p50": percentile(ms, 50),
+        "p90": percentile(ms, 90),
+        "p99": percentile(ms, 99),
+        "max": max(ms) if ms else None,
+    }
+
+
+def latency_result(name, samples, **extra):
+    """Mesure de latence ; une hausse de ``p50`` est une régression"""
+    result = {"name": name, "kind": "latency", "unit": "ms", "key": "p50", "higher_is_better": False}
+    result.update(summarize(samples))
+    result.update(extra)
+    return result
+
+
+def rate_result(name, count, seconds, unit="ops/s", **extra):
+    """Mesure de débit ; une baisse de ``value`` est une régression"""
+    result = {"name": name, "kind": "rate", "unit": unit, "key": "value", "higher_is_better": True,
+              "value": count / seconds if seconds > 0 else None, "count": count, "seconds": seconds}
+    result.update(extra)
+    return result
+
+
+def value_result(name, value, unit, higher_is_better=False, **extra):
+    result = {"name": name, "kind": "value", "unit": unit, "key": "value",
+              "higher_is_better": higher_is_better, "value": value}
+    result.update(extra)
+    return result
+
+
+def measure(fn, repeat, warmup=1):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+@contextlib.contextmanager
+def patched_env(values):
+    saved = {k: os.environ.get(k) for k in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+def quiet_logging(level=logging.WARNING):
+    """Le bot journalise des JSON complets en INFO/DEBUG : hors des mesures"""
+    warnings.simplefilter('ignore', FutureWarning)
+    root = logging.getLogger()
+    root.setLevel(level)
+    for name in ('trading_bot', 'XTB_API'):
+        logging.getLogger(name).setLevel(level)
@@ -0,0 +1,366 @@
+"""Faux broker XTB dans le processus, qui parle le protocole JSON xAPI en TCP simple.
+
+Le bot s'y connecte avec l'environnement renvoyé par ``FakeBroker.env()``
+(XTB_SERVER / XTB_PORT / XTB_STREAM_PORT / XTB_SSL=0).
+"""
+import json
+import math
+import random
+import socket
+import socketserver
+import threading
+import time
+
+PERIOD_MS = 60 * 1000
+DIGITS = 5
+
+
+def encode_rate_info(ctm, open_, high, low, close, vol=100.0):
+    """Bougie getChart* telle que xAPI l'envoie : open en points (prix * 10**digits),
+    close/high/low en écarts à open dans la même unité"""
+    points = round(open_ * 10 ** DIGITS)
+    return {
+        "ctm": ctm,
+        "ctmString": time.strftime('%b %d, %Y, %I:%M:%S %p', time.gmtime(ctm / 1000)),
+        "open": float(points),
+        "close": float(round(close * 10 ** DIGITS) - points),
+        "high": float(round(high * 10 ** DIGITS) - points),
+        "low": float(round(low * 10 ** DIGITS) - points),
+        "vol": vol,
+    }
+
+
+class PriceModel(object):
+    """Trajectoire de prix déterministe : un prix ne dépend que de (symbole, instant)"""
+
+    def __init__(self, seed=42, base=1.08, amplitude=0.01, noise=0.0004, flat=False):
+        self.seed = seed
+        self.base = base
+        self.amplitude = amplitude
+        self.noise = noise
+        self.flat = flat
+        self._candles = {}
+
+    def price(self, symbol, ts_ms, period=1):
+        if self.flat:
+            return self.base
+        idx = ts_ms // (period * PERIOD_MS)
+        rnd = random.Random('%s:%s:%s:%s' % (self.seed, symbol, period, idx))
+        return self.base + self.amplitude * math.sin(idx / 40.0) + rnd.uniform(-self.noise, self.noise)
+
+    def candle(self, symbol, ctm, period):
+        """Prix (open, high, low, close) d'une bougie"""
+        key = (symbol, ctm, period)
+        cached = self._candles.get(key)
+        if cached is None:
+            cached = self._candles[key] = self._build_candle(symbol, ctm, period)
+        return cached
+
+    def _build_candle(self, symbol, ctm, period):
+        o = self.price(symbol, ctm, period)
+        c = self.price(symbol, ctm + period * PERIOD_MS - 1, period) if not self.flat else o
+        spread = 0 if self.flat else self.noise / 2
+        return tuple(round(p, DIGITS) for p in (o, max(o, c) + spread, min(o, c) - spread, c))
+
+    def rate_info(self, symbol, ctm, period):
+        return encode_rate_info(ctm, *self.candle(symbol, ctm, period))
+
+
+class _CommandHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        broker = self.server.broker
+        broker.connections += 1
+        try:
+            for line in self.rfile:
+                line = line.strip()
+                if not line:
+                    continue
+                response = broker.dispatch(json.loads(line))
+                if broker.latency:
+                    time.sleep(broker.latency)
+                self.wfile.write(json.dumps(response).encode('utf-8') + b'\n\n')
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            broker.connections -= 1
+
+
+class _StreamHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        broker = self.server.broker
+        send_lock = threading.Lock()
+        stop = threading.Event()
+        broker.stream_sockets.add(self.request)
+
+        def send(message):
+            with send_lock:
+                self.wfile.write(json.dumps(message).encode('utf-8') + b'\n')
+
+        try:
+            for line in self.rfile:
+                line = line.strip()
+                if not line:
+                    continue
+                cmd = json.loads(line)
+                pusher = broker.stream_pusher(cmd, send, stop)
+                if pusher:
+                    threading.Thread(target=pusher, daemon=True).start()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            stop.set()
+            broker.stream_sockets.discard(self.request)
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeBroker(object):
+    """Serveurs de commandes et de streaming sur 127.0.0.1, alimentés par un ``PriceModel``.
+
+    ``hold_positions`` garde les ordres ouverts dans ``getTrades`` ; sinon
+    chaque ordre est clôturé aussitôt, pour que chaque cycle suive tout le chemin.
+    """
+
+    def __init__(self, prices=None, latency=0.0, hold_positions=False,
+                 tick_interval=0.01, max_stream_messages=None):
+        self.prices = prices or PriceModel()
+        self.latency = latency
+        self.hold_positions = hold_positions
+        self.tick_interval = tick_interval
+        self.max_stream_messages = max_stream_messages
+        self.open_trades = []
+        self.closed_trades = []
+        self.next_order = 1000
+        self.commands = {}
+        self.connections = 0
+        self.stream_session_id = 'fake-stream-session'
+        self.stream_sockets = set()
+        self.trade_listeners = set()
+        self._lock = threading.Lock()
+        self._servers = []
+
+    # -- cycle de vie ------------------------------------------------------
+    def start(self):
+        self.command_server = self._serve(_CommandHandler)
+        self.stream_server = self._serve(_StreamHandler)
+        return self
+
+    def _serve(self, handler):
+        server = _Server(('127.0.0.1', 0), handler)
+        server.broker = self
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self._servers.append(server)
+        return server
+
+    def stop(self):
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        self._servers = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def port(self):
+        return self.command_server.server_address[1]
+
+    @property
+    def stream_port(self):
+        return self.stream_server.server_address[1]
+
+    def env(self):
+        return {
+            'XTB_SERVER': '127.0.0.1',
+            'XTB_PORT': str(self.port),
+            'XTB_STREAM_PORT': str(self.stream_port),
+            'XTB_SSL': '0',
+            'XTB_USER_ID': 'bench',
+            'XTB_PASSWORD': 'bench',
+        }
+
+    def now_ms(self):
+        return int(time.time() * 1000)
+
+    # -- protocole des commandes -------------------------------------------
+    def dispatch(self, cmd):
+        name = cmd.get('command')
+        args = cmd.get('arguments') or {}
+        with self._lock:
+            self.commands[name] = self.commands.get(name, 0) + 1
+        handler = getattr(self, 'cmd_' + name, None)
+        if handler is None:
+            return {"status": False, "errorCode": "EX000", "errorDescr": "Commande inconnue %s" % name}
+        return {"status": True, "returnData": handler(args)}
+
+    def cmd_login(self, args):
+        return None
+
+    def cmd_logout(self, args):
+        return None
+
+    def cmd_ping(self, args):
+        return None
+
+    def cmd_getServerTime(self, args):
+        now = self.now_ms()
+        return {"time": now, "timeString": time.ctime(now / 1000)}
+
+    def cmd_getMarginLevel(self, args):
+        return {"balance": 10000.0, "credit": 0.0, "currency": "EUR", "equity": 10000.0,
+                "margin": 0.0, "margin_free": 10000.0, "margin_level": 0.0}
+
+    def cmd_getSymbol(self, args):
+        symbol = args.get('symbol', 'EURUSD')
+        price = self.prices.price(symbol, self.now_ms())
+        return {"symbol": symbol, "ask": round(price + 0.00007, 5), "bid": round(price, 5),
+                "lotMin": 0.01, "lotMax": 100.0, "lotStep": 0.01, "contractSize": 100000,
+                "leverage": 3.33, "precision": 5, "tickSize": 0.00001,
+                # Un tick en USD par lot, dans la devise du compte (EUR)
+                "tickValue": round(100000 * 0.00001 / price, 5),
+                "currency": "EUR", "currencyProfit": "USD", "time": self.now_ms()}
+
+    def cmd_getChartRangeRequest(self, args):
+        info = args.get('info', {})
+        return self.chart(info.get('symbol', 'EURUSD'), int(info.get('period', 1)),
+                          int(info['start']), int(info.get('end') or self.now_ms()))
+
+    def cmd_getChartLastRequest(self, args):
+        info = args.get('info', {})
+        return self.chart(info.get('symbol', 'EURUSD'), int(info.get('period', 1)),
+                          int(info['start']), self.now_ms())
+
+    def chart(self, symbol, period, start, end):
+        step = period * PERIOD_MS
+        first = (start // step) * step
+        # Uniquement les bougies closes, comme le vrai serveur
+        last = (end // step) * step
+        candles = [self.prices.rate_info(symbol, ctm, period) for ctm in range(first, last, step)]
+        return {"digits": DIGITS, "rateInfos": candles}
+
+    def cmd_getTrades(self, args):
+        with self._lock:
+            return list(self.open_trades)
+
+    def cmd_getTradesHistory(self, args):
+        with self._lock:
+            return list(self.closed_trades)
+
+    def cmd_tradeTransaction(self, args):
+        info = args.get('tradeTransInfo', {})
+        with self._lock:
+            self.next_order += 1
+            trade = {"order": self.next_order, "order2": self.next_order, "position": self.next_order,
+                     "symbol": info.get('symbol'), "cmd": info.get('cmd'), "volume": info.get('volume'),
+                     "open_price": info.get('price'), "sl": info.get('sl'), "tp": info.get('tp'),
+                     "customComment": info.get('customComment'),
+                     "open_time": self.now_ms(), "closed": False, "profit": 0.0}
+            if self.hold_positions:
+                self.open_trades.append(trade)
+            else:
+                trade.update(closed=True, close_time=self.now_ms(), close_price=info.get('price'))
+                self.closed_trades.append(trade)
+        for send in list(self.trade_listeners):
+            try:
+                send({"command": "trade", "data": dict(trade, type=0, state="Modified")})
+            except OSError:
+                pass
+        return {"order": trade["order"]}
+
+    def cmd_tradeTransactionStatus(self, args):
+        return {"order": args.get('order'), "requestStatus": 3, "message": None}
+
+    def drop_streams(self):
+        """Coupe toutes les connexions de streaming, comme une micro-coupure réseau"""
+        for sock in list(self.stream_sockets):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def close_all(self):
+        with self._lock:
+            for trade in self.open_trades:
+                trade.update(closed=True, close_time=self.now_ms())
+                self.closed_trades.append(trade)
+            self.open_trades = []
+
+    # -- protocole du streaming --------------------------------------------
+    def stream_pusher(self, cmd, send, stop):
+        name = cmd.get('command')
+        symbol = cmd.get('symbol', 'EURUSD')
+        if name == 'getTickPrices':
+            return lambda: self._push_ticks(symbol, send, stop)
+        if name == 'getCandles':
+            return lambda: self._push_candles(symbol, send, stop)
+        if name == 'getTrades':
+            return lambda: self._listen(self.trade_listeners, send, stop)
+        if name == 'getKeepAlive':
+            return lambda: self._push_every(3.0, lambda: {"command": "keepAlive", "data": {"timestamp": self.now_ms()}}, send, stop)
+        if name == 'getBalance':
+            return lambda: self._push_every(1.0, self._balance_message, send, stop)
+        return None
+
+    def _balance_message(self):
+        data = self.cmd_getMarginLevel({})
+        return {"command": "balance", "data": {"balance": data["balance"], "credit": data["credit"],
+                                               "equity": data["equity"], "margin": data["margin"],
+                                               "marginFree": data["margin_free"], "marginLevel": data["margin_level"]}}
+
+    def _push_ticks(self, symbol, send, stop):
+        sent = 0
+        while not stop.is_set():
+            if self.max_stream_messages is not None and sent >= self.max_stream_messages:
+                return
+            now = self.now_ms()
+            bid = round(self.prices.price(symbol, now), 5)
+            try:
+                send({"command": "tickPrices", "data": {
+                    "symbol": symbol, "ask": round(bid + 0.00007, 5), "bid": bid, "askVolume": 1000,
+                    "bidVolume": 1000, "high": bid, "low": bid, "level": 0, "quoteId": 0,
+                    "spreadRaw": 0.00007, "spreadTable": 0.7, "timestamp": now}})
+            except OSError:
+                return
+            sent += 1
+            if self.tick_interval:
+                stop.wait(self.tick_interval)
+
+    def _push_candles(self, symbol, send, stop):
+        # La dernière bougie M1 close tout de suite, puis une à chaque clôture
+        ctm = (self.now_ms() // PERIOD_MS - 1) * PERIOD_MS
+        while True:
+            open_, high, low, close = self.prices.candle(symbol, ctm, 1)
+            try:
+                # Les bougies du streaming sont en prix, pas en points
+                send({"command": "candle", "data": {
+                    "symbol": symbol, "ctm": ctm, "open": open_, "high": high, "low": low, "close": close,
+                    "vol": 100.0, "quoteId": 1}})
+            except OSError:
+                return
+            ctm += PERIOD_MS
+            if stop.wait(max(0.0, (ctm + PERIOD_MS - self.now_ms()) / 1000.0)):
+                return
+
+    def _listen(self, listeners, send, stop):
+        listeners.add(send)
+        stop.wait()
+        listeners.discard(send)
+
+    def _push_every(self, interval, build, send, stop):
+        while not stop.wait(interval):
+            try:
+                send(build())
+            except OSError:
+                return
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
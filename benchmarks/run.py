@@ -0,0 +1,143 @@
+"""Lance les benchmarks contre un faux broker dans le même processus.
+
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --baseline bench.json --threshold 0.2
+
+Les résultats sont écrits en JSON pour comparer les exécutions dans le
+temps ; avec ``--baseline``, chaque mesure qui a dépassé le seuil dans le
+mauvais sens est signalée et le code de sortie vaut 1.
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+from benchmarks.common import quiet_logging
+from benchmarks.fake_broker import FakeBroker
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SUITES = ["bench_strategy", "bench_client", "bench_stream", "bench_http", "bench_startup"]
+
+
+class Context(object):
+    def __init__(self, broker, quick=False, concurrency=8):
+        self.broker = broker
+        self.quick = quick
+        self.concurrency = concurrency
+
+    def repeat(self, n):
+        return max(1, n // 10) if self.quick else n
+
+    def sizes(self, sizes):
+        return sizes[:2] if self.quick else sizes
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Mesures qui ont régressé de plus de ``threshold`` (un ratio)"""
+    previous = {r["name"]: r for r in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        old = previous.get(result["name"])
+        if not old:
+            continue
+        key = result["key"]
+        new_value, old_value = result.get(key), old.get(key)
+        if not new_value or not old_value:
+            continue
+        change = (new_value - old_value) / old_value
+        worse = -change if result["higher_is_better"] else change
+        if worse > threshold:
+            regressions.append({"name": result["name"], "key": key, "baseline": old_value,
+                                "current": new_value, "change": change})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', action='append', choices=SUITES, help="suite(s) à lancer (défaut : toutes)")
+    parser.add_argument('--quick', action='store_true', help="moins de répétitions, tailles réduites")
+    parser.add_argument('--concurrency', type=int, default=8, help="threads clients HTTP")
+    parser.add_argument('--output', help="fichier JSON des résultats")
+    parser.add_argument('--baseline', help="résultats JSON précédents à comparer")
+    parser.add_argument('--threshold', type=float, default=0.2, help="ratio de régression (défaut 0.2 = 20%%)")
+    parser.add_argument('--verbose', action='store_true', help="garde les logs INFO du bot")
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+
+    # bot_cloud écrit trading.log dans le répertoire courant
+    workdir = tempfile.mkdtemp(prefix='xtb-bench-')
+    sys.path.insert(0, REPO)
+    os.chdir(workdir)
+
+    # Import avant de réduire les logs : xapi.client appelle logging.basicConfig(level=INFO)
+    import xapi.client  # noqa: F401
+    import xapi.streaming  # noqa: F401
+
+    broker = FakeBroker().start()
+    os.environ.update(broker.env())
+    ctx = Context(broker, quick=args.quick, concurrency=args.concurrency)
+
+    results, failures = [], {}
+    for name in args.only or SUITES:
+        module = importlib.import_module('benchmarks.' + name)
+        if not args.verbose:
+            quiet_logging()
+        print("== %s" % name, file=sys.stderr)
+        try:
+            for result in module.run(ctx):
+                results.append(result)
+                key = result["key"]
+                print("  %-48s %12.3f %s" % (result["name"], result.get(key) or 0.0, result["unit"]), file=sys.stderr)
+        except Exception:
+            failures[name] = traceback.format_exc()
+            print(failures[name], file=sys.stderr)
+    broker.stop()
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "quick": args.quick,
+        },
+        "results": results,
+        "failures": failures,
+    }
+
+    status = 1 if failures else 0
+    if baseline:
+        with open(baseline) as f:
+            report["regressions"] = compare(results, json.load(f), args.threshold)
+        for r in report["regressions"]:
+            print("REGRESSION %s %s: %.4g -> %.4g (%+.1f%%)" % (r["name"], r["key"], r["baseline"], r["current"],
+                                                               r["change"] * 100), file=sys.stderr)
+        if report["regressions"]:
+            status = 1
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,464 @@
+"""Test d'endurance : toute l'application start.py et sa boucle de trading, en temps accéléré, contre le faux broker.
+
+    python -m benchmarks.soak --days 3 --speed 360 --output soak.json
+    python -m benchmarks.soak --quick
+
+Les modules de l'application voient une horloge simulée qui va ``speed``
+fois plus vite que l'horloge réelle (``time.time``/``time.sleep``) : les
+clôtures de bougies, les contrôles de connexion, le changement de jour du
+journal et les bougies du broker avancent comme sur des jours de
+fonctionnement. Des clients HTTP interrogent l'application pendant tout le
+test et le broker coupe les connexions de streaming à intervalle simulé fixe.
+
+RSS, descripteurs de fichiers, sockets, threads, état du GC, taille des
+logs et latences des cycles et de l'HTTP sont échantillonnés régulièrement.
+Après la mise en route, la première et la dernière fenêtre sont comparées ;
+le code de sortie vaut 1 si l'une des mesures a dépassé sa borne.
+"""
+import argparse
+import array
+import gc
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import urllib.error
+import urllib.request
+import warnings
+
+from benchmarks.common import patched_env, percentile
+from benchmarks.fake_broker import FakeBroker
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Modules dont ``time`` est remplacé par l'horloge simulée
+SIM_MODULES = ["start", "bot_cloud", "bar_scheduler", "account", "journal", "xapi.clock", "xapi.client",
+               "xapi.streaming", "benchmarks.fake_broker"]
+HTTP_ENDPOINTS = ["/status", "/metrics", "/snapshot", "/analytics/summary", "/ready"]
+# Budget de production du scheduler de commandes xAPI, mis à l'échelle de l'horloge
+COMMAND_RATE = 5.0
+
+DEFAULT_BOUNDS = {
+    "rss_mb": 48.0,             # MiB sur l'exécution
+    "fds": 16,
+    "sockets": 8,
+    "threads": 8,
+    "gc_objects": 0.25,         # ratio
+    "cycle_p99_ms": 2.0,        # ratio
+    "http_p99_ms": 3.0,         # ratio
+    "log_mb_per_day": 256.0,    # MiB par jour simulé
+    "http_error_rate": 0.01,
+}
+# Les ratios de latence se calculent sur au moins ce nombre de ms : le bruit sous la ms ne fait pas échouer
+LATENCY_FLOOR_MS = 20.0
+
+
+class SimulatedTime(object):
+    """Remplaçant du module ``time`` : ``time()`` et ``sleep()`` vont ``speed`` fois plus vite.
+
+    Tout le reste (monotonic, perf_counter, strftime...) est le vrai module :
+    les durées mesurées avec restent en temps réel.
+    """
+
+    def __init__(self, speed):
+        self.speed = float(speed)
+        self.real_start = time.time()
+
+    def time(self):
+        return self.real_start + (time.time() - self.real_start) * self.speed
+
+    def sleep(self, seconds):
+        time.sleep(seconds / self.speed)
+
+    def sim_seconds(self):
+        return self.time() - self.real_start
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+class ScaledEvent(threading.Event):
+    """Délais de ``Event.wait`` donnés en secondes simulées (BarCloseScheduler en attend un)"""
+
+    def __init__(self, speed):
+        super().__init__()
+        self.speed = float(speed)
+
+    def wait(self, timeout=None):
+        return super().wait(None if timeout is None else timeout / self.speed)
+
+
+def install(sim):
+    saved = {}
+    for name in SIM_MODULES:
+        module = sys.modules.get(name)
+        if module is not None and module.__dict__.get('time') is time:
+            saved[name] = module
+            module.time = sim
+    return saved
+
+
+def uninstall(saved):
+    for module in saved.values():
+        module.time = time
+
+
+# -- échantillonnage -------------------------------------------------------------
+
+def proc_status():
+    status = {}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                status[key] = value.strip()
+    except OSError:
+        pass
+    return status
+
+
+def fd_counts():
+    """(descripteurs ouverts, dont sockets, nombre par type) -- type : socket, pipe ou extension de fichier"""
+    try:
+        names = os.listdir('/proc/self/fd')
+    except OSError:
+        return None, None, {}
+    kinds = {}
+    for name in names:
+        try:
+            target = os.readlink('/proc/self/fd/' + name)
+        except OSError:
+            continue
+        if ':' in target and not target.startswith('/'):
+            kind = target.split(':', 1)[0]
+        else:
+            kind = os.path.splitext(target)[1] or os.path.basename(target)
+        kinds[kind] = kinds.get(kind, 0) + 1
+    return len(names), kinds.get('socket', 0), kinds
+
+
+class GCMonitor(object):
+    """Pauses de collecte, via ``gc.callbacks``"""
+
+    def __init__(self):
+        self.pauses = array.array('d')
+        self._started = None
+
+    def __call__(self, phase, info):
+        if phase == 'start':
+            self._started = time.perf_counter()
+        elif self._started is not None:
+            self.pauses.append(time.perf_counter() - self._started)
+            self._started = None
+
+    def start(self):
+        gc.callbacks.append(self)
+        return self
+
+    def stop(self):
+        if self in gc.callbacks:
+            gc.callbacks.remove(self)
+
+
+class Timings(object):
+    """Couples (instant réel, durée) dans des tableaux compacts, lus par fenêtre"""
+
+    def __init__(self):
+        self.at = array.array('d')
+        self.seconds = array.array('d')
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def add(self, seconds, ok=True):
+        with self._lock:
+            self.at.append(time.time())
+            self.seconds.append(seconds)
+            self.errors += not ok
+
+    def window_ms(self, start, end):
+        with self._lock:
+            return [s * 1000.0 for t, s in zip(self.at, self.seconds) if start <= t < end]
+
+
+def time_cycles(timings):
+    """Enveloppe XTBTradingBot.run_strategy pour mesurer la durée réelle de chaque cycle"""
+    from bot_cloud import XTBTradingBot
+    original = XTBTradingBot.run_strategy
+
+    def run_strategy(self):
+        t0 = time.perf_counter()
+        try:
+            result = original(self)
+        except Exception:
+            timings.add(time.perf_counter() - t0, ok=False)
+            raise
+        timings.add(time.perf_counter() - t0, ok=bool(result))
+        return result
+    XTBTradingBot.run_strategy = run_strategy
+    return lambda: setattr(XTBTradingBot, 'run_strategy', original)
+
+
+def http_load(base, timings, stop, interval):
+    i = 0
+    while not stop.is_set():
+        url = base + HTTP_ENDPOINTS[i % len(HTTP_ENDPOINTS)]
+        i += 1
+        t0 = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url, timeout=10) as response:
+                response.read()
+                ok = response.status == 200
+        except urllib.error.HTTPError as e:
+            e.read()
+            ok = False
+        except OSError:
+            ok = False
+        timings.add(time.perf_counter() - t0, ok)
+        stop.wait(interval)
+
+
+def log_bytes(workdir):
+    total = 0
+    for name in os.listdir(workdir):
+        if name.endswith('.log'):
+            try:
+                total += os.path.getsize(os.path.join(workdir, name))
+            except OSError:
+                pass
+    return total
+
+
+def sample(sim, workdir, cycles, http, gc_monitor):
+    status = proc_status()
+    fds, sockets, kinds = fd_counts()
+    return {
+        "at": time.time(),
+        "sim_hours": round(sim.sim_seconds() / 3600.0, 3),
+        "rss_mb": round(int(status.get('VmRSS', '0 kB').split()[0]) / 1024.0, 2),
+        "fds": fds,
+        "sockets": sockets,
+        "fd_kinds": kinds,
+        "threads": threading.active_count(),
+        "gc_objects": len(gc.get_objects()),
+        "gc_collections": [s["collections"] for s in gc.get_stats()],
+        "gc_garbage": len(gc.garbage),
+        "gc_pauses": len(gc_monitor.pauses),
+        "log_mb": round(log_bytes(workdir) / 1048576.0, 3),
+        "cycles": len(cycles.at),
+        "cycle_errors": cycles.errors,
+        "http_requests": len(http.at),
+        "http_errors": http.errors,
+    }
+
+
+# -- verdict -------------------------------------------------------------------
+
+def median(values):
+    return percentile(values, 50)
+
+
+def evaluate(samples, cycles, http, bounds, warmup, sim_days):
+    """Compare la première fenêtre après la mise en route à la dernière ; un contrôle par borne"""
+    begin = max(1, int(len(samples) * warmup))
+    steady = samples[begin:]
+    if len(steady) < 6:
+        raise RuntimeError("trop peu d'échantillons après la mise en route (%d) : allonger le test" % len(steady))
+    size = max(3, len(steady) // 10)
+    first, last = steady[:size], steady[-size:]
+    # Les fenêtres de latence vont de l'échantillon précédant chaque fenêtre à son dernier échantillon
+    first_span = (samples[begin - 1]["at"], first[-1]["at"])
+    last_span = (samples[-size - 1]["at"], last[-1]["at"])
+    checks = []
+
+    def check(name, before, after, growth, bound):
+        checks.append({"name": name, "first": before, "last": after, "growth": growth, "bound": bound,
+                       "ok": growth is not None and growth <= bound})
+
+    for key in ("rss_mb", "fds", "sockets", "threads"):
+        before = median([s[key] for s in first if s[key] is not None])
+        after = median([s[key] for s in last if s[key] is not None])
+        check(key, before, after, None if before is None or after is None else after - before, bounds[key])
+
+    # Quel type de descripteur s'accumule (socket, pipe, .db-wal...), pour localiser la fuite
+    kinds = set(first[-1]["fd_kinds"]) | set(last[-1]["fd_kinds"])
+    checks[1]["by_kind"] = {kind: last[-1]["fd_kinds"].get(kind, 0) - first[-1]["fd_kinds"].get(kind, 0)
+                            for kind in sorted(kinds)
+                            if last[-1]["fd_kinds"].get(kind, 0) != first[-1]["fd_kinds"].get(kind, 0)}
+
+    before, after = median([s["gc_objects"] for s in first]), median([s["gc_objects"] for s in last])
+    check("gc_objects", before, after, (after - before) / before if before else None, bounds["gc_objects"])
+
+    for name, timings in (("cycle_p99_ms", cycles), ("http_p99_ms", http)):
+        before = percentile(timings.window_ms(*first_span), 99)
+        after = percentile(timings.window_ms(*last_span), 99)
+        growth = after / max(before, LATENCY_FLOOR_MS) if before is not None and after is not None else None
+        check(name, before, after, growth, bounds[name])
+
+    log_rate = (samples[-1]["log_mb"] - steady[0]["log_mb"]) / max(sim_days * (1 - warmup), 1e-9)
+    check("log_mb_per_day", steady[0]["log_mb"], samples[-1]["log_mb"], log_rate, bounds["log_mb_per_day"])
+
+    requests = samples[-1]["http_requests"]
+    check("http_error_rate", 0, samples[-1]["http_errors"],
+          samples[-1]["http_errors"] / requests if requests else None, bounds["http_error_rate"])
+    return checks
+
+
+def summary(samples, cycles, http, gc_monitor):
+    cycle_ms = [s * 1000.0 for s in cycles.seconds]
+    http_ms = [s * 1000.0 for s in http.seconds]
+    pauses = [s * 1000.0 for s in gc_monitor.pauses]
+    first, last = samples[0], samples[-1]
+
+    def pct(values):
+        return {"p50": percentile(values, 50), "p90": percentile(values, 90), "p99": percentile(values, 99),
+                "max": max(values) if values else None}
+    return {
+        "sim_hours": last["sim_hours"],
+        "cycles": len(cycle_ms),
+        "cycle_errors": cycles.errors,
+        "cycle_ms": pct(cycle_ms),
+        "http_requests": len(http_ms),
+        "http_errors": http.errors,
+        "http_ms": pct(http_ms),
+        "gc_pause_ms": pct(pauses),
+        "gc_collections": [b - a for a, b in zip(first["gc_collections"], last["gc_collections"])],
+        "gc_garbage": last["gc_garbage"],
+    }
+
+
+# -- exécution -----------------------------------------------------------------
+
+def soak(args, workdir):
+    import start
+    from rate_limiter import GCRALimiter
+    from benchmarks.bench_http import serve
+
+    # Mesure de l'application, pas des budgets de requêtes par client
+    start.rate_limiters = {budget: GCRALimiter(10 ** 9, 60) for budget in start.RATE_LIMITS}
+    start.start_worker()
+    deadline = time.time() + 60
+    while not start.startup_state["ready"]:
+        if start.startup_state["error"] or time.time() > deadline:
+            raise RuntimeError("échec du démarrage : %s" % start.startup_state["error"])
+        time.sleep(0.05)
+
+    sim = SimulatedTime(args.speed)
+    saved = install(sim)
+    start.bar_scheduler._stop = ScaledEvent(args.speed)
+    cycles, http = Timings(), Timings()
+    restore_cycles = time_cycles(cycles)
+    gc_monitor = GCMonitor().start()
+    server = serve(start.app)
+    stop = threading.Event()
+    clients = [threading.Thread(target=http_load, args=("http://127.0.0.1:%d" % server.server_port, http, stop,
+                                                        args.http_interval), daemon=True)
+               for _ in range(args.clients)]
+    for client in clients:
+        client.start()
+    start.start_trading()
+
+    samples = []
+    sim_end = args.days * 86400.0
+    next_drop = args.drop_every_hours * 3600.0 if args.drop_every_hours else None
+    try:
+        while sim.sim_seconds() < sim_end:
+            time.sleep(args.sample_interval)
+            if next_drop is not None and sim.sim_seconds() >= next_drop:
+                args.broker.drop_streams()
+                next_drop += args.drop_every_hours * 3600.0
+            samples.append(sample(sim, workdir, cycles, http, gc_monitor))
+            s = samples[-1]
+            print("  %7.2fh  rss %7.1f MiB  fds %4d  sockets %3d  threads %3d  gc %8d  cycles %6d  http %7d"
+                  % (s["sim_hours"], s["rss_mb"], s["fds"] or 0, s["sockets"] or 0, s["threads"], s["gc_objects"],
+                     s["cycles"], s["http_requests"]), file=sys.stderr)
+    finally:
+        stop.set()
+        start.bar_scheduler.stop()
+        for client in clients:
+            client.join(timeout=15)
+        server.shutdown()
+        gc_monitor.stop()
+        restore_cycles()
+        with start.bot_lock:
+            if start.bot:
+                start.bot.disconnect()
+        uninstall(saved)
+
+    if not samples[-1]["cycles"]:
+        raise RuntimeError("la boucle de trading n'a exécuté aucun cycle de stratégie")
+    checks = evaluate(samples, cycles, http, args.bounds, args.warmup, args.days)
+    return {"summary": summary(samples, cycles, http, gc_monitor), "checks": checks, "samples": samples}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=float, default=3.0, help="durée simulée en jours (défaut 3)")
+    parser.add_argument('--speed', type=float, default=360.0, help="secondes simulées par seconde réelle (défaut 360)")
+    parser.add_argument('--quick', action='store_true', help="6 heures simulées")
+    parser.add_argument('--sample-interval', type=float, default=2.0, help="secondes réelles entre deux échantillons")
+    parser.add_argument('--warmup', type=float, default=0.2, help="part des échantillons ignorée au début")
+    parser.add_argument('--clients', type=int, default=2, help="threads clients HTTP")
+    parser.add_argument('--http-interval', type=float, default=0.05, help="secondes réelles entre deux requêtes d'un client")
+    parser.add_argument('--drop-every-hours', type=float, default=6.0,
+                        help="coupe les connexions de streaming toutes les N heures simulées (0 : jamais)")
+    for key, value in DEFAULT_BOUNDS.items():
+        parser.add_argument('--max-' + key.replace('_', '-'), dest=key, type=float, default=value,
+                            help="borne de croissance de %s (défaut %s)" % (key, value))
+    parser.add_argument('--output', help="fichier JSON du rapport")
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.days = 0.25
+    args.bounds = {key: getattr(args, key) for key in DEFAULT_BOUNDS}
+    output = os.path.abspath(args.output) if args.output else None
+
+    # Avertissements pandas (affectation chaînée) de calculate_indicators, un par cycle
+    warnings.simplefilter('ignore', FutureWarning)
+    # bot_cloud écrit trading.log, le journal et la base d'analyse dans le répertoire courant
+    workdir = tempfile.mkdtemp(prefix='xtb-soak-')
+    sys.path.insert(0, REPO)
+    os.chdir(workdir)
+
+    broker = FakeBroker().start()
+    args.broker = broker
+    env = dict(broker.env(), LEADER_ELECTION='0', XTB_COMMAND_RATE=str(COMMAND_RATE * args.speed))
+    try:
+        with patched_env(env):
+            # Les logs console vont dans un fichier : leur volume fait partie des mesures
+            import start  # noqa: F401
+            console = open(os.path.join(workdir, 'console.log'), 'a')
+            import logging
+            for handler in logging.getLogger().handlers:
+                if isinstance(handler, logging.StreamHandler) and not isinstance(handler, logging.FileHandler):
+                    handler.setStream(console)
+            report = soak(args, workdir)
+    except Exception:
+        report = {"error": traceback.format_exc()}
+        print(report["error"], file=sys.stderr)
+    finally:
+        broker.stop()
+
+    report["meta"] = {"timestamp": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()), "days": args.days,
+                      "speed": args.speed, "bounds": args.bounds, "workdir": workdir}
+    status = 1
+    if "checks" in report:
+        for c in report["checks"]:
+            print("%-4s %-18s first %-12s last %-12s growth %-10s bound %s" % (
+                "ok" if c["ok"] else "FAIL", c["name"], _fmt(c["first"]), _fmt(c["last"]), _fmt(c["growth"]),
+                c["bound"]) + ("  %s" % c["by_kind"] if c.get("by_kind") else ""), file=sys.stderr)
+        status = 0 if all(c["ok"] for c in report["checks"]) else 1
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(dict(report, samples=len(report.get("samples", ()))), indent=2))
+    return status
+
+
+def _fmt(value):
+    return "-" if value is None else "%.4g" % value
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,13 @@
 from xapi.client import Client
 from xapi.streaming import Streaming
+from xapi.dispatcher import StreamDispatcher
+from xapi.chart_decoder import decode_prices
+from account import AccountState
+from snapshot import SnapshotError, read_snapshot, write_snapshot
+from bars import BarAggregator, DEFAULT_TIMEFRAMES, MINUTE_MS, period_minutes
+from journal import Journal, comment_request_id, new_request_id, order_comment
+from analytics import AnalyticsStore
 from dotenv import load_dotenv
-import pandas as pd
-import numpy as np
 import logging
 import time
 import json
@@ -21,17 +26,10 @@ logging.basicConfig(
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
 logger = logging.getLogger('trading_bot')
 
-try:
-   import google.cloud.logging
-   client = google.cloud.logging.Client()
-   client.setup_logging()
-except:
-   pass
-
 load_dotenv()
 
 class XTBTradingBot:
-   def __init__(self, symbol='EURUSD', timeframe='1h'):
+   def __init__(self, symbol='EURUSD', timeframe='1h', analytics=None):
        load_dotenv()
        self.userId = os.getenv('XTB_USER_ID') 
        self.password = os.getenv('XTB_PASSWORD') 
@@ -39,8 +37,12 @@ class XTBTradingBot:
            raise ValueError("XTB_USER_ID et XTB_PASSWORD doivent être définis dans .env")
        self.symbol = symbol
        self.timeframe = timeframe
+       self.period = period_minutes(timeframe)  # période xAPI en minutes ('1h' -> 60)
        self.client = None
        self.streaming = None
+       self.dispatcher = None
+       # Solde, marge et prix tenus à jour par le streaming (cf. start_streaming)
+       self.account = AccountState()
        self.active_positions = set()
        self.position_open = False
        self.current_order_id = None
@@ -48,6 +50,34 @@ class XTBTradingBot:
        self.reconnect_interval = 60
        self.min_volume = 0.001
        self.risk_percentage = 0.01
+       self.event_listeners = []  # callables (type, data) : indicateurs, signaux, ordres
+       # Journal durable des signaux, ordres et changements de position (cf. journal.py)
+       self.journal = Journal(os.getenv('JOURNAL_DIR', 'journal'))
+       self.event_listeners.append(self.journal.record)
+       # Historique interrogeable des trades clôturés, signaux et indicateurs (cf. analytics.py) ;
+       # `analytics` : magasin déjà ouvert par l'appelant, pour une seule instance par base
+       self.analytics = analytics if analytics is not None else AnalyticsStore(os.getenv('ANALYTICS_DB', 'analytics.db'))
+       self.event_listeners.append(self.analytics.record)
+       self.last_history_sync = None
+       # État repris d'un redémarrage à l'autre (cf. save_snapshot / load_snapshot)
+       self.history = None
+       self.last_bar = None
+       self.last_indicators = None
+       self.test_trade_done = False
+       self.restored = False
+       self.snapshot_path = os.getenv('SNAPSHOT_PATH', 'bot_state.snap')
+       self.snapshot_interval = 60
+       self.last_snapshot = 0
+       # Bougies de tous les timeframes construites à partir des ticks du streaming
+       self.bars = BarAggregator(symbol, timeframes=DEFAULT_TIMEFRAMES + (timeframe,))
+       self.bars.listeners.append(lambda tf, bar: self.emit_event("bar", bar))
+
+   def emit_event(self, event_type, data):
+       for listener in self.event_listeners:
+           try:
+               listener(event_type, data)
+           except Exception as e:
+               logger.error(f"Erreur dans un abonné aux événements: {str(e)}")
 
    def connect(self):
     try:
@@ -58,6 +88,7 @@ class XTBTradingBot:
         
         if response.get('status') == True:
             self.streaming = Streaming(self.client)
+            self.start_streaming()
             logging.info("✅ Connecté à XTB avec succès")
             return True
         else:
@@ -67,18 +98,105 @@ class XTBTradingBot:
         logging.error(f"❌ Erreur de connexion: {str(e)}")
         return False
 
+   def start_streaming(self):
+    """Abonnements balance / ticks / trades : plus de requête pour le compte ni les prix"""
+    try:
+        # État initial : le streaming n'envoie le solde qu'à chaque changement
+        margin = self.client.commandExecute("getMarginLevel")
+        if margin and margin.get('status'):
+            self.account.load_margin_level(margin['returnData'])
+        if self.symbol not in self.account.symbols:
+            self.get_symbol_info()
+
+        self.streaming.connect()
+        dispatcher = StreamDispatcher(self.streaming)
+        dispatcher.subscribe('balance', callback=self.account.on_balance)
+        dispatcher.subscribe('keepAlive', callback=self.account.on_keep_alive)
+        dispatcher.subscribe('tickPrices', self.symbol, callback=self.on_tick_message)
+        dispatcher.subscribe('candle', self.symbol, callback=self.on_candle_message)
+        dispatcher.subscribe('trade', callback=lambda message: self.emit_event("trade", message.get('data')))
+        self.streaming.subscribe_balance()
+        self.streaming.subscribe_ticks(self.symbol)
+        # Bougies M1 : repère du trou à combler après une coupure du flux (cf. Streaming._backfill)
+        self.streaming.subscribe_candles(self.symbol)
+        self.streaming.subscribe_trades()
+        self.streaming.subscribe_keep_alive()
+        # Avant la lecture des nouveaux ticks : sinon les bougies manquées arriveraient en retard
+        self.fill_bar_gap()
+        dispatcher.start()
+        self.dispatcher = dispatcher
+        # Flux tout juste ouvert : vivant jusqu'au premier keepAlive attendu
+        self.account.stream_seen_at = time.time()
+        return True
+    except Exception as e:
+        logger.warning(f"Streaming indisponible, repli sur les requêtes: {str(e)}")
+        return False
+
+   def fill_bar_gap(self):
+    """Bougies M1 du broker depuis la dernière de l'agrégateur, après une nouvelle session de streaming.
+
+    Le rattrapage de Streaming ne couvre que les coupures d'une même session ;
+    ici, le trou des ticks manqués entre deux sessions est comblé par le même
+    décodage (decode_prices) et le même chemin (add_candle).
+    """
+    current = self.bars.current.get('M1')
+    last = current[0] if current else self.bars.bars('M1').last_ctm
+    if last is None:
+        return 0
+    try:
+        end = int(time.time() * 1000)
+        response = self.client.commandExecute("getChartRangeRequest", {"info": {
+            "symbol": self.symbol, "period": 1, "start": int(last), "end": end}})
+        data = (response or {}).get('returnData') or {}
+        if not len(data.get('rateInfos') or ()):
+            return 0
+        columns = decode_prices(data['rateInfos'], data.get('digits', 5))
+        filled = 0
+        for ctm, o, h, l, c, v in zip(columns['ctm'].tolist(), columns['open'].tolist(), columns['high'].tolist(),
+                                      columns['low'].tolist(), columns['close'].tolist(), columns['vol'].tolist()):
+            # La bougie en cours à la coupure est complétée ; celle en cours maintenant viendra des ticks
+            if ctm >= last and ctm + MINUTE_MS <= end:
+                self.bars.add_candle(ctm, o, h, l, c, v)
+                filled += 1
+        if filled:
+            logger.info(f"Trou des bougies comblé: {filled} bougie(s) M1 depuis {last}")
+        return filled
+    except Exception as e:
+        logger.error(f"Erreur lors du comblement des bougies: {str(e)}")
+        return 0
+
+   def streaming_live(self):
+    """Vrai si l'état du compte streamé est utilisable : socket ouvert (pas en reconnexion)
+    et balance ou keepAlive récent ; sinon les appelants repassent par getMarginLevel"""
+    return (self.dispatcher is not None and self.dispatcher.running
+            and self.streaming is not None and self.streaming.sock is not None
+            and self.account.ready and self.account.stream_fresh())
+
+   def on_tick_message(self, message):
+    self.account.on_tick(message)
+    self.on_tick(message.get('data') or {})
+
+   def on_candle_message(self, message):
+    """Bougie M1 du streaming : en direct, les ticks ont déjà construit les bougies ;
+    celles rattrapées après une coupure (`backfill`) comblent le trou des ticks manqués"""
+    data = message.get('data') or {}
+    if message.get('backfill') and data.get('symbol') == self.symbol:
+        self.bars.add_candle(data['ctm'], data['open'], data['high'], data['low'], data['close'],
+                             data.get('vol') or 0.0)
+
    def check_connection(self):
     try:
         if self.client is None:
             logger.info("Client est None, connexion en cours...")
             return self.connect()
         
-        # Reconnexion plus agressive
+        # Reconnexion préventive seulement sans streaming actif : sinon elle referait toutes les
+        # 30 s socket de flux, abonnements, getMarginLevel et getSymbol. Le ping ci-dessous et la
+        # reconnexion propre au flux (avec rattrapage des bougies) suffisent.
         current_time = time.time()
-        if current_time - self.last_reconnect >= 30:  # Réduit de 60 à 30 secondes
+        if not self.streaming_live() and current_time - self.last_reconnect >= 30:
             logger.info("Reconnexion préventive en cours")
             self.disconnect()
-            time.sleep(2)  # Augmenté de 1 à 2 secondes
             success = self.connect()
             if success:
                 self.last_reconnect = current_time
@@ -90,19 +208,23 @@ class XTBTradingBot:
             if not response or not response.get('status'):
                 logger.warning("Échec du ping, reconnexion...")
                 self.disconnect()
-                time.sleep(2)
                 return self.connect()
         except Exception as e:
             logger.error(f"Erreur pendant le ping: {str(e)}")
+            # Sans disconnect, l'ancien dispatcher et le flux continueraient en parallèle du nouveau
+            self.disconnect()
             return self.connect()
             
         return True
     except Exception as e:
         logger.error(f"Erreur de vérification de connexion: {str(e)}")
+        self.disconnect()
         return self.connect()
 
    def disconnect(self):
     try:
+        if self.dispatcher:
+            self.dispatcher.stop()
         if self.streaming:
             self.streaming.disconnect()
         if self.client:
@@ -111,14 +233,18 @@ class XTBTradingBot:
         logger.error(f"Erreur lors de la déconnexion: {str(e)}")
     finally:
         self.streaming = None
+        self.dispatcher = None
         self.client = None
         
    def check_account_status(self):
+    if self.streaming_live():
+        return self.account.snapshot()
     try:
         cmd = {"command": "getMarginLevel"}
         response = self.client.commandExecute(cmd["command"])
         if response and 'returnData' in response:
             margin_data = response['returnData']
+            self.account.load_margin_level(margin_data)
             return margin_data
         return None
     except Exception as e:
@@ -131,53 +257,54 @@ class XTBTradingBot:
             return None
 
         end = int(time.time() * 1000)
-        start = end - (limit * 3600 * 1000)  # Convertir les heures en millisecondes
+        window_start = end - (limit * self.period * 60 * 1000)  # `limit` bougies du timeframe
+        start = window_start
+        # Historique déjà en mémoire (cycle précédent ou instantané restauré) : seul le delta est demandé
+        cached = self.history
+        if cached is not None and len(cached) > 0 and int(cached['ctm'].iloc[-1]) > window_start:
+            start = int(cached['ctm'].iloc[-1])
         
         command = {
             "command": "getChartRangeRequest",
             "arguments": {
                 "info": {
                     "symbol": self.symbol,
-                    "period": 1,
+                    "period": self.period,
                     "start": start,
                     "end": end
                 }
             }
         }
         
-        logger.info(f"Demande données historiques: {json.dumps(command, indent=2)}")
+        logger.info(f"Demande données historiques: {json.dumps(command)}")
         response = self.client.commandExecute(command["command"], command["arguments"])
-        logger.info(f"Réponse données historiques: {json.dumps(response, indent=2)}")
+        # Réponse brute : cf. l'enregistreur xAPI (XAPI_RECORD_DIR) plutôt que le log
+        logger.debug(f"Réponse données historiques: {len(((response or {}).get('returnData') or {}).get('rateInfos', []))} bougies")
         
         if isinstance(response, dict) and 'returnData' in response:
             data = response['returnData']
-            if 'rateInfos' in data and len(data['rateInfos']) > 0:
-                df = pd.DataFrame(data['rateInfos'])
+            if 'rateInfos' in data:
+                df = self._decode_rate_infos(data['rateInfos'], data.get('digits', 5)) if len(data['rateInfos']) > 0 else None
+                if start != window_start:
+                    df = self._merge_history(cached, df, window_start)
                 
-                # Convertir les données brutes en prix réels
-                for col in ['close', 'open', 'high', 'low']:
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
-                    # Conversion spécifique pour EURUSD
-                    if self.symbol == 'EURUSD':
-                        df[col] = (df[col] + 10000) / 100000  # Correction pour les valeurs négatives
-                    else:
-                        df[col] = df[col] / 10000
-                
-                # Conversion des timestamps
-                df['timestamp'] = pd.to_datetime(df['ctm'], unit='ms')
-                df = df.set_index('timestamp').sort_index()
-                
-                # Log des valeurs pour debugging
-                logger.info(f"""
+                if df is not None and len(df) > 0:
+                    self.history = df
+                    self.last_bar = int(df['ctm'].iloc[-1])
+                    self.seed_bars(df[df['ctm'] >= start], end)
+                    
+                    # Log des valeurs pour debugging
+                    logger.info(f"""
                 Données traitées:
                 - Premier prix: {df['close'].iloc[0]}
                 - Dernier prix: {df['close'].iloc[-1]}
                 - Min prix: {df['close'].min()}
                 - Max prix: {df['close'].max()}
                 - Nombre de périodes: {len(df)}
+                - Nouvelles bougies reçues: {len(data['rateInfos'])}
                 """)
-                
-                return df
+                    
+                    return df
                 
         logger.error("Pas de données historiques reçues")
         return None
@@ -186,8 +313,108 @@ class XTBTradingBot:
         logger.error(f"❌ Erreur dans get_historical_data: {str(e)}")
         return None
 
+   def _decode_rate_infos(self, rate_infos, digits):
+    import pandas as pd  # import différé : coûteux au démarrage à froid
+    # Prix réels, à l'échelle des ticks du streaming (xapi/chart_decoder.py)
+    df = pd.DataFrame(decode_prices(rate_infos, digits))
+    df['timestamp'] = pd.to_datetime(df['ctm'], unit='ms')
+    return df.set_index('timestamp').sort_index()
+
+   def seed_bars(self, df, now_ms):
+    """Aligne l'agrégateur sur les bougies du broker (elles font foi sur les ticks)"""
+    try:
+        self.bars.seed(self.timeframe, df['ctm'].tolist(), df['open'].tolist(), df['high'].tolist(),
+                       df['low'].tolist(), df['close'].tolist(),
+                       df['vol'].tolist() if 'vol' in df else None, now_ms=now_ms)
+    except Exception as e:
+        logger.error(f"Erreur lors du chargement des bougies dans l'agrégateur: {str(e)}")
+
+   def on_tick(self, data):
+    """Tick du streaming (message tickPrices) : alimente les bougies de tous les timeframes"""
+    if data.get('symbol') == self.symbol and data.get('bid') is not None:
+        self.bars.add_tick(data['timestamp'], data['bid'])
+
+   def _merge_history(self, cached, delta, window_start):
+    import pandas as pd
+    df = cached if delta is None else pd.concat([cached, delta])
+    # La dernière bougie connue est redemandée : la version reçue remplace l'ancienne
+    df = df[~df.index.duplicated(keep='last')].sort_index()
+    return df[df['ctm'] >= window_start]
+
+   def save_snapshot(self, force=False):
+    """Instantané de l'état (bougies, indicateurs, ordres) pour une reprise à chaud"""
+    if not self.snapshot_path:
+        return False
+    now = time.time()
+    if not force and now - self.last_snapshot < self.snapshot_interval:
+        return False
+    try:
+        history = self.history
+        columns = {}
+        if history is not None and len(history) > 0:
+            columns["ctm"] = ('q', history['ctm'].astype('int64').tolist())
+            for col in ['open', 'high', 'low', 'close', 'vol']:
+                if col in history:
+                    columns[col] = ('d', history[col].astype('float64').tolist())
+        meta = {
+            "saved_at": now,
+            "symbol": self.symbol,
+            "timeframe": self.timeframe,
+            "period": self.period,
+            "position_open": self.position_open,
+            "current_order_id": self.current_order_id,
+            "active_positions": sorted(self.active_positions),
+            "last_bar": self.last_bar,
+            "last_indicators": self.last_indicators,
+            "test_trade_done": self.test_trade_done,
+            # Historique en prix décodés par decode_prices (les instantanés antérieurs ne le sont pas)
+            "prices": "decoded",
+        }
+        size = write_snapshot(self.snapshot_path, meta, columns)
+        self.last_snapshot = now
+        logger.debug(f"Instantané écrit: {self.snapshot_path} ({size} octets)")
+        return True
+    except Exception as e:
+        logger.error(f"❌ Erreur lors de l'écriture de l'instantané: {str(e)}")
+        return False
+
+   def load_snapshot(self):
+    """Restaure l'état d'un instantané précédent ; le cycle suivant ne récupère que le delta"""
+    if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+        return False
+    t0 = time.perf_counter()
+    try:
+        meta, columns = read_snapshot(self.snapshot_path)
+    except (OSError, ValueError, SnapshotError) as e:
+        logger.warning(f"Instantané ignoré ({self.snapshot_path}): {str(e)}")
+        return False
+    if meta.get('symbol') != self.symbol or meta.get('period') != self.period:
+        logger.warning(f"Instantané ignoré: {meta.get('symbol')}/{meta.get('timeframe')} au lieu de {self.symbol}/{self.timeframe}")
+        return False
+    
+    if meta.get('prices') != 'decoded':
+        logger.warning("Historique de l'instantané ignoré : ancienne conversion des prix, il sera rechargé")
+    elif len(columns.get('ctm', ())) > 0:
+        import pandas as pd
+        df = pd.DataFrame(columns)
+        df['timestamp'] = pd.to_datetime(df['ctm'], unit='ms')
+        self.history = df.set_index('timestamp').sort_index()
+        self.seed_bars(self.history, int(time.time() * 1000))
+    self.position_open = meta.get('position_open', False)
+    self.current_order_id = meta.get('current_order_id')
+    self.active_positions = set(meta.get('active_positions', []))
+    self.last_bar = meta.get('last_bar')
+    self.last_indicators = meta.get('last_indicators')
+    self.test_trade_done = meta.get('test_trade_done', False)
+    self.last_snapshot = meta.get('saved_at', 0)
+    self.restored = True
+    logger.info(f"♻️ État restauré depuis {self.snapshot_path} en {(time.perf_counter() - t0) * 1000:.1f} ms "
+                f"({meta.get('rows', 0)} bougies, ordre courant: {self.current_order_id})")
+    return True
+
    def calculate_indicators(self, df):
     try:
+        import pandas as pd
         df = df.copy()
         # Assurez-vous que 'close' est numérique
         df['close'] = pd.to_numeric(df['close'], errors='coerce')
@@ -283,7 +510,9 @@ class XTBTradingBot:
                }
            }
            response = self.client.commandExecute(cmd["command"], cmd["arguments"])
-           return response.get('returnData', {}) if response else {}
+           info = response.get('returnData', {}) if response else {}
+           self.account.set_symbol(info)
+           return info
        except Exception as e:
            logging.error(f"❌ Erreur lors de la récupération des infos du symbole: {str(e)}")
            return {}
@@ -297,37 +526,67 @@ class XTBTradingBot:
         return False
         
     try:
-        symbol_info = self.get_symbol_info()
-        ask_price = float(symbol_info.get('ask', 0))
-        bid_price = float(symbol_info.get('bid', 0))
-        lot_min = max(float(symbol_info.get('lotMin', 0.01)), 0.01)
+        # Prix du dernier tick streamé ; getSymbol seulement sans streaming ou tick trop ancien
+        prices = self.account.prices(self.symbol) if self.streaming_live() else None
+        if prices is None or self.symbol not in self.account.symbols:
+            symbol_info = self.get_symbol_info()
+            prices = (float(symbol_info.get('bid', 0)), float(symbol_info.get('ask', 0)))
+        bid_price, ask_price = prices
         
-        logger.info(f"Prix demandé: {ask_price}, Prix offert: {bid_price}, Volume min: {lot_min}")
+        logger.info(f"Prix demandé: {ask_price}, Prix offert: {bid_price}")
 
         # Vérification des valeurs
-        if ask_price <= 0 or bid_price <= 0 or lot_min <= 0:
-            logger.error(f"Valeurs invalides pour le trade: ask={ask_price}, bid={bid_price}, lot_min={lot_min}")
+        if ask_price <= 0 or bid_price <= 0:
+            logger.error(f"Valeurs invalides pour le trade: ask={ask_price}, bid={bid_price}")
+            return False
+
+        price = ask_price if signal == "BUY" else bid_price
+        sl = round(ask_price * 0.985 if signal == "BUY" else bid_price * 1.015, 5)
+        if not self.account.ready:
+            self.check_account_status()
+        # Volume tel qu'une perte au stop coûte risk_percentage des fonds propres, dans la limite de la marge
+        volume, reason = self.account.position_size(self.symbol, self.risk_percentage, abs(price - sl), price,
+                                                    self.min_volume)
+        if volume is None:
+            logger.error(f"Ordre refusé avant envoi: {reason}")
+            self.emit_event("order", {"symbol": self.symbol, "signal": signal, "price": price, "sl": sl,
+                                      "status": "rejected", "error": reason})
             return False
 
+        # Identifiant côté client : relie l'ordre journalisé avant l'envoi à sa réponse et à sa position
+        request_id = new_request_id()
         trade_cmd = {
             "command": "tradeTransaction",
             "arguments": {
                 "tradeTransInfo": {
                     "cmd": 0 if signal == "BUY" else 1,
-                    "customComment": "Bot Trade",
+                    "customComment": order_comment(request_id),
                     "expiration": 0,
                     "offset": 0,
                     "order": 0,
-                    "price": ask_price if signal == "BUY" else bid_price,
-                    "sl": round(ask_price * 0.985 if signal == "BUY" else bid_price * 1.015, 5),
+                    "price": price,
+                    "sl": sl,
                     "tp": round(ask_price * 1.02 if signal == "BUY" else bid_price * 0.98, 5),
                     "symbol": self.symbol,
                     "type": 0,
-                    "volume": lot_min
+                    "volume": volume
                 }
             }
         }
 
+        trade_info = trade_cmd['arguments']['tradeTransInfo']
+        order_event = {
+            "symbol": self.symbol,
+            "signal": signal,
+            "request_id": request_id,
+            "price": trade_info['price'],
+            "sl": trade_info['sl'],
+            "tp": trade_info['tp'],
+            "volume": trade_info['volume'],
+        }
+        # Journalisé (fsync) avant l'envoi : un ordre parti est toujours retrouvable
+        self.emit_event("order", dict(order_event, status="sent", request=trade_info))
+
         logger.info(f"Envoi ordre: {json.dumps(trade_cmd, indent=2)}")
         response = self.client.commandExecute('tradeTransaction', trade_cmd['arguments'])
         logger.info(f"Réponse trade complète: {json.dumps(response, indent=2)}")
@@ -335,18 +594,21 @@ class XTBTradingBot:
         if response and response.get('status'):
             order_id = response.get('returnData', {}).get('order')
             logger.info(f"Trade exécuté avec succès, order_id: {order_id}")
+            self.emit_event("order", dict(order_event, status="accepted", order_id=order_id, response=response))
             
-            # Vérification immédiate pour confirmer l'état
-            time.sleep(1)  # Attente courte pour que l'ordre soit traité
+            # Vérification immédiate pour confirmer l'état (le scheduler du client espace déjà les commandes)
             has_positions = self.check_trade_status()
             logger.info(f"Vérification après trade: position_open={has_positions}")
             
             self.position_open = True
             self.current_order_id = order_id
+            # L'identifiant d'ordre doit survivre à un redémarrage
+            self.save_snapshot(force=True)
             return True
             
         error_msg = response.get('errorDescr', 'Erreur inconnue') if response else 'Pas de réponse'
         logger.error(f"Échec du trade: {error_msg}")
+        self.emit_event("order", dict(order_event, status="rejected", error=error_msg, response=response))
         return False
        
     except Exception as e:
@@ -366,6 +628,14 @@ class XTBTradingBot:
         if response and 'returnData' in response:
             trades = response['returnData']
             has_positions = len(trades) > 0
+            if has_positions != self.position_open:
+                self.emit_event("position", {"symbol": self.symbol, "position_open": has_positions,
+                                             "orders": [t.get('order') for t in trades],
+                                             "request_ids": [comment_request_id(t.get('customComment'))
+                                                             for t in trades]})
+                if not has_positions and not self.streaming_live():
+                    # Sans streaming, la clôture n'est pas poussée : on relit l'historique
+                    self.sync_closed_trades()
             # Très important: mettre à jour l'état interne
             self.position_open = has_positions
             return has_positions
@@ -377,6 +647,43 @@ class XTBTradingBot:
         self.position_open = False
         return False 
     
+   def sync_closed_trades(self):
+    """Trades clôturés depuis la dernière synchronisation, transmis au magasin d'analyse"""
+    now_ms = int(time.time() * 1000)
+    start = self.last_history_sync or now_ms - 24 * 3600 * 1000
+    try:
+        response = self.client.commandExecute("getTradesHistory", {"start": start, "end": 0})
+        if response and response.get('status'):
+            self.analytics.record_trades(response['returnData'])
+            self.last_history_sync = now_ms
+    except Exception as e:
+        logger.warning(f"Historique des trades indisponible: {str(e)}")
+
+   def publish_snapshot(self, df, signal):
+    """Mémorise et diffuse le dernier instantané d'indicateurs et la décision associée"""
+    last_row = df.iloc[-1]
+    snapshot = {
+        "symbol": self.symbol,
+        "time": df.index[-1].strftime('%Y-%m-%d %H:%M:%S'),
+        "close": float(last_row['close']),
+        "sma20": float(last_row['SMA20']),
+        "sma50": float(last_row['SMA50']),
+        "rsi": float(last_row['RSI']),
+        "periods": len(df),
+    }
+    self.last_indicators = dict(snapshot, signal_type=signal)
+    if not self.event_listeners:
+        return
+    self.emit_event("indicators", snapshot)
+    self.emit_event("signal", {
+        "symbol": self.symbol,
+        "time": snapshot["time"],
+        "signal_type": signal,
+        "sma_condition": bool(last_row['SMA20'] > last_row['SMA50']),
+        "price_condition": bool(last_row['close'] > last_row['SMA20']),
+        "rsi_condition": bool(last_row['RSI'] < 70),
+    })
+
    def run_strategy(self):
     try:
         logger.info("=== Exécution de la stratégie de trading ===")
@@ -415,6 +722,7 @@ class XTBTradingBot:
         # Vérification des signaux de trading
         logger.info("Recherche de signaux de trading...")
         signal = self.check_trading_signals(df)
+        self.publish_snapshot(df, signal)
         
         if signal:
             logger.info(f"📈 Signal détecté: {signal}")
@@ -430,14 +738,15 @@ class XTBTradingBot:
             logger.info(f"Résultat de l'exécution du trade: {'Succès' if result else 'Échec'}")
             
             # Vérification que le trade a été exécuté
-            time.sleep(1)
             actual_status = self.check_trade_status()
             logger.info(f"Statut des positions après trade: {actual_status}")
             
             if result and not actual_status:
                 logger.warning("L'exécution du trade a signalé un succès mais aucune position n'est détectée")
             
-            return result
+            # Bougie évaluée même si l'ordre a échoué : le thread de trading ne réessaie
+            # que les évaluations manquées, jamais un ordre déjà tenté
+            return True
         else:
             logger.info("Aucun signal de trading détecté")
             return True
@@ -1,81 +1,147 @@
-import requests
-import time
+import argparse
+import asyncio
 import json
+import os
+import time
 from datetime import datetime
 
+import aiohttp
+
 # Configuration - Update these with your actual endpoint
 BASE_URL = "https://trading-bot-642630404413.europe-west9.run.app"  # Change to your actual bot URL
 ITERATIONS = 5
 DELAY = 30  # seconds between checks
+TIMEOUT = 10  # seconds per request
+MAX_CONNECTIONS = 100  # pooled connections shared by every instance
+DIAGNOSTIC_ENDPOINTS = ["/status", "/sync_status", "/debug"]
+# Sent as X-API-Key; must be listed in the bot's RATE_LIMIT_EXEMPT_KEYS for load tests
+# to measure the routes rather than the per-client rate limits
+API_KEY = os.getenv("DIAGNOSTIC_API_KEY")
 
 def log_with_timestamp(message):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     print(f"[{timestamp}] {message}")
 
-def check_bot_status():
-    """Check if the bot is running and connected"""
-    try:
-        response = requests.get(f"{BASE_URL}/status", timeout=10)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            log_with_timestamp(f"Error getting status: {response.status_code}")
-            return None
-    except Exception as e:
-        log_with_timestamp(f"Exception checking status: {str(e)}")
+def percentile(samples, pct):
+    if not samples:
         return None
+    ordered = sorted(samples)
+    k = (len(ordered) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
 
-def get_debug_info():
-    """Get detailed debug information from the bot"""
-    try:
-        response = requests.get(f"{BASE_URL}/debug", timeout=10)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            log_with_timestamp(f"Error getting debug info: {response.status_code}")
-            return None
-    except Exception as e:
-        log_with_timestamp(f"Exception getting debug info: {str(e)}")
-        return None
+class EndpointStats:
+    """Latencies (ms) and outcomes collected for one instance/endpoint pair"""
 
-def get_logs():
-    """Get current logs/indicators from the bot"""
-    try:
-        response = requests.get(f"{BASE_URL}/logs", timeout=10)
-        if response.status_code == 200:
-            return response.json()
+    def __init__(self):
+        self.latencies = []
+        self.statuses = {}
+        self.errors = 0
+        self.throttled = 0
+
+    def record(self, status, latency):
+        key = str(status) if status is not None else "exception"
+        self.statuses[key] = self.statuses.get(key, 0) + 1
+        if status == 200:
+            self.latencies.append(latency * 1000.0)
+        elif status == 429:
+            self.throttled += 1
         else:
-            log_with_timestamp(f"Error getting logs: {response.status_code}")
+            self.errors += 1
+
+    def summary(self):
+        total = sum(self.statuses.values())
+        return {
+            "requests": total,
+            "error_rate": self.errors / total if total else None,
+            "throttled_rate": self.throttled / total if total else None,
+            "statuses": self.statuses,
+            "p50_ms": percentile(self.latencies, 50),
+            "p90_ms": percentile(self.latencies, 90),
+            "p99_ms": percentile(self.latencies, 99),
+            "max_ms": max(self.latencies) if self.latencies else None,
+        }
+
+class InstanceReport:
+    """Everything observed for one bot deployment during a run"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.endpoints = {}
+        self.signal_checks = 0
+        self.conditions_met = 0
+        self.condition_counts = {"sma_condition": 0, "price_condition": 0, "rsi_condition": 0}
+        self.signals = {}
+        self.last_status = None
+        self.last_sync = None
+
+    def stats(self, path):
+        if path not in self.endpoints:
+            self.endpoints[path] = EndpointStats()
+        return self.endpoints[path]
+
+    def record_debug(self, debug_info):
+        signal_check = check_signal_conditions(debug_info)
+        if not isinstance(signal_check, dict):
             return None
-    except Exception as e:
-        log_with_timestamp(f"Exception getting logs: {str(e)}")
-        return None
+        self.signal_checks += 1
+        self.conditions_met += bool(signal_check["conditions_met"])
+        for name in self.condition_counts:
+            self.condition_counts[name] += bool(signal_check[name])
+        signal = debug_info.get('trading_conditions', {}).get('signal_type') or "NONE"
+        self.signals[signal] = self.signals.get(signal, 0) + 1
+        return signal_check
+
+    def summary(self):
+        checks = self.signal_checks
+        return {
+            "base_url": self.base_url,
+            "endpoints": {path: stats.summary() for path, stats in self.endpoints.items()},
+            "signals": {
+                "checks": checks,
+                "conditions_met_rate": self.conditions_met / checks if checks else None,
+                "condition_rates": {k: v / checks for k, v in self.condition_counts.items()} if checks else {},
+                "signal_types": self.signals,
+            },
+            "connected": (self.last_status or {}).get('status') == 'connected',
+        }
 
-def sync_status():
-    """Sync the bot's position status with actual account status"""
+async def fetch(session, base_url, path, report=None):
+    """GET base_url+path on the shared session; returns (status, json or None, latency_s)"""
+    t0 = time.perf_counter()
+    status, payload = None, None
     try:
-        response = requests.get(f"{BASE_URL}/sync_status", timeout=10)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            log_with_timestamp(f"Error syncing status: {response.status_code}")
-            return None
-    except Exception as e:
-        log_with_timestamp(f"Exception syncing status: {str(e)}")
-        return None
+        async with session.get(f"{base_url}{path}") as response:
+            status = response.status
+            if status == 200:
+                payload = await response.json(content_type=None)
+            else:
+                await response.read()
+    except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError) as e:
+        log_with_timestamp(f"Exception on {base_url}{path}: {type(e).__name__} {e}")
+    latency = time.perf_counter() - t0
+    if report is not None:
+        report.stats(path).record(status, latency)
+    return status, payload, latency
+
+def make_session(timeout=TIMEOUT, max_connections=MAX_CONNECTIONS, api_key=None):
+    connector = aiohttp.TCPConnector(limit=max_connections, ttl_dns_cache=300)
+    headers = {"X-API-Key": api_key} if api_key else None
+    return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout), headers=headers)
 
 def check_signal_conditions(debug_info):
     """Analyze if trading signal conditions are being met"""
     if not debug_info or debug_info.get('status') != 'success':
         return "Unknown - couldn't get debug info"
-    
+
     conditions = debug_info.get('trading_conditions', {})
     market_data = debug_info.get('market_data', {})
-    
+
     sma_condition = conditions.get('sma_condition', 'False') == 'True'
     rsi_condition = conditions.get('rsi_condition', 'False') == 'True'
     price_condition = conditions.get('price_condition', 'False') == 'True'
-    
+
     result = {
         "conditions_met": sma_condition and rsi_condition and price_condition,
         "sma_condition": sma_condition,
@@ -86,97 +152,160 @@ def check_signal_conditions(debug_info):
         "sma50": market_data.get('sma50'),
         "rsi": market_data.get('rsi')
     }
-    
+
     return result
 
-def run_diagnostics():
-    """Run comprehensive diagnostics on the trading bot"""
-    log_with_timestamp("Starting trading bot diagnostics...")
-    
-    # First, check connection and sync status
-    status = check_bot_status()
+async def diagnose_instance(session, report):
+    """One diagnostic pass on one instance: /status, /sync_status and /debug in parallel"""
+    base_url = report.base_url
+    (_, status, _), (_, sync_result, _), (_, debug_info, _) = await asyncio.gather(
+        *(fetch(session, base_url, path, report) for path in DIAGNOSTIC_ENDPOINTS))
+
+    if status:
+        report.last_status = status
+    if sync_result:
+        report.last_sync = sync_result
+
+    prefix = f"[{base_url}]"
     if not status:
-        log_with_timestamp("❌ Cannot connect to the bot API.")
-        return
-    
-    log_with_timestamp(f"✅ Connected to bot. Status: {status.get('status')}")
-    
-    # Sync position status
-    sync_result = sync_status()
+        log_with_timestamp(f"{prefix} ❌ Cannot connect to the bot API.")
+    else:
+        log_with_timestamp(f"{prefix} ✅ Status: {status.get('status')}")
     if sync_result:
-        log_with_timestamp(f"Position status: {sync_result.get('position_open')} (Previous: {sync_result.get('previous_state')})")
-    
-    # Initial debug info
-    debug_info = get_debug_info()
+        log_with_timestamp(f"{prefix} Position status: {sync_result.get('position_open')} (Previous: {sync_result.get('previous_state')})")
     if not debug_info:
-        log_with_timestamp("❌ Cannot get debug information.")
+        log_with_timestamp(f"{prefix} ❌ Cannot get debug information.")
         return
-    
-    bot_state = debug_info.get('bot_state', {})
-    log_with_timestamp(f"Bot state: Connection={bot_state.get('connection')}, Position open={bot_state.get('position_open')}")
-    
-    # Begin monitoring over multiple iterations
-    log_with_timestamp(f"\n🔄 Starting {ITERATIONS} monitoring iterations with {DELAY}s intervals...")
-    
-    for i in range(ITERATIONS):
-        log_with_timestamp(f"\n--- Iteration {i+1}/{ITERATIONS} ---")
-        
-        # Get debug info
-        debug_info = get_debug_info()
-        if not debug_info:
-            log_with_timestamp("❌ Cannot get debug information.")
-            continue
-        
-        # Check signal conditions
-        signal_check = check_signal_conditions(debug_info)
-        log_with_timestamp(f"Signal conditions met: {signal_check.get('conditions_met')}")
-        log_with_timestamp(f"  - SMA condition: {signal_check.get('sma_condition')} (SMA20: {signal_check.get('sma20')}, SMA50: {signal_check.get('sma50')})")
-        log_with_timestamp(f"  - Price condition: {signal_check.get('price_condition')} (Price: {signal_check.get('price')}, SMA20: {signal_check.get('sma20')})")
-        log_with_timestamp(f"  - RSI condition: {signal_check.get('rsi_condition')} (RSI: {signal_check.get('rsi')})")
-        
-        # Check if a signal is generated
-        signal = debug_info.get('trading_conditions', {}).get('signal_type')
-        log_with_timestamp(f"Signal generated: {signal}")
-        
-        # Check position status
-        position_status = debug_info.get('position_status')
-        log_with_timestamp(f"Position status: {position_status}")
-        
-        # Wait for next iteration
-        if i < ITERATIONS - 1:
-            log_with_timestamp(f"Waiting {DELAY} seconds for next check...")
-            time.sleep(DELAY)
-    
+
+    signal_check = report.record_debug(debug_info)
+    if signal_check:
+        log_with_timestamp(f"{prefix} Signal conditions met: {signal_check.get('conditions_met')}")
+        log_with_timestamp(f"{prefix}   - SMA condition: {signal_check.get('sma_condition')} (SMA20: {signal_check.get('sma20')}, SMA50: {signal_check.get('sma50')})")
+        log_with_timestamp(f"{prefix}   - Price condition: {signal_check.get('price_condition')} (Price: {signal_check.get('price')}, SMA20: {signal_check.get('sma20')})")
+        log_with_timestamp(f"{prefix}   - RSI condition: {signal_check.get('rsi_condition')} (RSI: {signal_check.get('rsi')})")
+    log_with_timestamp(f"{prefix} Signal generated: {debug_info.get('trading_conditions', {}).get('signal_type')}")
+    log_with_timestamp(f"{prefix} Position status: {debug_info.get('position_status')}")
+
+async def run_diagnostics(base_urls, iterations=ITERATIONS, delay=DELAY, timeout=TIMEOUT, api_key=API_KEY):
+    """Health sweep: every instance is checked concurrently on each iteration"""
+    log_with_timestamp(f"Starting trading bot diagnostics on {len(base_urls)} instance(s)...")
+    reports = [InstanceReport(url) for url in base_urls]
+
+    async with make_session(timeout, api_key=api_key) as session:
+        for i in range(iterations):
+            log_with_timestamp(f"\n--- Iteration {i+1}/{iterations} ---")
+            await asyncio.gather(*(diagnose_instance(session, report) for report in reports))
+            if i < iterations - 1:
+                log_with_timestamp(f"Waiting {delay} seconds for next check...")
+                await asyncio.sleep(delay)
+
     log_with_timestamp("\n📊 Diagnostic Summary:")
-    
-    # Final connection check
-    status = check_bot_status()
-    connection_ok = status and status.get('status') == 'connected'
-    log_with_timestamp(f"✅ Connection status: {'Connected' if connection_ok else 'Disconnected'}")
-    
-    # Check position tracking
-    sync_result = sync_status()
-    if sync_result:
-        position_tracking_ok = sync_result.get('position_open') == sync_result.get('previous_state')
-        log_with_timestamp(f"✅ Position tracking: {'Accurate' if position_tracking_ok else 'Inconsistent'}")
-    
-    # Final signal check
-    debug_info = get_debug_info()
-    if debug_info:
-        signal_check = check_signal_conditions(debug_info)
-        signal_conditions_met = signal_check.get('conditions_met')
-        log_with_timestamp(f"✅ Signal conditions: {'Met' if signal_conditions_met else 'Not met'}")
-        
-        if not signal_conditions_met:
-            log_with_timestamp("ℹ️ No automatic trade will execute until all signal conditions are met:")
-            if not signal_check.get('sma_condition'):
+    for report in reports:
+        summary = report.summary()
+        log_with_timestamp(f"[{report.base_url}] {'✅ Connected' if summary['connected'] else '❌ Disconnected'}")
+        if report.last_sync:
+            tracking_ok = report.last_sync.get('position_open') == report.last_sync.get('previous_state')
+            log_with_timestamp(f"[{report.base_url}] Position tracking: {'Accurate' if tracking_ok else 'Inconsistent'}")
+        log_summary(report)
+        signals = report.summary()["signals"]
+        if signals["checks"] and not signals["conditions_met_rate"]:
+            log_with_timestamp(f"[{report.base_url}] ℹ️ No automatic trade will execute until all signal conditions are met:")
+            rates = signals["condition_rates"]
+            if not rates.get('sma_condition'):
                 log_with_timestamp("  - SMA20 must be greater than SMA50")
-            if not signal_check.get('price_condition'):
+            if not rates.get('price_condition'):
                 log_with_timestamp("  - Price must be greater than SMA20")
-            if not signal_check.get('rsi_condition'):
+            if not rates.get('rsi_condition'):
                 log_with_timestamp("  - RSI must be less than 70")
-    
     log_with_timestamp("\n🔍 Diagnostics completed")
+    return [report.summary() for report in reports]
+
+async def drive_endpoint(session, report, path, rate, duration, in_flight):
+    """Open-loop load: requests start on a fixed schedule whatever the response times"""
+    loop = asyncio.get_running_loop()
+    interval = 1.0 / rate
+    start = loop.time()
+    tasks = []
+    n = 0
+    while True:
+        due = start + n * interval
+        if due - start >= duration:
+            break
+        now = loop.time()
+        if due > now:
+            await asyncio.sleep(due - now)
+        n += 1
+
+        async def one():
+            async with in_flight:
+                _, payload, _ = await fetch(session, report.base_url, path, report)
+            if path == "/debug" and payload:
+                report.record_debug(payload)
+        tasks.append(asyncio.ensure_future(one()))
+    await asyncio.gather(*tasks)
+    return n / duration
+
+async def run_load_test(base_urls, endpoints, rate, duration, concurrency, timeout=TIMEOUT, api_key=API_KEY):
+    """Drive `rate` req/s per endpoint and per instance for `duration` seconds"""
+    log_with_timestamp(f"Load test: {len(base_urls)} instance(s) x {endpoints} at {rate} req/s each for {duration}s")
+    reports = [InstanceReport(url) for url in base_urls]
+    in_flight = asyncio.Semaphore(concurrency)
+
+    async with make_session(timeout, max_connections=concurrency, api_key=api_key) as session:
+        await asyncio.gather(*(drive_endpoint(session, report, path, rate, duration, in_flight)
+                               for report in reports for path in endpoints))
+
+    log_with_timestamp("\n📊 Load Test Summary:")
+    for report in reports:
+        log_summary(report)
+    return [report.summary() for report in reports]
+
+def log_summary(report):
+    summary = report.summary()
+    for path, stats in summary["endpoints"].items():
+        p50, p99 = stats["p50_ms"], stats["p99_ms"]
+        log_with_timestamp(f"[{report.base_url}] {path}: {stats['requests']} req, "
+                           f"errors {stats['error_rate']:.1%}, "
+                           f"throttled (429) {stats['throttled_rate']:.1%}, "
+                           f"p50 {p50 if p50 is None else round(p50, 1)} ms, "
+                           f"p99 {p99 if p99 is None else round(p99, 1)} ms, statuses {stats['statuses']}")
+    signals = summary["signals"]
+    if signals["checks"]:
+        log_with_timestamp(f"[{report.base_url}] Signal conditions met in {signals['conditions_met_rate']:.0%} of "
+                           f"{signals['checks']} checks, signals: {signals['signal_types']}")
+        for name, rate in signals["condition_rates"].items():
+            log_with_timestamp(f"[{report.base_url}]   - {name}: {rate:.0%}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Health sweep and load tool for trading bot instances")
+    parser.add_argument('urls', nargs='*', default=[BASE_URL], help="bot base URLs (default: BASE_URL)")
+    parser.add_argument('--iterations', type=int, default=ITERATIONS)
+    parser.add_argument('--delay', type=float, default=DELAY, help="seconds between sweep iterations")
+    parser.add_argument('--timeout', type=float, default=TIMEOUT, help="seconds per request")
+    parser.add_argument('--load', action='store_true', help="run a load test instead of the health sweep")
+    parser.add_argument('--rate', type=float, default=5.0, help="req/s per endpoint and per instance (load)")
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds (load)")
+    parser.add_argument('--endpoint', action='append', help="endpoint(s) to drive (load, default: /status)")
+    parser.add_argument('--concurrency', type=int, default=MAX_CONNECTIONS, help="max requests in flight")
+    parser.add_argument('--json', help="write the per-instance summaries to this file")
+    parser.add_argument('--api-key', default=API_KEY,
+                        help="X-API-Key to send, listed in the bot's RATE_LIMIT_EXEMPT_KEYS (default: DIAGNOSTIC_API_KEY)")
+    args = parser.parse_args(argv)
+    if args.rate <= 0:
+        parser.error("--rate must be positive")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    urls = [url.rstrip('/') for url in args.urls]
+    if args.load:
+        summaries = asyncio.run(run_load_test(urls, args.endpoint or ["/status"], args.rate, args.duration,
+                                              args.concurrency, args.timeout, args.api_key))
+    else:
+        summaries = asyncio.run(run_diagnostics(urls, args.iterations, args.delay, args.timeout, args.api_key))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summaries, f, indent=2)
 
 if __name__ == "__main__":
-    run_diagnostics()
+    main()
@@ -0,0 +1,152 @@
+import itertools
+import json
+import threading
+import time
+from collections import deque
+
+
+class Subscriber:
+    """File bornée d'un abonné ; le débordement le déconnecte au lieu de bloquer l'émetteur"""
+
+    def __init__(self, max_queue):
+        self.max_queue = max_queue
+        self.queue = deque()
+        self.closed = False
+        self.dropped = False
+        self._ready = threading.Event()
+
+    def put(self, frame):
+        if self.closed:
+            return False
+        if len(self.queue) >= self.max_queue:
+            # Consommateur trop lent : on le coupe, il se reconnectera avec Last-Event-ID
+            self.dropped = True
+            self.close()
+            return False
+        self.queue.append(frame)
+        self._ready.set()
+        return True
+
+    def get(self, timeout):
+        """Prochaine trame, b'' si rien pendant `timeout`, None si l'abonnement est fermé"""
+        while True:
+            try:
+                return self.queue.popleft()
+            except IndexError:
+                pass
+            if self.closed:
+                return None
+            self._ready.clear()
+            if self.queue or self.closed:
+                continue
+            if not self._ready.wait(timeout):
+                return b''
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+
+class EventFeed:
+    """Diffusion Server-Sent Events des instantanés d'indicateurs, signaux et ordres.
+
+    Chaque événement est sérialisé une seule fois puis déposé dans la file de
+    chaque abonné ; l'émetteur (le thread de trading) ne bloque jamais. Le
+    dernier événement de chaque type est conservé pour /snapshot, et un court
+    historique permet de reprendre un flux après reconnexion.
+
+    `max_subscribers` borne les connexions ouvertes : avec un serveur à
+    threads (gunicorn gthread), chacune occupe un thread du worker. Les
+    `listeners` (event_id, trame) reçoivent chaque trame une fois, hors
+    verrou : le serveur asynchrone (sse_server.StreamServer) la diffuse à
+    tous ses abonnés depuis un seul thread.
+    """
+
+    def __init__(self, max_queue=256, history=200, max_subscribers=500, keepalive=15.0):
+        self.max_queue = max_queue
+        self.max_subscribers = max_subscribers
+        self.keepalive = keepalive
+        self.latest = {}
+        self._history = deque(maxlen=history)
+        self._subscribers = ()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.listeners = []
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, event_type, data, event_id=None):
+        """Diffuse un événement ; `event_id` impose l'identifiant (relais d'un autre processus)"""
+        with self._lock:
+            if event_id is None:
+                event_id = next(self._ids)
+            else:
+                self._ids = itertools.count(event_id + 1)
+            payload = json.dumps(data, default=str)
+            frame = f"id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n".encode('utf-8')
+            self.latest[event_type] = {"id": event_id, "time": time.time(), "data": data}
+            self._history.append((event_id, frame, event_type, data))
+            subscribers = self._subscribers
+        self.published += 1
+        for listener in self.listeners:
+            listener(event_id, frame)
+        for subscriber in subscribers:
+            if not subscriber.put(frame) and subscriber.dropped:
+                self._remove(subscriber)
+                self.dropped += 1
+        return event_id
+
+    def subscribe(self, last_event_id=None):
+        """Nouvel abonné, ou None si la limite d'abonnés est atteinte"""
+        subscriber = Subscriber(self.max_queue)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            if last_event_id is not None:
+                for event_id, frame, _, _ in self._history:
+                    if event_id > last_event_id:
+                        subscriber.queue.append(frame)
+            # Copie à l'écriture : publish() parcourt le tuple sans verrou
+            self._subscribers = self._subscribers + (subscriber,)
+        return subscriber
+
+    def _remove(self, subscriber):
+        subscriber.close()
+        with self._lock:
+            self._subscribers = tuple(s for s in self._subscribers if s is not subscriber)
+
+    def frames_since(self, last_event_id, until_id=None):
+        """Trames d'historique d'identifiant dans ]last_event_id, until_id]"""
+        with self._lock:
+            return [frame for event_id, frame, _, _ in self._history
+                    if event_id > last_event_id and (until_id is None or event_id <= until_id)]
+
+    def since(self, last_event_id=0):
+        """[(id, type, données)] des événements d'historique postérieurs à `last_event_id`"""
+        with self._lock:
+            return [(event_id, event_type, data) for event_id, _, event_type, data in self._history
+                    if event_id > last_event_id]
+
+    def unsubscribe(self, subscriber):
+        self._remove(subscriber)
+
+    def stream(self, subscriber):
+        """Générateur de trames SSE pour une réponse Flask"""
+        try:
+            yield b"retry: 5000\n\n"
+            while True:
+                frame = subscriber.get(self.keepalive)
+                if frame is None:
+                    break
+                yield frame or b": keep-alive\n\n"
+        finally:
+            self._remove(subscriber)
+
+    def stats(self):
+        return {
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+            "max_subscribers": self.max_subscribers,
+            "dropped_subscribers": self.dropped,
+            "max_queue": self.max_queue,
+        }
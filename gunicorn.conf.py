@@ -0,0 +1,11 @@
+# Configuration gunicorn : `gunicorn --config gunicorn.conf.py start:app` (cf. Dockerfile)
+
+
+def post_worker_init(worker):
+    """Worker prêt à servir : candidat à l'élection du leader, follower en attendant.
+
+    Démarré ici et non à l'import de start.py : importer le module (scripts,
+    benchmarks, outils) ne lance ni élection, ni IPC, ni relais d'événements.
+    """
+    import start
+    start.start_worker()
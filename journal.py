@@ -0,0 +1,335 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+
+# Intervalle de validation groupée : un fsync couvre tous les événements du lot
+COMMIT_INTERVAL = 0.05
+# Types d'événements du bot conservés dans le journal
+JOURNAL_EVENTS = ("signal", "order", "position")
+# Types pour lesquels `record` attend que l'événement soit sur disque
+DURABLE_EVENTS = ("order",)
+# Commentaire des ordres du bot, suivi de l'identifiant de requête côté client
+COMMENT_PREFIX = "Bot Trade"
+# Version du format des index ; un index d'une autre version est reconstruit
+INDEX_VERSION = 2
+
+
+def day_of(timestamp):
+    return time.strftime('%Y-%m-%d', time.gmtime(timestamp))
+
+
+def new_request_id():
+    """Identifiant côté client d'un ordre, connu avant la réponse du broker"""
+    return uuid.uuid4().hex[:16]
+
+
+def order_comment(request_id):
+    """customComment de l'ordre : le broker le renvoie dans getTrades et le flux des trades"""
+    return f"{COMMENT_PREFIX} {request_id}"
+
+
+def comment_request_id(comment):
+    """Identifiant de requête d'un customComment du bot, None sinon"""
+    if comment and comment.startswith(COMMENT_PREFIX + ' '):
+        return comment[len(COMMENT_PREFIX) + 1:] or None
+    return None
+
+
+class Journal:
+    """Journal en ajout seul des décisions et ordres du bot, un fichier JSON lines par jour (UTC).
+
+    `append` écrit dans le tampon du fichier et rend la main ; un thread
+    fait flush + fsync pour tout ce qui a été écrit entre-temps (validation
+    groupée), au plus `commit_interval` secondes après la première écriture
+    en attente. `wait=True` attend ce fsync et le déclenche sans attendre
+    l'intervalle ; les écrivains arrivés pendant un fsync partagent le suivant.
+    """
+
+    def __init__(self, directory, commit_interval=COMMIT_INTERVAL, events=JOURNAL_EVENTS,
+                 durable_events=DURABLE_EVENTS):
+        self.directory = directory
+        self.commit_interval = commit_interval
+        self.events = set(events)
+        self.durable_events = set(durable_events)
+        self._cond = threading.Condition()
+        self._file = None
+        self._day = None
+        self._seq = 0
+        self._written = 0  # dernier numéro écrit dans le tampon
+        self._durable = 0  # dernier numéro sur disque
+        self._waiters = 0
+        self._thread = None
+        self._running = False
+        self.commits = 0
+        self.last_commit_ms = None
+
+    def _start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='journal-commit', daemon=True)
+        self._thread.start()
+
+    def path(self, day):
+        return os.path.join(self.directory, f"journal-{day}.jsonl")
+
+    def append(self, event_type, data, wait=False):
+        """Ajoute un événement ; renvoie son numéro de séquence"""
+        now = time.time()
+        with self._cond:
+            if not self._running:
+                self._start()
+            day = day_of(now)
+            if day != self._day:
+                self._open(day)
+            self._seq += 1
+            seq = self._seq
+            line = json.dumps({"seq": seq, "ts": now, "type": event_type, "data": data},
+                              default=str, separators=(',', ':'))
+            self._file.write(line + '\n')
+            if self._written == self._durable:
+                self._cond.notify_all()
+            self._written = seq
+            if wait:
+                self._waiters += 1
+                self._cond.notify_all()
+                while self._durable < seq and self._running:
+                    self._cond.wait()
+                self._waiters -= 1
+        return seq
+
+    def record(self, event_type, data):
+        """Abonné aux événements du bot (cf. XTBTradingBot.event_listeners)"""
+        if event_type in self.events:
+            self.append(event_type, data, wait=event_type in self.durable_events)
+
+    def _open(self, day):
+        # Changement de jour : l'ancien fichier est validé avant d'être fermé
+        if self._file:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._durable = self._written
+        self._file = open(self.path(day), 'a', encoding='utf-8', buffering=64 * 1024)
+        self._day = day
+        if self._seq == 0:
+            self._seq = self._last_seq(self.path(day))
+
+    @staticmethod
+    def _last_seq(path):
+        """Reprend la numérotation après un redémarrage"""
+        try:
+            with open(path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(0, f.tell() - 64 * 1024))
+                lines = f.read().splitlines()
+        except OSError:
+            return 0
+        for line in reversed(lines):
+            try:
+                return int(json.loads(line)["seq"])
+            except (ValueError, KeyError, TypeError):
+                continue
+        return 0
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and self._written == self._durable:
+                    self._cond.wait()
+                if not self._running and self._written == self._durable:
+                    return
+                deadline = time.monotonic() + self.commit_interval
+                while self._running and not self._waiters:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                f, target = self._file, self._written
+                f.flush()
+            # Le tampon est vidé sous verrou, le fsync se fait sans bloquer les écrivains
+            t0 = time.perf_counter()
+            try:
+                os.fsync(f.fileno())
+            except (OSError, ValueError):
+                # Fichier fermé entre-temps par le changement de jour, déjà validé
+                pass
+            with self._cond:
+                self._durable = max(self._durable, target)
+                self.commits += 1
+                self.last_commit_ms = round((time.perf_counter() - t0) * 1000.0, 3)
+                self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            if not self._running:
+                return
+            self._running = False
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
+        with self._cond:
+            if self._file:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+                self._day = None
+            self._durable = self._written
+            self._cond.notify_all()
+
+    def stats(self):
+        return {
+            "directory": self.directory,
+            "seq": self._seq,
+            "pending": self._written - self._durable,
+            "commits": self.commits,
+            "last_commit_ms": self.last_commit_ms,
+        }
+
+
+# -- lecture et index ----------------------------------------------------------
+
+def _order_ids(event):
+    data = event.get("data") or {}
+    ids = set()
+    if data.get("order_id") is not None:
+        ids.add(str(data["order_id"]))
+    for order in data.get("orders") or ():
+        if order is not None:
+            ids.add(str(order))
+    return ids
+
+
+def _request_ids(event):
+    data = event.get("data") or {}
+    ids = {str(r) for r in data.get("request_ids") or () if r is not None}
+    if data.get("request_id") is not None:
+        ids.add(str(data["request_id"]))
+    return ids
+
+
+class JournalReader:
+    """Requêtes sur le journal : par jour (un fichier) et par ordre (index persistant).
+
+    L'index d'un jour (`journal-<jour>.idx.json`) associe chaque ordre aux
+    positions de ses lignes ; il est reconstruit si le fichier a changé
+    depuis (taille différente). L'ordre et son identifiant de requête
+    (`request_id`, journalisé dès l'envoi) y désignent les mêmes lignes :
+    l'événement « sent », sans numéro d'ordre, est retrouvé par l'un ou l'autre.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def days(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return sorted(n[len('journal-'):-len('.jsonl')] for n in names
+                      if n.startswith('journal-') and n.endswith('.jsonl'))
+
+    def path(self, day):
+        return os.path.join(self.directory, f"journal-{day}.jsonl")
+
+    def read_day(self, day, types=None):
+        try:
+            with open(self.path(day), 'rb') as f:
+                for line in f:
+                    event = self._parse(line)
+                    if event is not None and (types is None or event.get("type") in types):
+                        yield event
+        except FileNotFoundError:
+            return
+
+    @staticmethod
+    def _parse(line):
+        try:
+            return json.loads(line)
+        except ValueError:
+            # Dernière ligne incomplète après un arrêt brutal
+            return None
+
+    def index(self, day):
+        """{ordre: [positions]} du jour, depuis le cache ou reconstruit"""
+        path = self.path(day)
+        index_path = os.path.join(self.directory, f"journal-{day}.idx.json")
+        size = os.path.getsize(path)
+        try:
+            with open(index_path) as f:
+                cached = json.load(f)
+            if cached.get("size") == size and cached.get("version") == INDEX_VERSION:
+                return cached["orders"]
+        except (OSError, ValueError):
+            pass
+        lines = {}
+        links = {}  # ordre <-> requête, par les événements qui portent les deux
+        offset = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                event = self._parse(line)
+                if event is not None:
+                    order_ids, request_ids = _order_ids(event), _request_ids(event)
+                    for key in order_ids | request_ids:
+                        lines.setdefault(key, []).append(offset)
+                    for order_id in order_ids:
+                        for request_id in request_ids:
+                            links.setdefault(order_id, set()).add(request_id)
+                            links.setdefault(request_id, set()).add(order_id)
+                offset += len(line)
+        orders = {key: sorted(set(offsets).union(*(lines[linked] for linked in links.get(key, ()))))
+                  for key, offsets in lines.items()}
+        try:
+            tmp_path = f"{index_path}.tmp.{os.getpid()}"
+            with open(tmp_path, 'w') as f:
+                json.dump({"version": INDEX_VERSION, "size": size, "orders": orders}, f)
+            os.replace(tmp_path, index_path)
+        except OSError:
+            pass
+        return orders
+
+    def order(self, order_id, days=None):
+        """Tous les événements d'un ordre (numéro ou identifiant de requête), dans l'ordre du journal"""
+        order_id = str(order_id)
+        for day in days or self.days():
+            offsets = self.index(day).get(order_id)
+            if not offsets:
+                continue
+            with open(self.path(day), 'rb') as f:
+                for offset in offsets:
+                    f.seek(offset)
+                    event = self._parse(f.readline())
+                    if event is not None:
+                        yield event
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Consultation du journal des décisions et ordres du bot")
+    parser.add_argument('--dir', default=os.getenv('JOURNAL_DIR', 'journal'), help="dossier du journal")
+    parser.add_argument('--day', action='append', help="jour(s) AAAA-MM-JJ (défaut : tous)")
+    parser.add_argument('--order', help="événements d'un ordre, par numéro ou identifiant de requête")
+    parser.add_argument('--type', action='append', choices=JOURNAL_EVENTS, help="filtre par type")
+    parser.add_argument('--days', action='store_true', help="liste les jours et leur nombre d'événements")
+    args = parser.parse_args(argv)
+
+    reader = JournalReader(args.dir)
+    if args.days:
+        for day in reader.days():
+            print(f"{day}  {sum(1 for _ in reader.read_day(day))}")
+        return 0
+    if args.order:
+        events = reader.order(args.order, args.day)
+    else:
+        events = (e for day in args.day or reader.days() for e in reader.read_day(day, args.type))
+    for event in events:
+        if args.type and event.get("type") not in args.type:
+            continue
+        print(json.dumps(event, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,317 @@
+import fcntl
+import json
+import logging
+import os
+import secrets
+import tempfile
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+logger = logging.getLogger('trading_bot')
+
+# Dossier partagé par les workers d'une même machine (tmpfs si disponible)
+DEFAULT_DIR = os.path.join('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'xtb-bot')
+# Un follower retente l'élection à cet intervalle : délai de bascule si le leader meurt
+ELECTION_INTERVAL = 0.5
+# Période d'écriture de l'état partagé par le leader
+PUBLISH_INTERVAL = 0.5
+IPC_TIMEOUT = 60.0
+
+
+def leader_dir():
+    return os.getenv('LEADER_DIR', DEFAULT_DIR)
+
+
+class LeaderElection:
+    """Élection d'un seul processus leader par verrou de fichier (flock).
+
+    Le verrou est tenu tant que le processus vit : à sa mort, le noyau le
+    libère et un autre worker l'obtient au tour suivant. Le leader possède
+    le thread de trading et les sessions broker ; les autres processus ne
+    font que servir l'HTTP à partir de l'état qu'il publie.
+    """
+
+    def __init__(self, directory=None, interval=ELECTION_INTERVAL):
+        self.directory = directory or leader_dir()
+        self.path = os.path.join(self.directory, 'leader.lock')
+        self.interval = interval
+        self.is_leader = False
+        self.elected_at = None
+        self._fd = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def try_acquire(self):
+        if self.is_leader:
+            return True
+        os.makedirs(self.directory, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        self.is_leader = True
+        self.elected_at = time.time()
+        return True
+
+    def leader_pid(self):
+        try:
+            with open(self.path) as f:
+                return int(f.read().strip() or 0) or None
+        except (OSError, ValueError):
+            return None
+
+    def campaign(self, on_elected):
+        """Candidate en arrière-plan jusqu'à l'élection, puis appelle `on_elected()`"""
+        def run():
+            while not self._stop.is_set():
+                if self.try_acquire():
+                    logger.info(f"Processus {os.getpid()} élu leader")
+                    on_elected()
+                    return
+                self._stop.wait(self.interval)
+        self._thread = threading.Thread(target=run, name='leader-election', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self.is_leader = False
+
+    def stats(self):
+        return {
+            "pid": os.getpid(),
+            "is_leader": self.is_leader,
+            "leader_pid": os.getpid() if self.is_leader else self.leader_pid(),
+            "elected_at": self.elected_at,
+        }
+
+
+class SharedState:
+    """État publié par le leader dans un fichier JSON en mémoire partagée.
+
+    Écriture atomique (fichier temporaire puis rename) ; la lecture n'est
+    refaite que si le fichier a changé (inode, taille, date), sinon le
+    dernier état décodé est rendu sans rien relire.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or leader_dir()
+        self.path = os.path.join(self.directory, 'state.json')
+        self._cached = None
+        self._signature = None
+        self._lock = threading.Lock()
+        self.writes = 0
+        self.reads = 0
+
+    def write(self, state):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp.{os.getpid()}"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, default=str, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+        self.writes += 1
+
+    def read(self):
+        """Dernier état publié, ou None s'il n'y en a pas encore"""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        signature = (st.st_ino, st.st_size, st.st_mtime_ns)
+        if signature == self._signature:
+            return self._cached
+        with self._lock:
+            if signature != self._signature:
+                try:
+                    with open(self.path) as f:
+                        self._cached = json.load(f)
+                except (OSError, ValueError):
+                    # Remplacé entre le stat et l'ouverture : on relira au prochain appel
+                    return self._cached
+                self._signature = signature
+                self.reads += 1
+        return self._cached
+
+    def age(self):
+        state = self.read()
+        return time.time() - state["published_at"] if state else None
+
+
+class StatePublisher:
+    """Thread du leader : écrit `build()` dans l'état partagé périodiquement et sur `notify()`"""
+
+    def __init__(self, shared, build, interval=PUBLISH_INTERVAL):
+        self.shared = shared
+        self.build = build
+        self.interval = interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self.failures = 0
+
+    def start(self):
+        threading.Thread(target=self._run, name='state-publisher', daemon=True).start()
+        return self
+
+    def notify(self, *args):
+        """Abonné aux événements du bot : publie sans attendre la période"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                state = self.build()
+                state["published_at"] = time.time()
+                self.shared.write(state)
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Publication de l'état partagé: {str(e)}")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+
+class EventRelay:
+    """Thread d'un follower : republie dans son flux SSE local les événements du leader.
+
+    Les identifiants du leader sont conservés, si bien qu'un client SSE
+    peut reprendre (Last-Event-ID) sur n'importe quel worker.
+    """
+
+    def __init__(self, shared, feed, interval=0.1):
+        self.shared = shared
+        self.feed = feed
+        self.interval = interval
+        self.last_id = 0
+        self.relayed = 0
+        self._stop = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, name='event-relay', daemon=True).start()
+        return self
+
+    def poll(self):
+        state = self.shared.read()
+        if not state:
+            return 0
+        count = 0
+        for event_id, event_type, data in state.get("events", ()):
+            if event_id > self.last_id:
+                self.feed.publish(event_type, data, event_id=event_id)
+                self.last_id = event_id
+                count += 1
+        self.relayed += count
+        return count
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Relais des événements du leader: {str(e)}")
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        self._stop.set()
+
+
+# -- appels des followers vers le leader (routes qui touchent au broker) -------
+
+def _authkey(directory, create):
+    path = os.path.join(directory, 'ipc.key')
+    if create:
+        os.makedirs(directory, exist_ok=True)
+        key = secrets.token_bytes(32)
+        fd = os.open(f"{path}.tmp.{os.getpid()}", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(key)
+        os.replace(f"{path}.tmp.{os.getpid()}", path)
+        return key
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class LeaderServer:
+    """Socket Unix du leader : exécute les routes que les followers lui transmettent.
+
+    Une requête est `(nom, arguments)` ; la réponse `(corps JSON, code HTTP)`
+    de la fonction enregistrée sous ce nom dans `handlers`.
+    """
+
+    def __init__(self, handlers, directory=None):
+        self.handlers = handlers
+        self.directory = directory or leader_dir()
+        self.address = os.path.join(self.directory, 'leader.sock')
+        self.calls = 0
+        self.errors = 0
+        self._listener = None
+
+    def start(self):
+        authkey = _authkey(self.directory, create=True)
+        try:
+            # Socket laissé par un leader mort : le verrou garantit qu'il n'est plus servi
+            os.unlink(self.address)
+        except OSError:
+            pass
+        self._listener = Listener(self.address, family='AF_UNIX', authkey=authkey)
+        threading.Thread(target=self._accept, name='leader-ipc', daemon=True).start()
+        return self
+
+    def _accept(self):
+        while True:
+            try:
+                conn = self._listener.accept()
+            except Exception as e:
+                if self._listener is None:
+                    return
+                logger.warning(f"Connexion IPC refusée: {str(e)}")
+                continue
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        with conn:
+            try:
+                name, kwargs = conn.recv()
+            except (EOFError, OSError):
+                return
+            self.calls += 1
+            try:
+                handler = self.handlers[name]
+                reply = handler(**kwargs)
+            except Exception as e:
+                self.errors += 1
+                reply = ({"success": False, "error": str(e)}, 500)
+            try:
+                conn.send(reply)
+            except OSError:
+                pass
+
+    def close(self):
+        listener, self._listener = self._listener, None
+        if listener:
+            listener.close()
+
+    def stats(self):
+        return {"address": self.address, "calls": self.calls, "errors": self.errors}
+
+
+def call_leader(handler, directory=None, timeout=IPC_TIMEOUT, **kwargs):
+    """Appelle `handlers[handler](**kwargs)` chez le leader ; renvoie (corps JSON, code HTTP)"""
+    directory = directory or leader_dir()
+    conn = Client(os.path.join(directory, 'leader.sock'), family='AF_UNIX', authkey=_authkey(directory, False))
+    with conn:
+        conn.send((handler, kwargs))
+        if not conn.poll(timeout):
+            raise TimeoutError(f"Pas de réponse du leader pour {handler}")
+        return conn.recv()
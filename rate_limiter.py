@@ -0,0 +1,63 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class GCRALimiter:
+    """Limiteur par client (GCRA, équivalent à une fenêtre glissante).
+
+    Chaque client ne coûte qu'un flottant : l'instant théorique d'arrivée
+    (TAT) de sa prochaine requête. `limit` requêtes sont admises en rafale,
+    puis une toutes les `period / limit` secondes.
+
+    Les clés sont réparties sur des shards ayant chacun leur verrou, pour
+    que les requêtes HTTP ne se disputent pas un verrou global. Chaque shard
+    est un LRU borné ; un client dont le TAT est passé est au repos (il a
+    retrouvé toute sa rafale) et peut être oublié sans changer le résultat.
+    """
+
+    def __init__(self, limit, period, shards=16, max_keys=10000):
+        # Fraction acceptée (1.5 requête par fenêtre) ; en dessous d'une requête, rien ne passerait jamais
+        self.limit = float(limit)
+        self.period = float(period)
+        if self.limit < 1 or self.period <= 0:
+            raise ValueError(f"Limite de taux invalide: {limit}/{period} (au moins 1 requête par fenêtre)")
+        self.interval = self.period / self.limit
+        self.tolerance = self.period - self.interval
+        self.max_keys_per_shard = max(1, max_keys // shards)
+        self._shards = [(threading.Lock(), OrderedDict()) for _ in range(shards)]
+        self.rejected = 0
+
+    def hit(self, key, now=None):
+        """Compte une requête de `key` ; renvoie (autorisé, secondes avant réessai)."""
+        if now is None:
+            now = time.monotonic()
+        lock, tats = self._shards[hash(key) % len(self._shards)]
+        with lock:
+            tat = tats.get(key, now)
+            if tat < now:
+                tat = now
+            if tat - now > self.tolerance:
+                self.rejected += 1
+                return False, tat - now - self.tolerance
+            tats[key] = tat + self.interval
+            tats.move_to_end(key)
+            self._evict(tats, now)
+        return True, 0.0
+
+    def _evict(self, tats, now):
+        # Les plus anciens en tête : au repos ou, à défaut, au-delà de la borne
+        while tats:
+            oldest_key = next(iter(tats))
+            if tats[oldest_key] <= now or len(tats) > self.max_keys_per_shard:
+                del tats[oldest_key]
+            else:
+                break
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "period": self.period,
+            "clients": sum(len(tats) for _, tats in self._shards),
+            "rejected": self.rejected,
+        }
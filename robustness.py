@@ -0,0 +1,507 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from bars import MINUTE_MS, period_minutes
+from scanner import MIN_BARS, RSI_BUY_MAX, RSI_SELL_MIN
+from xapi.chart_decoder import decode_prices
+
+# Mêmes paramètres que XTBTradingBot (calculate_indicators, execute_trade)
+SMA_FAST, SMA_SLOW, RSI_PERIOD = 20, 50, 14
+STOP_LOSS = 0.015
+TAKE_PROFIT = 0.02
+RISK = 0.01
+# Bougies d'historique avant une fenêtre : avec MIN_BARS - 1, les indicateurs
+# calculés une fois sur toute la série sont exactement ceux d'un calcul local
+WARMUP = MIN_BARS - 1
+RESAMPLES = 1000
+CHUNK = 100
+CONFIDENCE = 0.95
+
+# Colonnes du processus courant : vues sur le segment partagé (workers) ou tableaux locaux
+_DATA = {}
+_CONFIG = {}
+_SEGMENT = None
+
+
+# -- indicateurs et signaux ----------------------------------------------------
+
+def rolling_mean(values, window):
+    """Équivalent de pandas rolling(window, min_periods=1).mean()"""
+    total = np.cumsum(values, dtype=np.float64)
+    total[window:] = total[window:] - total[:-window]
+    return total / np.minimum(np.arange(1, len(values) + 1), window)
+
+
+def indicators(close):
+    """(SMA20, SMA50, RSI) de calculate_indicators, en NumPy"""
+    close = np.asarray(close, dtype=np.float64)
+    # Première variation : NaN chez pandas, remplacée par 0 dans les gains et les pertes
+    delta = np.diff(close, prepend=close[:1])
+    gain = rolling_mean(np.where(delta > 0, delta, 0.0), RSI_PERIOD)
+    loss = rolling_mean(np.where(delta < 0, -delta, 0.0), RSI_PERIOD)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = 100 - 100 / (1 + gain / loss)
+    rsi[np.isnan(rsi)] = 50.0
+    return rolling_mean(close, SMA_FAST), rolling_mean(close, SMA_SLOW), rsi
+
+
+def signals(close, sma20, sma50, rsi):
+    """+1 (BUY), -1 (SELL) ou 0 par bougie, conditions de check_trading_signals"""
+    buy = (sma20 > sma50) & (close > sma20) & (rsi < RSI_BUY_MAX)
+    sell = (sma20 < sma50) & (close < sma20) & (rsi > RSI_SELL_MIN)
+    return buy.astype(np.int8) - sell.astype(np.int8)
+
+
+def prepare(candles):
+    """Colonnes ctm/high/low/close et indicateurs de toute la série, calculés une seule fois"""
+    close = np.ascontiguousarray(candles['close'], dtype=np.float64)
+    sma20, sma50, rsi = indicators(close)
+    return {
+        "ctm": np.ascontiguousarray(candles['ctm'], dtype=np.int64),
+        "high": np.ascontiguousarray(candles['high'], dtype=np.float64),
+        "low": np.ascontiguousarray(candles['low'], dtype=np.float64),
+        "close": close,
+        "sma20": sma20,
+        "sma50": sma50,
+        "rsi": rsi,
+        "signal": signals(close, sma20, sma50, rsi),
+    }
+
+
+# -- simulation ----------------------------------------------------------------
+
+def _exit(high, low, close, i, end, side, sl, tp):
+    """Première bougie après `i` qui touche le stop ou l'objectif : (indice, prix de sortie)"""
+    j, block = i + 1, 64
+    while j < end:
+        k = min(end, j + block)
+        if side > 0:
+            stop, target = low[j:k] <= sl, high[j:k] >= tp
+        else:
+            stop, target = high[j:k] >= sl, low[j:k] <= tp
+        hits = np.flatnonzero(stop | target)
+        if len(hits):
+            first = hits[0]
+            # Stop et objectif dans la même bougie : l'ordre est inconnu, le stop est retenu
+            return j + first, sl if stop[first] else tp
+        j, block = k, block * 2
+    # Position encore ouverte à la fin de la fenêtre : clôturée au dernier cours
+    return end - 1, close[end - 1]
+
+
+def simulate(high, low, close, signal, begin, end, stop_loss=STOP_LOSS, take_profit=TAKE_PROFIT, risk=RISK,
+             cost=0.0):
+    """Trades de la stratégie sur les bougies [begin, end).
+
+    Comme le bot : une seule position à la fois, ouverte au cours de clôture
+    de la bougie du signal, stop et objectif en pourcentage du prix d'entrée.
+    Le rendement d'un trade est en fraction des fonds propres : une perte au
+    stop coûte `risk` ; `cost` (fraction du prix) couvre spread et frais.
+    Renvoie (entrées, sorties, sens, rendements).
+    """
+    candidates = np.flatnonzero(signal[begin:end - 1]) + begin
+    entries, exits, sides, returns = [], [], [], []
+    k = 0
+    while k < len(candidates):
+        i = int(candidates[k])
+        side = int(signal[i])
+        entry = close[i]
+        if side > 0:
+            sl, tp = entry * (1 - stop_loss), entry * (1 + take_profit)
+        else:
+            sl, tp = entry * (1 + stop_loss), entry * (1 - take_profit)
+        j, price = _exit(high, low, close, i, end, side, sl, tp)
+        entries.append(i)
+        exits.append(j)
+        sides.append(side)
+        returns.append(risk * (side * (price - entry) / entry - cost) / stop_loss)
+        # Position clôturée pendant la bougie j : le cycle de sa clôture peut rouvrir
+        k = int(np.searchsorted(candidates, j))
+    return (np.array(entries, dtype=np.int64), np.array(exits, dtype=np.int64), np.array(sides, dtype=np.int8),
+            np.array(returns, dtype=np.float64))
+
+
+def performance(returns):
+    """(PnL, drawdown maximal) en fraction des fonds propres, rendements composés.
+
+    `returns` : une séquence de trades, ou une par ligne (tableau 2D).
+    """
+    returns = np.asarray(returns, dtype=np.float64)
+    if returns.shape[-1] == 0:
+        zeros = np.zeros(returns.shape[:-1])
+        return zeros, zeros
+    equity = np.cumprod(1 + returns, axis=-1)
+    peak = np.maximum.accumulate(np.maximum(equity, 1.0), axis=-1)
+    return equity[..., -1] - 1, np.max(1 - equity / peak, axis=-1)
+
+
+# -- fenêtres walk-forward -----------------------------------------------------
+
+def walk_forward_splits(n, train, test, step=None, anchored=False):
+    """(début train, fin train, début test, fin test) ; le test suit toujours son train"""
+    step = step or test
+    splits = []
+    start = 0
+    while start + train + test <= n:
+        splits.append((0 if anchored else start, start + train, start + train, start + train + test))
+        start += step
+    return splits
+
+
+def _window(begin, end):
+    """Colonnes de la fenêtre [begin, end) avec son historique d'échauffement.
+
+    Renvoie (décalage, high, low, close, signal, premier signal possible,
+    indicateurs partagés ?). Les indicateurs précalculés ne sont réutilisés
+    que s'ils sont identiques à ceux d'un calcul sur la seule fenêtre :
+    historique d'au moins MIN_BARS - 1 bougies, ou fenêtre au début de la série.
+    """
+    warmup = _CONFIG.get("warmup", WARMUP)
+    offset = max(0, begin - warmup)
+    high, low, close = (_DATA[name][offset:end] for name in ("high", "low", "close"))
+    shared = offset == 0 or warmup >= WARMUP
+    signal = _DATA["signal"][offset:end] if shared else signals(close, *indicators(close))
+    # check_trading_signals exige MIN_BARS bougies dans l'historique du bot
+    first = max(begin, offset + MIN_BARS - 1)
+    return offset, high, low, close, signal, first - offset, shared
+
+
+def run_split(task):
+    """Une fenêtre walk-forward : choix (stop, objectif) sur le train, évaluation sur le test"""
+    index, (train_start, train_end, test_start, test_end) = task
+    risk, cost = _CONFIG.get("risk", RISK), _CONFIG.get("cost", 0.0)
+    grid = _CONFIG.get("grid") or [(STOP_LOSS, TAKE_PROFIT)]
+
+    offset, high, low, close, signal, first, shared_train = _window(train_start, train_end)
+    best = None
+    for stop_loss, take_profit in grid:
+        returns = simulate(high, low, close, signal, first, train_end - offset, stop_loss, take_profit, risk,
+                           cost)[3]
+        pnl = float(performance(returns)[0])
+        if best is None or pnl > best[0]:
+            best = (pnl, len(returns), stop_loss, take_profit)
+    train_pnl, train_trades, stop_loss, take_profit = best
+
+    offset, high, low, close, signal, first, shared_test = _window(test_start, test_end)
+    returns = simulate(high, low, close, signal, first, test_end - offset, stop_loss, take_profit, risk, cost)[3]
+    pnl, drawdown = performance(returns)
+    return {
+        "split": index,
+        "train": [train_start, train_end],
+        "test": [test_start, test_end],
+        "stop_loss": stop_loss,
+        "take_profit": take_profit,
+        "train_trades": train_trades,
+        "train_pnl_pct": train_pnl * 100,
+        "test_trades": len(returns),
+        "test_pnl_pct": float(pnl) * 100,
+        "test_drawdown_pct": float(drawdown) * 100,
+        "shared_indicators": shared_train + shared_test,
+        "returns": returns,
+    }
+
+
+def run_bootstrap(task):
+    """`size` rééchantillonnages de la séquence de trades : (PnL, drawdown) de chacun.
+
+    Tirage avec remise par blocs de `block` trades consécutifs (block=1 :
+    tirage indépendant). La graine dépend du numéro de paquet seulement :
+    le résultat ne dépend pas du nombre de workers.
+    """
+    seed, chunk, size, block, returns = task
+    rng = np.random.default_rng([seed, chunk])
+    n = len(returns)
+    block = max(1, min(block, n))
+    if block == 1:
+        index = rng.integers(0, n, (size, n))
+    else:
+        starts = rng.integers(0, n - block + 1, (size, -(-n // block)))
+        index = (starts[:, :, None] + np.arange(block)).reshape(size, -1)[:, :n]
+    return performance(returns[index])
+
+
+# -- mémoire partagée et répartition -------------------------------------------
+
+class SharedColumns:
+    """Colonnes NumPy copiées une fois dans un segment multiprocessing.shared_memory.
+
+    Les workers s'y attachent par son nom et lisent des vues sans copie :
+    bougies et indicateurs ne sont ni sérialisés ni dupliqués par processus.
+    """
+
+    def __init__(self, columns):
+        self.layout = []
+        offset = 0
+        for name, values in columns.items():
+            self.layout.append((name, values.dtype.str, len(values), offset))
+            offset += -(-values.nbytes // 64) * 64  # colonnes alignées sur 64 octets
+        self.segment = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        self.arrays = self.views(self.segment.buf, self.layout)
+        for name, values in columns.items():
+            self.arrays[name][:] = values
+
+    @property
+    def name(self):
+        return self.segment.name
+
+    @property
+    def nbytes(self):
+        return self.segment.size
+
+    @staticmethod
+    def views(buffer, layout):
+        return {name: np.ndarray(length, dtype=dtype, buffer=buffer, offset=offset)
+                for name, dtype, length, offset in layout}
+
+    def close(self):
+        # Les vues doivent disparaître avant la fermeture du segment
+        self.arrays = {}
+        _DATA.clear()
+        self.segment.close()
+        self.segment.unlink()
+
+
+def _attach(name, layout, config):
+    """Initialisation d'un worker : vues sur le segment partagé"""
+    global _SEGMENT
+    _SEGMENT = shared_memory.SharedMemory(name=name)
+    _DATA.clear()
+    _DATA.update(SharedColumns.views(_SEGMENT.buf, layout))
+    _CONFIG.clear()
+    _CONFIG.update(config)
+
+
+def chunksize(tasks, workers):
+    """Tâches envoyées ensemble à un worker : ~4 paquets par worker pour l'équilibrage"""
+    return max(1, tasks // (workers * 4))
+
+
+def interval(values, confidence):
+    values = np.asarray(values) * 100
+    tail = (1 - confidence) / 2 * 100
+    low, median, high = np.percentile(values, [tail, 50, 100 - tail])
+    return {"low": float(low), "median": float(median), "high": float(high), "mean": float(values.mean())}
+
+
+def _analyze(shared, train, test, step=None, anchored=False, grid=None, resamples=RESAMPLES, block=1, chunk=CHUNK,
+             workers=None, seed=0, confidence=CONFIDENCE, warmup=WARMUP, risk=RISK, cost=0.0):
+    workers = workers or os.cpu_count() or 1
+    config = {"grid": grid, "warmup": warmup, "risk": risk, "cost": cost}
+    n = len(shared.arrays["close"])
+    splits = list(enumerate(walk_forward_splits(n, train, test, step, anchored)))
+    if not splits:
+        raise ValueError(f"{n} bougies : pas assez pour une fenêtre train={train} test={test}")
+
+    started = time.perf_counter()
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_attach,
+                                   initargs=(shared.name, shared.layout, config))
+        run = lambda fn, tasks: pool.map(fn, tasks, chunksize=chunksize(len(tasks), workers))  # noqa: E731
+    else:
+        _DATA.clear()
+        _DATA.update(shared.arrays)
+        _CONFIG.clear()
+        _CONFIG.update(config)
+        run = map
+    try:
+        results = list(run(run_split, splits))
+        walk_forward_s = time.perf_counter() - started
+
+        # Séquence hors échantillon : les trades des fenêtres de test, dans l'ordre
+        returns = np.concatenate([r.pop("returns") for r in results])
+        tasks = [(seed, i, min(chunk, resamples - i * chunk), block, returns)
+                 for i in range(-(-resamples // chunk))] if len(returns) else []
+        samples = list(run(run_bootstrap, tasks))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    wall_s = time.perf_counter() - started
+
+    pnl, drawdown = performance(returns)
+    report = {
+        "bars": n,
+        "workers": workers,
+        "walk_forward": {
+            "splits": len(results),
+            "train": train,
+            "test": test,
+            "step": step or test,
+            "anchored": anchored,
+            "trades": len(returns),
+            "win_rate": float((returns > 0).mean()) if len(returns) else None,
+            "pnl_pct": float(pnl) * 100,
+            "max_drawdown_pct": float(drawdown) * 100,
+            "profitable_splits": sum(r["test_pnl_pct"] > 0 for r in results),
+        },
+        "indicators": {"shared": sum(r["shared_indicators"] for r in results),
+                       "recomputed": 2 * len(results) - sum(r["shared_indicators"] for r in results)},
+        "splits": results,
+        "timings": {"walk_forward_s": walk_forward_s, "bootstrap_s": wall_s - walk_forward_s, "wall_s": wall_s},
+    }
+    if samples:
+        pnls = np.concatenate([s[0] for s in samples])
+        drawdowns = np.concatenate([s[1] for s in samples])
+        report["bootstrap"] = {
+            "resamples": len(pnls),
+            "block": block,
+            "chunk": chunk,
+            "confidence": confidence,
+            "pnl_pct": interval(pnls, confidence),
+            "max_drawdown_pct": interval(drawdowns, confidence),
+            "loss_probability": float((pnls < 0).mean()),
+        }
+    return report
+
+
+def analyze(candles, train, test, **options):
+    """Walk-forward puis bootstrap des trades hors échantillon, répartis sur `workers` processus.
+
+    `candles` : colonnes ctm/high/low/close (chronologiques). Les bougies et
+    les indicateurs sont placés une fois en mémoire partagée pour tous les
+    workers. Renvoie un rapport avec les intervalles de confiance du PnL et
+    du drawdown maximal.
+    """
+    started = time.perf_counter()
+    shared = SharedColumns(prepare(candles))
+    prepare_s = time.perf_counter() - started
+    try:
+        report = _analyze(shared, train, test, **options)
+    finally:
+        shared.close()
+    report["timings"]["prepare_s"] = prepare_s
+    report["shared_bytes"] = shared.nbytes
+    return report
+
+
+def scaling(candles, train, test, workers=(1, 2, 4), **options):
+    """Même analyse pour chaque nombre de workers : (rapport, temps, accélération, efficacité).
+
+    Les résultats doivent être identiques quel que soit le nombre de workers
+    (paquets de bootstrap à graine fixe) ; l'écart est signalé par `consistent`.
+    """
+    shared = SharedColumns(prepare(candles))
+    rows = []
+    report = None
+    try:
+        for count in workers:
+            current = _analyze(shared, train, test, workers=count, **options)
+            rows.append({"workers": count, "wall_s": current["timings"]["wall_s"],
+                         "consistent": report is None or _comparable(current) == _comparable(report)})
+            report = report or current
+    finally:
+        shared.close()
+    base = rows[0]["wall_s"] * rows[0]["workers"]
+    for row in rows:
+        row["speedup"] = base / row["wall_s"]
+        row["efficiency"] = row["speedup"] / row["workers"]
+    report["scaling"] = rows
+    report["cpu_count"] = os.cpu_count()
+    return report
+
+
+def _comparable(report):
+    return {key: value for key, value in report.items() if key not in ("timings", "workers")}
+
+
+# -- données -------------------------------------------------------------------
+
+def load_csv(path):
+    """Bougies d'un CSV : colonnes open/high/low/close et ctm (ms) ou timestamp"""
+    import pandas as pd  # import différé : seul ce chemin en a besoin
+    df = pd.read_csv(path)
+    if 'ctm' in df:
+        ctm = df['ctm'].to_numpy(dtype=np.int64)
+    else:
+        timestamps = df['timestamp']
+        if pd.api.types.is_numeric_dtype(timestamps):
+            ctm = timestamps.to_numpy(dtype=np.int64)
+        else:
+            ctm = pd.to_datetime(timestamps, utc=True).astype('int64').to_numpy() // 1_000_000
+    order = np.argsort(ctm, kind='stable')
+    candles = {name: df[name].to_numpy(dtype=np.float64)[order] for name in ('open', 'high', 'low', 'close')}
+    candles['ctm'] = ctm[order]
+    return candles
+
+
+def fetch_candles(symbol, timeframe, days):
+    """Bougies des `days` derniers jours chez le broker (identifiants XTB_USER_ID / XTB_PASSWORD)"""
+    from xapi.client import Client
+    end = int(time.time() * 1000)
+    client = Client()
+    client.connect()
+    try:
+        response = client.login(os.getenv('XTB_USER_ID'), os.getenv('XTB_PASSWORD'))
+        if not response.get('status'):
+            raise RuntimeError(f"Échec de connexion: {response}")
+        response = client.commandExecute('getChartRangeRequest', {"info": {
+            "symbol": symbol, "period": period_minutes(timeframe), "start": end - days * 1440 * MINUTE_MS,
+            "end": end}})
+    finally:
+        client.disconnect()
+    data = (response or {}).get('returnData') or {}
+    if not len(data.get('rateInfos') or ()):
+        raise RuntimeError(f"Pas de bougies pour {symbol}: {response}")
+    # Même décodage que l'historique du bot
+    return decode_prices(data['rateInfos'], data.get('digits', 5))
+
+
+def parse_grid(values):
+    """'0.01:0.02' -> (0.01, 0.02) : stop et objectif en fraction du prix d'entrée"""
+    grid = []
+    for value in values or ():
+        stop_loss, take_profit = value.split(':')
+        grid.append((float(stop_loss), float(take_profit)))
+    return grid or None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Robustesse de la stratégie : walk-forward et bootstrap des trades")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--csv', help="bougies (open, high, low, close, ctm ou timestamp)")
+    source.add_argument('--symbol', help="bougies téléchargées chez le broker")
+    parser.add_argument('--timeframe', default='1h', help="timeframe (avec --symbol)")
+    parser.add_argument('--days', type=int, default=365, help="jours d'historique (avec --symbol)")
+    parser.add_argument('--train', type=int, default=2000, help="bougies par fenêtre d'optimisation")
+    parser.add_argument('--test', type=int, default=500, help="bougies par fenêtre de test")
+    parser.add_argument('--step', type=int, help="décalage entre fenêtres (défaut : --test)")
+    parser.add_argument('--anchored', action='store_true', help="fenêtres d'optimisation depuis le début")
+    parser.add_argument('--grid', action='append', help="STOP:OBJECTIF à essayer sur le train (répétable)")
+    parser.add_argument('--resamples', type=int, default=RESAMPLES)
+    parser.add_argument('--block', type=int, default=1, help="trades consécutifs par bloc tiré")
+    parser.add_argument('--chunk', type=int, default=CHUNK, help="rééchantillonnages par tâche")
+    parser.add_argument('--workers', type=int, help="processus (défaut : nombre de cœurs)")
+    parser.add_argument('--scaling', help="nombres de workers à comparer, ex. 1,2,4")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--confidence', type=float, default=CONFIDENCE)
+    parser.add_argument('--cost', type=float, default=0.0, help="spread et frais, fraction du prix")
+    parser.add_argument('--splits', action='store_true', help="détail de chaque fenêtre")
+    args = parser.parse_args(argv)
+
+    if args.csv:
+        candles = load_csv(args.csv)
+    else:
+        from dotenv import load_dotenv
+        load_dotenv()
+        candles = fetch_candles(args.symbol, args.timeframe, args.days)
+    options = dict(step=args.step, anchored=args.anchored, grid=parse_grid(args.grid), resamples=args.resamples,
+                   block=args.block, chunk=args.chunk, seed=args.seed, confidence=args.confidence, cost=args.cost)
+    if args.scaling:
+        report = scaling(candles, args.train, args.test, [int(n) for n in args.scaling.split(',')], **options)
+    else:
+        report = analyze(candles, args.train, args.test, workers=args.workers, **options)
+    if not args.splits:
+        report.pop("splits")
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
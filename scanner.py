@@ -0,0 +1,97 @@
+import threading
+
+import numpy as np
+
+# Colonnes de la matrice symboles x indicateurs
+FEATURES = ("close", "SMA20", "SMA50", "RSI", "bars")
+CLOSE, SMA20, SMA50, RSI, BARS = range(len(FEATURES))
+
+# Mêmes seuils que XTBTradingBot.check_trading_signals
+MIN_BARS = 50
+RSI_BUY_MAX = 70.0
+RSI_SELL_MIN = 30.0
+
+
+class SignalScanner:
+    """Filtre BUY/SELL de check_trading_signals appliqué à tous les symboles d'un coup.
+
+    Les dernières valeurs d'indicateurs de chaque symbole occupent une ligne
+    d'une matrice NumPy (ordre Fortran : chaque indicateur est une colonne
+    contiguë). `scan` évalue les conditions sous forme de masques booléens
+    sur toutes les lignes en une passe, puis classe les candidats par force
+    de tendance : écart SMA20/SMA50 plus écart prix/SMA20, en relatif.
+    """
+
+    def __init__(self, symbols=(), capacity=256):
+        self._lock = threading.Lock()
+        self.values = np.full((max(capacity, 1), len(FEATURES)), np.nan, order='F')
+        self.symbols = []
+        self.index = {}
+        self.scans = 0
+        for symbol in symbols:
+            self._row(symbol)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def _row(self, symbol):
+        row = self.index.get(symbol)
+        if row is None:
+            row = len(self.symbols)
+            if row == len(self.values):
+                grown = np.full((2 * len(self.values), len(FEATURES)), np.nan, order='F')
+                grown[:row] = self.values
+                self.values = grown
+            self.symbols.append(symbol)
+            self.index[symbol] = row
+        return row
+
+    def update(self, symbol, close, sma20, sma50, rsi, bars):
+        with self._lock:
+            self.values[self._row(symbol)] = (close, sma20, sma50, rsi, bars)
+
+    def update_frame(self, symbol, df):
+        """Dernière ligne d'un DataFrame issu de calculate_indicators"""
+        last = df.iloc[-1]
+        self.update(symbol, last['close'], last['SMA20'], last['SMA50'], last['RSI'], len(df))
+
+    def update_many(self, symbols, values):
+        """Plusieurs symboles à la fois ; `values` : une ligne par symbole, colonnes FEATURES"""
+        with self._lock:
+            rows = [self._row(symbol) for symbol in symbols]
+            self.values[rows] = values
+
+    def masks(self):
+        """(achat, vente, score) pour les lignes actives"""
+        v = self.values[:len(self.symbols)]
+        close, sma20, sma50, rsi = v[:, CLOSE], v[:, SMA20], v[:, SMA50], v[:, RSI]
+        # NaN (symbole sans valeurs) : toutes les comparaisons sont fausses
+        enough = v[:, BARS] >= MIN_BARS
+        buy = (sma20 > sma50) & (close > sma20) & (rsi < RSI_BUY_MAX) & enough
+        sell = (sma20 < sma50) & (close < sma20) & (rsi > RSI_SELL_MIN) & enough
+        with np.errstate(divide='ignore', invalid='ignore'):
+            score = np.abs(sma20 - sma50) / sma50 + np.abs(close - sma20) / sma20
+        return buy, sell, score
+
+    def scan(self, top=None):
+        """Candidats classés par score décroissant : [(symbole, 'BUY'|'SELL', score)]"""
+        with self._lock:
+            buy, sell, score = self.masks()
+            self.scans += 1
+        rows = np.flatnonzero(buy | sell)
+        if top is not None and top < len(rows):
+            rows = rows[np.argpartition(-score[rows], top - 1)[:top]]
+        rows = rows[np.argsort(-score[rows], kind='stable')]
+        symbols = self.symbols
+        return [(symbols[i], "BUY" if b else "SELL", s)
+                for i, b, s in zip(rows.tolist(), buy[rows].tolist(), score[rows].tolist())]
+
+    def stats(self):
+        buy, sell, _ = self.masks()
+        return {
+            "symbols": len(self.symbols),
+            "capacity": len(self.values),
+            "buy": int(buy.sum()),
+            "sell": int(sell.sum()),
+            "scans": self.scans,
+        }
@@ -0,0 +1,98 @@
+import json
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+# Format binaire compact des instantanés de l'état du bot :
+#   en-tête  <4sHI   magic, version, longueur des métadonnées
+#   métadonnées JSON (utf-8) : état scalaire + description des colonnes
+#   colonnes brutes little-endian, dans l'ordre des métadonnées
+#   CRC32 <I de tout ce qui précède
+MAGIC = b'XTBS'
+VERSION = 1
+HEADER = struct.Struct('<4sHI')
+TRAILER = struct.Struct('<I')
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _column_bytes(typecode, values):
+    data = values if isinstance(values, array) and values.typecode == typecode else array(typecode, values)
+    if sys.byteorder == 'big':
+        data = array(typecode, data)
+        data.byteswap()
+    return data.tobytes()
+
+
+def write_snapshot(path, meta, columns):
+    """Écrit l'instantané de façon atomique : fichier temporaire, fsync, rename, fsync du dossier.
+
+    `columns` : {nom: (typecode array, valeurs)}, toutes de même longueur.
+    """
+    lengths = {len(values) for _, values in columns.values()}
+    if len(lengths) > 1:
+        raise SnapshotError(f"Colonnes de longueurs différentes: {lengths}")
+    meta = dict(meta, columns=[[name, typecode] for name, (typecode, _) in columns.items()],
+                rows=lengths.pop() if lengths else 0)
+    meta_bytes = json.dumps(meta, separators=(',', ':')).encode('utf-8')
+
+    chunks = [HEADER.pack(MAGIC, VERSION, len(meta_bytes)), meta_bytes]
+    chunks.extend(_column_bytes(typecode, values) for typecode, values in columns.values())
+    crc = 0
+    for chunk in chunks:
+        crc = zlib.crc32(chunk, crc)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+        f.write(TRAILER.pack(crc))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    except OSError:
+        # fsync d'un dossier non supporté (Windows, certains montages)
+        pass
+    return sum(len(c) for c in chunks) + TRAILER.size
+
+
+def read_snapshot(path):
+    """Renvoie (métadonnées, {nom: array}) ; SnapshotError si le fichier est incohérent"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < HEADER.size + TRAILER.size:
+        raise SnapshotError("Instantané tronqué")
+    body, (crc,) = data[:-TRAILER.size], TRAILER.unpack(data[-TRAILER.size:])
+    if zlib.crc32(body) != crc:
+        raise SnapshotError("CRC invalide")
+    magic, version, meta_len = HEADER.unpack_from(body)
+    if magic != MAGIC or version != VERSION:
+        raise SnapshotError(f"Format inconnu: {magic!r} v{version}")
+    offset = HEADER.size
+    meta = json.loads(body[offset:offset + meta_len].decode('utf-8'))
+    offset += meta_len
+
+    columns = {}
+    rows = meta['rows']
+    for name, typecode in meta['columns']:
+        column = array(typecode)
+        size = rows * column.itemsize
+        column.frombytes(body[offset:offset + size])
+        if sys.byteorder == 'big':
+            column.byteswap()
+        columns[name] = column
+        offset += size
+    if offset != len(body):
+        raise SnapshotError("Taille des colonnes incohérente")
+    return meta, columns
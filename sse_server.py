@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import threading
+from collections import deque
+
+from aiohttp import web
+
+logger = logging.getLogger('trading_bot')
+
+DEFAULT_MAX_SUBSCRIBERS = 1000
+
+
+class _Client:
+    """File bornée d'un abonné, lue par sa tâche asyncio"""
+
+    def __init__(self, max_queue):
+        self.max_queue = max_queue
+        self.queue = deque()
+        self.closed = False
+        self.dropped = False
+        self._ready = asyncio.Event()
+
+    def put(self, frame):
+        if len(self.queue) >= self.max_queue:
+            self.dropped = True
+            self.close()
+            return False
+        self.queue.append(frame)
+        self._ready.set()
+        return True
+
+    async def get(self, timeout):
+        """Prochaine trame, b'' si rien pendant `timeout`, None si l'abonnement est fermé"""
+        while not self.queue:
+            if self.closed:
+                return None
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return b''
+        return self.queue.popleft()
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+
+class StreamServer:
+    """Flux SSE de l'EventFeed sur un port dédié, servi par une boucle asyncio.
+
+    Sous gunicorn gthread, un abonné de /stream garde un thread du worker pendant
+    toute sa connexion. Ici tous les abonnés d'un worker partagent un thread :
+    le serveur écoute l'EventFeed (un réveil de la boucle par événement), puis
+    recopie la trame dans la file bornée de chaque client ; un client trop lent
+    est coupé, comme dans EventFeed, et reprend avec Last-Event-ID. Le port est
+    ouvert avec SO_REUSEPORT : chaque worker gunicorn l'écoute et le noyau
+    répartit les connexions.
+
+    `authorize(request)` renvoie (autorisé, retry_after), comme GCRALimiter.hit.
+    """
+
+    def __init__(self, feed, port, host='0.0.0.0', max_subscribers=DEFAULT_MAX_SUBSCRIBERS, authorize=None):
+        self.feed = feed
+        self.host = host
+        self.port = port
+        self.max_subscribers = max_subscribers
+        self.authorize = authorize
+        self.clients = set()
+        self.last_id = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.throttled = 0
+        self.dropped = 0
+        self._loop = None
+        self._error = None
+
+    def start(self, timeout=10.0):
+        ready = threading.Event()
+        threading.Thread(target=self._run, args=(ready,), name='sse-server', daemon=True).start()
+        if not ready.wait(timeout):
+            raise RuntimeError("Serveur SSE non démarré")
+        if self._error:
+            raise self._error
+        return self
+
+    def _run(self, ready):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        app = web.Application()
+        app.router.add_get('/stream', self.handle)
+        runner = web.AppRunner(app, handle_signals=False, access_log=None)
+        try:
+            loop.run_until_complete(runner.setup())
+            site = web.TCPSite(runner, self.host, self.port, reuse_port=True)
+            loop.run_until_complete(site.start())
+            # Port 0 : celui choisi par le système
+            self.port = runner.addresses[0][1]
+        except Exception as e:
+            self._error = e
+            ready.set()
+            loop.close()
+            return
+        self._loop = loop
+        self.feed.listeners.append(self._on_event)
+        # Événements publiés avant l'écoute : rejouables depuis l'historique
+        history = self.feed.since(0)
+        self.last_id = history[-1][0] if history else 0
+        logger.info(f"Flux SSE asynchrone sur le port {self.port}")
+        ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            for client in self.clients:
+                client.close()
+            loop.run_until_complete(runner.cleanup())
+            loop.close()
+
+    def _on_event(self, event_id, frame):
+        # Thread émetteur : la diffusion elle-même se fait dans la boucle
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._dispatch, event_id, frame)
+
+    def _dispatch(self, event_id, frame):
+        self.last_id = event_id
+        for client in list(self.clients):
+            if not client.put(frame):
+                self.clients.discard(client)
+                self.dropped += 1
+
+    async def handle(self, request):
+        if self.authorize is not None:
+            allowed, retry_after = self.authorize(request)
+            if not allowed:
+                self.throttled += 1
+                return web.json_response({"error": "Rate limit exceeded", "retry_after": retry_after}, status=429,
+                                         headers={"Retry-After": str(max(1, int(retry_after + 0.999)))})
+        if len(self.clients) >= self.max_subscribers:
+            self.rejected += 1
+            return web.json_response({"error": "Trop d'abonnés au flux", "max_subscribers": self.max_subscribers},
+                                     status=503, headers={"Retry-After": "5"})
+        last_event_id = request.headers.get("Last-Event-ID") or request.query.get("last_event_id")
+        try:
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            last_event_id = None
+
+        client = _Client(self.feed.max_queue)
+        if last_event_id is not None:
+            # Jusqu'au dernier événement diffusé : les suivants arrivent par _dispatch
+            client.queue.extend(self.feed.frames_since(last_event_id, self.last_id))
+        self.clients.add(client)
+        self.accepted += 1
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache",
+                                               "X-Accel-Buffering": "no"})
+        try:
+            await response.prepare(request)
+            await response.write(b"retry: 5000\n\n")
+            while True:
+                frame = await client.get(self.feed.keepalive)
+                if frame is None:
+                    break
+                await response.write(frame or b": keep-alive\n\n")
+        except (ConnectionError, RuntimeError):
+            # Client parti : l'écriture échoue sur le transport fermé
+            pass
+        finally:
+            client.close()
+            self.clients.discard(client)
+        return response
+
+    def stop(self):
+        loop, self._loop = self._loop, None
+        if self._on_event in self.feed.listeners:
+            self.feed.listeners.remove(self._on_event)
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+
+    def stats(self):
+        return {
+            "port": self.port,
+            "subscribers": len(self.clients),
+            "max_subscribers": self.max_subscribers,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "throttled": self.throttled,
+            "dropped_subscribers": self.dropped,
+            "last_id": self.last_id,
+        }
@@ -1,18 +1,20 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
 import os
 import logging
 import time
-from bot_cloud import XTBTradingBot
 from threading import Thread, Lock
-import google.cloud.logging
 from functools import wraps
-from apscheduler.schedulers.background import BackgroundScheduler
+from rate_limiter import GCRALimiter
+from event_feed import EventFeed
+from bar_scheduler import BarCloseScheduler
+from bars import timeframe_name
+from xapi.clock import ServerClock
+from analytics import AnalyticsStore, day_start_ms
+from leader import EventRelay, LeaderElection, LeaderServer, SharedState, StatePublisher, call_leader
 import datetime
 
-# Configuration du logging
-client = google.cloud.logging.Client()
-client.setup_logging()
+# Configuration du logging (Cloud Logging est branché en arrière-plan, cf. warm_up)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('trading_bot')
 
@@ -24,11 +26,55 @@ bot_lock = Lock()
 bot = None
 bot_status = {
     "is_running": False,
-    "last_check": None,
-    "last_request_time": 0,
-    "request_count": 0
+    "last_check": None
 }
 
+# Flux poussé (SSE) des indicateurs, signaux et ordres produits par le thread de trading.
+# Sous gunicorn gthread, chaque abonné de /stream occupe un thread du worker pendant
+# toute sa connexion : le plafond reste sous le nombre de threads (GUNICORN_THREADS)
+# pour que /ready, /status et /metrics soient toujours servis. Pour des centaines
+# d'abonnés, SSE_PORT ouvre le même flux sur un port dédié servi par une boucle
+# asyncio (sse_server.py) : un seul thread par worker, SSE_ASYNC_MAX_SUBSCRIBERS abonnés.
+HTTP_THREADS = int(os.getenv('GUNICORN_THREADS', 8))
+event_feed = EventFeed(max_subscribers=int(os.getenv('SSE_MAX_SUBSCRIBERS', max(1, HTTP_THREADS // 2))))
+SSE_PORT = os.getenv('SSE_PORT')
+stream_server = None
+
+# Cycle de stratégie calé sur les clôtures de bougies, en heure serveur. Par défaut,
+# seul le timeframe du bot réveille le thread ; les timeframes ajoutés dans
+# BAR_TIMEFRAMES ne font que clôturer leurs bougies, la stratégie n'est évaluée
+# qu'aux clôtures de STRATEGY_TIMEFRAME.
+STRATEGY_TIMEFRAME = timeframe_name('1h')
+server_clock = ServerClock()
+bar_scheduler = BarCloseScheduler(os.getenv('BAR_TIMEFRAMES', STRATEGY_TIMEFRAME).split(','), server_clock)
+# Ordre de test au démarrage : un vrai ordre, envoyé seulement sur demande explicite
+# (sinon /test_trade) et une seule fois par instantané
+FORCE_TEST_ORDER = os.getenv('FORCE_TEST_ORDER', '0') == '1'
+# Évaluation manquée (connexion perdue, échec) : nouvel essai sans attendre la clôture suivante
+STRATEGY_RETRY_DELAYS = (5, 10, 30, 60)
+# Réveil au plus tard toutes les CLOCK_CHECK_INTERVAL secondes pour resynchroniser l'horloge
+CLOCK_CHECK_INTERVAL = 60
+
+# Historique des trades et signaux : le bot du leader écrit dans ce magasin (passé au bot),
+# chaque worker lit la base directement
+analytics = AnalyticsStore(os.getenv('ANALYTICS_DB', 'analytics.db'))
+DAY_MS = 24 * 3600 * 1000
+
+# Plusieurs workers HTTP, un seul leader (élu par verrou de fichier) qui trade et
+# parle au broker ; les autres servent l'état qu'il publie (cf. leader.py).
+# election = None : processus unique (python start.py), il fait tout.
+election = None
+shared_state = SharedState()
+state_publisher = None
+event_relay = None
+leader_server = None
+leader_routes = {}
+# Au-delà, l'état publié est trop ancien : leader mort ou bloqué
+STATE_MAX_AGE = 10.0
+
+def is_leader():
+    return election is None or election.is_leader
+
 def sync_position_status():
     """Synchronise l'état interne du bot avec l'état réel du compte"""
     global bot
@@ -40,30 +86,81 @@ def sync_position_status():
                 logger.warning(f"Incohérence de statut de position détectée et corrigée. Réel: {actual_status}, Interne au bot: {bot.position_open}")
                 bot.position_open = actual_status
 
-# Configuration des limites de taux
-RATE_LIMIT = 30  # requêtes par minute
-RATE_WINDOW = 60  # fenêtre de 60 secondes
+# Configuration des limites de taux : (requêtes, fenêtre en secondes) par budget,
+# surchargeable par RATE_LIMIT_<BUDGET>="requêtes/secondes" (ex. RATE_LIMIT_DEBUG="6/60").
+# Les compteurs sont propres à chaque processus : avec WEB_CONCURRENCY workers
+# gunicorn, un client peut obtenir jusqu'à WEB_CONCURRENCY fois le budget configuré.
+RATE_LIMITS = {
+    "default": (30, 60),
+    "debug": (6, 60),  # /debug et /logs interrogent le broker à chaque appel
+    "logs": (6, 60),
+    "trade": (3, 60),
+    "stream": (10, 60),  # ouvertures de connexion /stream
+}
+
+def _load_rate_limits():
+    limits = {}
+    for budget, (limit, period) in RATE_LIMITS.items():
+        override = os.getenv(f"RATE_LIMIT_{budget.upper()}")
+        if override:
+            try:
+                limits[budget] = GCRALimiter(*(float(v) for v in override.split("/")))
+                continue
+            except (TypeError, ValueError) as e:
+                logger.error(f"RATE_LIMIT_{budget.upper()}={override} ignorée ({str(e)}), limite par défaut {limit}/{period}")
+        limits[budget] = GCRALimiter(limit, period)
+    return limits
+
+rate_limiters = _load_rate_limits()
+
+def _env_set(name):
+    return {value.strip() for value in os.getenv(name, '').split(',') if value.strip()}
+
+# Les en-têtes viennent du client : seules les clés configurées ont leur propre budget
+# (API_KEYS), celles de RATE_LIMIT_EXEMPT_KEYS (supervision, tests de charge) n'en ont
+# pas. Une autre clé est ignorée, le client est alors identifié par son IP.
+API_KEYS = _env_set('API_KEYS')
+RATE_LIMIT_EXEMPT_KEYS = _env_set('RATE_LIMIT_EXEMPT_KEYS')
+# Nombre de proxys de confiance devant l'application (1 sous Cloud Run, cf. Dockerfile) :
+# l'IP du client est l'entrée de X-Forwarded-For ajoutée par le plus éloigné d'entre eux,
+# les entrées à sa gauche sont fournies par le client. 0 : l'adresse de la connexion.
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', 0))
+
+def client_identity(headers, remote_addr):
+    """Identifie le client : clé d'API connue, sinon IP vue par le proxy de confiance"""
+    api_key = headers.get("X-API-Key")
+    if api_key and (api_key in API_KEYS or api_key in RATE_LIMIT_EXEMPT_KEYS):
+        return "key:" + api_key
+    if TRUSTED_PROXY_HOPS:
+        hops = [hop.strip() for hop in headers.get("X-Forwarded-For", "").split(",") if hop.strip()]
+        if len(hops) >= TRUSTED_PROXY_HOPS:
+            return "ip:" + hops[-TRUSTED_PROXY_HOPS]
+    return "ip:" + (remote_addr or "unknown")
+
+def client_key():
+    return client_identity(request.headers, request.remote_addr)
 
-def rate_limit():
+def check_rate_limit(budget, key):
+    """(autorisé, retry_after) ; les clés exemptées ne consomment aucun budget"""
+    if key.startswith("key:") and key[len("key:"):] in RATE_LIMIT_EXEMPT_KEYS:
+        return True, 0.0
+    return rate_limiters[budget].hit(key)
+
+def rate_limit(budget="default"):
     def decorator(f):
         @wraps(f)
         def wrapped(*args, **kwargs):
-            current_time = time.time()
-            with bot_lock:
-                # Réinitialise le compteur si la fenêtre est passée
-                if current_time - bot_status["last_request_time"] > RATE_WINDOW:
-                    bot_status["request_count"] = 0
-                    bot_status["last_request_time"] = current_time
-                
-                # Vérifie la limite de taux
-                if bot_status["request_count"] >= RATE_LIMIT:
-                    logger.warning("Limite de taux dépassée")
-                    return jsonify({
-                        "error": "Rate limit exceeded",
-                        "retry_after": RATE_WINDOW - (current_time - bot_status["last_request_time"])
-                    }), 429
-                
-                bot_status["request_count"] += 1
+            # Ne prend pas bot_lock : le limiteur a ses propres verrous
+            key = client_key()
+            allowed, retry_after = check_rate_limit(budget, key)
+            if not allowed:
+                logger.warning(f"Limite de taux dépassée ({budget}) pour {key}")
+                response = jsonify({
+                    "error": "Rate limit exceeded",
+                    "retry_after": retry_after
+                })
+                response.headers["Retry-After"] = str(max(1, int(retry_after + 0.999)))
+                return response, 429
             return f(*args, **kwargs)
         return wrapped
     return decorator
@@ -80,7 +177,13 @@ def init_bot_if_needed():
                 logger.error("Identifiants XTB manquants")
                 return False
                 
-            bot = XTBTradingBot(symbol='EURUSD', timeframe='1h')
+            from bot_cloud import XTBTradingBot
+            bot = XTBTradingBot(symbol='EURUSD', timeframe=STRATEGY_TIMEFRAME, analytics=analytics)
+            bot.event_listeners.append(event_feed.publish)
+            if state_publisher:
+                bot.event_listeners.append(state_publisher.notify)
+            # Reprise à chaud : bougies, indicateurs et ordres du processus précédent
+            bot.load_snapshot()
             if not bot.connect():
                 logger.error("Échec de la connexion initiale")
                 return False
@@ -95,30 +198,266 @@ def init_bot_if_needed():
 def run_trading_thread():
     logger.info("Démarrage du thread de trading")
     first_run = True
+    strategy_due = True
+    retries = 0
     while True:
         try:
             with bot_lock:
                 if bot and bot.check_connection():
-                    # Force un ordre uniquement au premier passage pour tester
-                    if first_run:
-                        logger.info("⚠️ ORDRE DE TEST FORCÉ")
-                        bot.execute_trade("BUY")
+                    # Force un ordre uniquement au premier passage pour tester, si demandé
+                    if first_run and FORCE_TEST_ORDER:
+                        if bot.test_trade_done:
+                            logger.info("Reprise à chaud : ordre de test déjà envoyé, pas de nouvel envoi")
+                        else:
+                            logger.info("⚠️ ORDRE DE TEST FORCÉ")
+                            # Noté avant l'envoi : un leader remplacé pendant l'ordre ne le renvoie pas
+                            bot.test_trade_done = True
+                            bot.save_snapshot(force=True)
+                            bot.execute_trade("BUY")
                         first_run = False
-                    else:
-                        success = bot.run_strategy()
-                        if not success:
+                    elif strategy_due:
+                        if bot.run_strategy():
+                            strategy_due = False
+                            retries = 0
+                        else:
                             logger.warning("Échec de l'exécution de la stratégie")
+                        bot.save_snapshot()
                 else:
                     if init_bot_if_needed():
                         logger.info("Bot réinitialisé avec succès")
                     else:
                         logger.error("Échec de la réinitialisation")
                         time.sleep(30)
-            time.sleep(60)
+                if bot and bot.client and server_clock.due():
+                    server_clock.sync(bot.client)
+            # L'évaluation reste due jusqu'à un passage réussi de la stratégie
+            if strategy_due:
+                timeout = STRATEGY_RETRY_DELAYS[min(retries, len(STRATEGY_RETRY_DELAYS) - 1)]
+                retries += 1
+            else:
+                timeout = CLOCK_CHECK_INTERVAL
+            woke = bar_scheduler.wait(timeout)
+            if woke is None:
+                return
+            close, timeframes = woke
+            if close is None:
+                continue
+            strategy_due = strategy_due or STRATEGY_TIMEFRAME in timeframes
+            logger.info(f"Clôture {'/'.join(timeframes)} à {close} (heure serveur)")
+            with bot_lock:
+                if bot:
+                    # Bougies sans tick depuis leur ouverture : clôturées par l'horloge
+                    bot.bars.flush(close)
         except Exception as e:
             logger.error(f"Erreur dans le thread de trading: {str(e)}")
             time.sleep(10)
 
+# Démarrage : le port HTTP est ouvert tout de suite, les imports lourds, la
+# connexion au broker et le préchargement de l'historique se font en arrière-plan
+startup_lock = Lock()
+startup_state = {
+    "started": False,
+    "ready": False,
+    "error": None,
+    "began_at": time.time(),
+    "stages": {}
+}
+
+def setup_cloud_logging():
+    try:
+        import google.cloud.logging
+        client = google.cloud.logging.Client()
+        client.setup_logging()
+        return True
+    except Exception:
+        # Hors GCP (benchmarks, exécution locale) : pas d'identifiants Cloud Logging
+        return False
+
+def import_heavy_modules():
+    import pandas  # noqa: F401
+    import bot_cloud  # noqa: F401
+
+def login_bot():
+    with bot_lock:
+        if not init_bot_if_needed():
+            raise RuntimeError("Échec de la connexion initiale")
+        return {"restored": bot.restored}
+
+def warm_history():
+    with bot_lock:
+        df = bot.get_historical_data() if bot else None
+        return len(df) if df is not None else 0
+
+def bot_history():
+    """Historique pour les routes de diagnostic, à appeler sous bot_lock.
+
+    Copie de l'historique tenu par le thread de trading : la route ne le
+    modifie pas et n'interroge le broker que s'il n'y en a pas encore.
+    """
+    df = bot.history if bot.history is not None and len(bot.history) else bot.get_historical_data()
+    return None if df is None else df.copy()
+
+def start_trading():
+    from apscheduler.schedulers.background import BackgroundScheduler
+    trading_thread = Thread(target=run_trading_thread, daemon=True)
+    trading_thread.start()
+    logger.info("Thread de trading démarré avec succès")
+    # Démarrer le planificateur pour synchroniser régulièrement l'état des positions
+    scheduler = BackgroundScheduler()
+    scheduler.add_job(sync_position_status, 'interval', minutes=5)
+    scheduler.start()
+    logger.info("Planificateur de synchronisation démarré")
+
+def run_stage(name, stage):
+    t0 = time.time()
+    try:
+        result = stage()
+        startup_state["stages"][name] = {"seconds": round(time.time() - t0, 3), "result": result}
+        return True
+    except Exception as e:
+        logger.error(f"Échec de l'étape de démarrage {name}: {str(e)}")
+        startup_state["stages"][name] = {"seconds": round(time.time() - t0, 3), "error": str(e)}
+        startup_state["error"] = f"{name}: {str(e)}"
+        return False
+
+def warm_up(with_trading=False):
+    # Cloud Logging (découverte des identifiants) en parallèle : n'entre pas dans la disponibilité
+    Thread(target=run_stage, args=("cloud_logging", setup_cloud_logging), daemon=True).start()
+    stages = [
+        ("imports", import_heavy_modules),
+        ("broker_login", login_bot),
+        ("history_warmup", warm_history),
+    ]
+    if with_trading:
+        stages.append(("trading_thread", start_trading))
+    for name, stage in stages:
+        if not run_stage(name, stage):
+            return
+    startup_state["ready"] = True
+    logger.info(f"Service prêt en {time.time() - startup_state['began_at']:.2f}s")
+
+def leader_only(f):
+    """Route qui utilise le bot : exécutée par le leader, transmise par IPC depuis un follower"""
+    leader_routes[f.__name__] = f
+
+    @wraps(f)
+    def wrapped(*args, **kwargs):
+        if is_leader():
+            return f(*args, **kwargs)
+        try:
+            body, code = call_leader("route", name=f.__name__)
+        except Exception as e:
+            logger.error(f"Leader injoignable pour {f.__name__}: {str(e)}")
+            return jsonify({"error": "Leader indisponible", "detail": str(e)}), 503
+        return jsonify(body), code
+    return wrapped
+
+def run_leader_route(name):
+    """Côté leader : exécute une route transmise par un follower"""
+    with app.app_context():
+        response = app.make_response(leader_routes[name]())
+        return response.get_json(), response.status_code
+
+def status_snapshot():
+    """Statut publié pour les followers, sans requête au broker"""
+    return {
+        "status": "connected" if bot and bot.client else "disconnected",
+        "bot_initialized": bot is not None,
+        "is_running": bot_status["is_running"],
+        "last_check": bot_status.get("last_check"),
+        "account_info": bot.account.snapshot() if bot and bot.account.ready else None
+    }
+
+def leader_metrics():
+    client = bot.client if bot else None
+    return {
+        "command_scheduler": client.scheduler_stats() if client else None,
+        "bar_scheduler": bar_scheduler.stats(),
+        "recorder": client.recorder.stats() if client and client.recorder else None,
+        "journal": bot.journal.stats() if bot else None,
+        "account": bot.account.stats() if bot else None,
+        "analytics": analytics.stats()
+    }
+
+def build_shared_state():
+    return {
+        "leader_pid": os.getpid(),
+        "startup": {"ready": startup_state["ready"], "error": startup_state["error"],
+                    "stages": startup_state["stages"]},
+        "status": status_snapshot(),
+        "metrics": dict(leader_metrics(), leader_ipc=leader_server.stats() if leader_server else None),
+        "events": event_feed.since(0)
+    }
+
+def become_leader():
+    global state_publisher, leader_server
+    if event_relay:
+        event_relay.stop()
+    leader_server = LeaderServer({"route": run_leader_route}).start()
+    state_publisher = StatePublisher(shared_state, build_shared_state).start()
+    start_background_startup(with_trading=True)
+
+def authorize_stream(stream_request):
+    """Budget `stream` pour le serveur SSE asynchrone (requête aiohttp)"""
+    return check_rate_limit("stream", client_identity(stream_request.headers, stream_request.remote))
+
+def start_stream_server(port=None, host='0.0.0.0'):
+    """Flux SSE asynchrone du worker (SSE_PORT), sur le même EventFeed que /stream"""
+    global stream_server
+    port = port if port is not None else SSE_PORT
+    if not port or stream_server is not None:
+        return stream_server
+    from sse_server import DEFAULT_MAX_SUBSCRIBERS, StreamServer
+    try:
+        stream_server = StreamServer(event_feed, int(port), host=host, authorize=authorize_stream,
+                                     max_subscribers=int(os.getenv('SSE_ASYNC_MAX_SUBSCRIBERS',
+                                                                   DEFAULT_MAX_SUBSCRIBERS))).start()
+    except Exception as e:
+        logger.error(f"Serveur SSE asynchrone indisponible: {str(e)}")
+    return stream_server
+
+def start_worker():
+    """Worker gunicorn : candidat à l'élection, follower en attendant"""
+    global election, event_relay
+    start_stream_server()
+    if os.getenv('LEADER_ELECTION', '1') == '0':
+        start_background_startup()
+        return
+    election = LeaderElection()
+    event_relay = EventRelay(shared_state, event_feed).start()
+    election.campaign(become_leader)
+
+def start_background_startup(with_trading=False):
+    with startup_lock:
+        if startup_state["started"]:
+            return
+        startup_state["started"] = True
+    Thread(target=warm_up, args=(with_trading,), name="startup", daemon=True).start()
+
+@app.route("/ready")
+def ready():
+    """Sonde de disponibilité : 200 une fois le broker connecté et l'historique préchargé"""
+    if not is_leader():
+        # Follower : prêt si le leader l'est et publie encore
+        state = shared_state.read()
+        age = shared_state.age()
+        is_ready = bool(state and state["startup"]["ready"] and age < STATE_MAX_AGE)
+        body = {
+            "ready": is_ready,
+            "leader_pid": state["leader_pid"] if state else None,
+            "state_age": round(age, 3) if age is not None else None,
+            "error": state["startup"]["error"] if state else "Aucun leader",
+            "uptime": round(time.time() - startup_state["began_at"], 3)
+        }
+        return jsonify(body), 200 if is_ready else 503
+    body = {
+        "ready": startup_state["ready"],
+        "error": startup_state["error"],
+        "uptime": round(time.time() - startup_state["began_at"], 3),
+        "stages": startup_state["stages"]
+    }
+    return jsonify(body), 200 if startup_state["ready"] else 503
+
 @app.route("/")
 @rate_limit()
 def home():
@@ -130,6 +469,14 @@ def home():
 @app.route("/status")
 @rate_limit()
 def status():
+    if election is not None:
+        # Plusieurs workers : même réponse partout, sans requête au broker
+        if election.is_leader:
+            return jsonify(status_snapshot())
+        state = shared_state.read()
+        if state is None:
+            return jsonify({"status": "disconnected", "bot_initialized": False, "error": "Aucun leader"}), 503
+        return jsonify(dict(state["status"], state_age=round(shared_state.age(), 3)))
     with bot_lock:
         is_initialized = init_bot_if_needed()
         is_connected = bot and bot.check_connection() if is_initialized else False
@@ -142,11 +489,122 @@ def status():
             "account_info": bot.check_account_status() if is_connected else None
         })
 
+@app.route("/metrics")
+@rate_limit()
+def metrics():
+    if is_leader():
+        body = leader_metrics()
+    else:
+        state = shared_state.read()
+        body = dict(state["metrics"]) if state else {}
+    # Limiteurs et flux SSE sont propres à chaque worker
+    body.update({
+        "rate_limits": {budget: limiter.stats() for budget, limiter in rate_limiters.items()},
+        "event_feed": event_feed.stats(),
+        "stream_server": stream_server.stats() if stream_server else None,
+        "leader": election.stats() if election else None,
+        "event_relay": {"relayed": event_relay.relayed, "last_id": event_relay.last_id} if event_relay else None
+    })
+    return jsonify(body)
+
+@app.route("/stream")
+@rate_limit("stream")
+def stream():
+    """Flux SSE : aucun appel au broker, les événements viennent du thread de trading"""
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    subscriber = event_feed.subscribe(last_event_id)
+    if subscriber is None:
+        response = jsonify({"error": "Trop d'abonnés au flux", "max_subscribers": event_feed.max_subscribers})
+        response.status_code = 503
+        response.headers["Retry-After"] = "5"
+        return response
+    return Response(stream_with_context(event_feed.stream(subscriber)),
+                    mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/snapshot")
+@rate_limit()
+def snapshot():
+    """Dernier événement de chaque type, sans interroger le broker"""
+    return jsonify(dict(event_feed.latest))
+
+def analytics_range():
+    """Paramètres from / to (jours AAAA-MM-JJ inclus) de la requête"""
+    start, end = request.args.get("from"), request.args.get("to")
+    for day in (start, end):
+        if day:
+            day_start_ms(day)  # ValueError si le jour est mal formé
+    return start, end
+
+def analytics_limit(default=100, maximum=5000):
+    return max(1, min(int(request.args.get("limit", default)), maximum))
+
+def analytics_ms_range():
+    start, end = analytics_range()
+    return (day_start_ms(start) if start else None,
+            day_start_ms(end) + DAY_MS if end else None)
+
+def analytics_route(f):
+    """Lecture seule de la base d'analyse : servie par n'importe quel worker"""
+    @wraps(f)
+    def wrapped(*args, **kwargs):
+        try:
+            return jsonify(f(*args, **kwargs))
+        except ValueError as e:
+            return jsonify({"error": "Paramètre invalide", "detail": str(e)}), 400
+    return wrapped
+
+@app.route("/analytics/summary")
+@rate_limit()
+@analytics_route
+def analytics_summary():
+    """PnL, taux de gain et taux de réussite des signaux sur la période (agrégats par jour)"""
+    start, end = analytics_range()
+    return analytics.summary(request.args.get("symbol"), start, end)
+
+@app.route("/analytics/daily")
+@rate_limit()
+@analytics_route
+def analytics_daily():
+    start, end = analytics_range()
+    return analytics.daily(request.args.get("symbol"), start, end)
+
+@app.route("/analytics/trades")
+@rate_limit()
+@analytics_route
+def analytics_trades():
+    start, end = analytics_ms_range()
+    return analytics.trades(request.args.get("symbol"), start, end, analytics_limit())
+
+@app.route("/analytics/signals")
+@rate_limit()
+@analytics_route
+def analytics_signals():
+    start, end = analytics_ms_range()
+    signal_type = request.args.get("type")
+    if signal_type not in (None, "BUY", "SELL", "NONE"):
+        raise ValueError("type doit valoir BUY, SELL ou NONE")
+    return analytics.signals(request.args.get("symbol"), start, end, signal_type, analytics_limit())
+
+@app.route("/analytics/indicators")
+@rate_limit()
+@analytics_route
+def analytics_indicators():
+    start, end = analytics_ms_range()
+    symbol = request.args.get("symbol") or (bot.symbol if bot else "EURUSD")
+    return analytics.indicators(symbol, start, end, analytics_limit(default=500))
+
 from flask import Flask, jsonify
 import json
 import logging
 
 @app.route("/test_trade", methods=['GET'])
+@rate_limit("trade")
+@leader_only
 def test_trade():
     global bot
     if not bot:
@@ -175,13 +633,16 @@ def test_trade():
         }), 500
 
 @app.route("/logs", methods=['GET'])
+@rate_limit("logs")
+@leader_only
 def get_logs():
     logs = []
     try:
         if bot:
             logs.append(f"État du bot : {'connecté' if bot.client else 'déconnecté'}")
             logs.append(f"Position ouverte : {bot.position_open}")
-            df = bot.get_historical_data()
+            with bot_lock:
+                df = bot_history()
             if df is not None:
                 df = bot.calculate_indicators(df)  # Calcul des indicateurs
                 if df is not None:
@@ -198,6 +659,8 @@ def get_logs():
         return jsonify({"error": str(e)}), 500
 
 @app.route("/debug", methods=['GET'])
+@rate_limit("debug")
+@leader_only
 def debug_bot():
     try:
         if not bot:
@@ -206,11 +669,12 @@ def debug_bot():
                 "message": "Bot non initialisé"
             }), 500
 
-        # Vérification de la connexion
-        connection_status = bot.check_connection()
-        
-        # Récupération des données historiques
-        df = bot.get_historical_data()
+        # Connexion, historique, compte et positions : sous bot_lock, comme le thread de trading
+        with bot_lock:
+            connection_status = bot.check_connection()
+            df = bot_history()
+            account_info = bot.check_account_status()
+            position_status = bot.check_trade_status()
         
         if df is None:
             return jsonify({
@@ -240,12 +704,6 @@ def debug_bot():
         # Vérification du signal
         signal = bot.check_trading_signals(df_with_indicators)
         
-        # État du compte
-        account_info = bot.check_account_status()
-        
-        # Vérification des positions ouvertes
-        position_status = bot.check_trade_status()
-
         return jsonify({
             "status": "success",
             "bot_state": {
@@ -284,6 +742,8 @@ def debug_bot():
         }), 500
 
 @app.route("/force_trade", methods=['GET'])
+@rate_limit("trade")
+@leader_only
 def force_trade():
     global bot
     if not bot:
@@ -315,6 +775,8 @@ def force_trade():
         }), 500
 
 @app.route("/sync_status", methods=['GET'])
+@rate_limit()
+@leader_only
 def sync_status():
     global bot
     if not bot:
@@ -332,22 +794,9 @@ def sync_status():
         return jsonify({"error": str(e)}), 500
 
 if __name__ == "__main__":
-    try:
-        if init_bot_if_needed():
-            logger.info("Bot initialisé avec succès, démarrage du thread de trading...")
-            trading_thread = Thread(target=run_trading_thread, daemon=True)
-            trading_thread.start()
-            logger.info("Thread de trading démarré avec succès")
-        else:
-            logger.error("Échec de l'initialisation du bot")
-    except Exception as e:
-        logger.error(f"Erreur lors du démarrage: {str(e)}")
-        
-    # Démarre le serveur Flask
+    # Connexion, préchargement puis thread de trading, sans retarder l'ouverture du port
+    start_background_startup(with_trading=True)
     port = int(os.environ.get("PORT", 8080))
-    # Démarrer le planificateur pour synchroniser régulièrement l'état des positions
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(sync_position_status, 'interval', minutes=5)
-    scheduler.start()
-    logger.info("Planificateur de synchronisation démarré")
     app.run(host="0.0.0.0", port=port, debug=False)
+# Sous gunicorn, start_worker() est appelé par le hook post_worker_init (gunicorn.conf.py) :
+# le worker élu leader se connecte et trade, les autres le suivent
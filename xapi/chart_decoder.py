@@ -0,0 +1,188 @@
+import json
+import re
+
+import numpy as np
+
+# Commandes dont la réponse est décodée au fil de l'eau (cf. Client._transmit)
+CHART_COMMANDS = ('getChartRangeRequest', 'getChartLastRequest')
+# Champs numériques d'une bougie rateInfos ; ctmString n'est pas conservé
+FIELDS = ('ctm', 'open', 'close', 'high', 'low', 'vol')
+INITIAL_CAPACITY = 1024
+# Préallocation maximale (bougies) d'après la fenêtre demandée ; au-delà, les colonnes grandissent
+MAX_PREALLOCATED = 1 << 20
+
+_ARRAY_START = re.compile(rb'"rateInfos"\s*:\s*\[')
+_NUMBER = rb'\s*:\s*(-?[0-9][0-9.eE+-]*)'
+_FIELD_PATTERNS = {name: re.compile(b'"' + name.encode() + b'"' + _NUMBER) for name in FIELDS}
+
+# Étapes du décodage
+_HEAD, _ARRAY, _TAIL, _DONE = range(4)
+
+
+class RateInfos(object):
+    """Bougies d'une réponse getChart* en colonnes NumPy (valeurs brutes xAPI).
+
+    Remplace la liste de dicts de `returnData['rateInfos']` : `len`,
+    l'indexation et l'itération rendent encore des dicts (sans ctmString)
+    pour le code qui les attend, `columns()` donne les tableaux sans copie.
+    """
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        capacity = max(int(capacity), 16)
+        self._columns = {name: np.empty(capacity, dtype=np.int64 if name == 'ctm' else np.float64)
+                         for name in FIELDS}
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def _reserve(self, n):
+        needed = self._count + n
+        capacity = len(self._columns['ctm'])
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name, column in self._columns.items():
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self._count] = column[:self._count]
+            self._columns[name] = grown
+
+    def extend(self, values):
+        """`values` : {champ: tableau}, tous de même longueur"""
+        n = len(values['ctm'])
+        self._reserve(n)
+        end = self._count + n
+        for name, column in self._columns.items():
+            column[self._count:end] = values[name]
+        self._count = end
+
+    def columns(self):
+        return {name: column[:self._count] for name, column in self._columns.items()}
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("RateInfos index out of range")
+        return {name: column[i].item() for name, column in self._columns.items()}
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self[i]
+
+
+def decode_prices(rate_infos, digits):
+    """Colonnes ctm/open/high/low/close/vol (NumPy) de bougies getChart*, en prix.
+
+    xAPI envoie `open` en points (prix x 10**digits) et close, high, low en
+    écart à l'ouverture, dans la même unité. Seul décodage des rateInfos :
+    historique du bot, rattrapage du streaming et analyses hors ligne
+    partagent ainsi l'échelle des ticks et des bougies streamées (en prix).
+    """
+    if hasattr(rate_infos, 'columns'):
+        raw = rate_infos.columns()
+    else:
+        raw = {name: np.array([r.get(name, 0) for r in rate_infos], dtype=np.int64 if name == 'ctm' else np.float64)
+               for name in FIELDS}
+    scale = 10.0 ** digits
+    open_ = raw['open']
+    return {
+        'ctm': raw['ctm'],
+        'open': np.round(open_ / scale, digits),
+        'high': np.round((open_ + raw['high']) / scale, digits),
+        'low': np.round((open_ + raw['low']) / scale, digits),
+        'close': np.round((open_ + raw['close']) / scale, digits),
+        'vol': raw['vol'],
+    }
+
+
+class ChartDecoder(object):
+    """Décode une réponse getChart* pendant sa réception.
+
+    Chaque bloc reçu est passé à `feed` : les bougies complètes du tableau
+    rateInfos sont extraites par expressions régulières (une passe par
+    champ, en C) et converties directement en colonnes NumPy ; le reste de
+    la réponse (status, digits...) est décodé par json à la fin. La réponse
+    n'est jamais présente en entier en mémoire sous forme d'objets Python.
+    """
+
+    def __init__(self, expected=None):
+        self.rate_infos = RateInfos(min(expected or INITIAL_CAPACITY, MAX_PREALLOCATED))
+        self._stage = _HEAD
+        self._pending = bytearray()
+        self._head = b''
+        self._tail = bytearray()
+        self._has_array = False
+        self.received = 0
+
+    @property
+    def done(self):
+        return self._stage == _DONE
+
+    def feed(self, chunk):
+        """Ajoute un bloc reçu ; renvoie True quand la réponse est complète"""
+        self.received += len(chunk)
+        if self._stage == _TAIL:
+            self._feed_tail(chunk)
+            return self.done
+        self._pending += chunk
+        if self._stage == _HEAD:
+            match = _ARRAY_START.search(self._pending)
+            if match is None:
+                if b'\n' in chunk and self._pending.strip():
+                    # Réponse sans bougies (erreur) : tout est dans l'en-tête
+                    self._head = bytes(self._pending)
+                    self._pending = bytearray()
+                    self._stage = _DONE
+                return self.done
+            self._head = bytes(self._pending[:match.end()])
+            del self._pending[:match.end()]
+            self._has_array = True
+            self._stage = _ARRAY
+        self._feed_array()
+        return self.done
+
+    def _feed_array(self):
+        pending = self._pending
+        end = pending.find(b']')
+        complete = end if end >= 0 else pending.rfind(b'}') + 1
+        if complete > 0:
+            self._decode(bytes(pending[:complete]))
+        if end >= 0:
+            rest = bytes(pending[end:])
+            self._pending = bytearray()
+            self._stage = _TAIL
+            self._feed_tail(rest)
+        elif complete > 0:
+            del pending[:complete]
+
+    def _feed_tail(self, chunk):
+        self._tail += chunk
+        if b'\n' in chunk:
+            self._stage = _DONE
+
+    def _decode(self, region):
+        values = {name: pattern.findall(region) for name, pattern in _FIELD_PATTERNS.items()}
+        counts = {len(found) for found in values.values()}
+        if len(counts) != 1:
+            # Bougie incomplète ou champ manquant : décodage json de la tranche
+            records = json.loads(b'[' + region.strip().strip(b',') + b']')
+            values = {name: [record.get(name, 0) for record in records] for name in FIELDS}
+        elif not counts.pop():
+            return
+        else:
+            # Conversion des nombres en C : tableau d'octets -> numérique
+            values = {name: np.array(found).astype(np.int64 if name == 'ctm' else np.float64)
+                      for name, found in values.items()}
+        self.rate_infos.extend(values)
+
+    def response(self):
+        """Réponse complète, `returnData['rateInfos']` étant un RateInfos"""
+        if not self.done:
+            raise ValueError("Chart response is incomplete")
+        if not self._has_array:
+            return json.loads(self._head)
+        response = json.loads(self._head + self._tail)
+        response['returnData']['rateInfos'] = self.rate_infos
+        return response
@@ -1,40 +1,76 @@
 import json
+import os
 import socket
 import logging
 import time
 import ssl
 from threading import Thread
+from xapi.scheduler import CommandScheduler, MAX_COMMANDS_PER_SECOND, COMMAND_BURST
+from xapi.recorder import CHANNEL_RESPONSE, default_recorder
+from xapi.chart_decoder import CHART_COMMANDS, ChartDecoder
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('XTB_API')
 
+READ_SIZE = 65536
+
+def use_ssl():
+    # XTB_SSL=0 uniquement pour un serveur local en clair (faux broker)
+    return os.getenv('XTB_SSL', '1') != '0'
+
+def default_command_rate():
+    # XTB_COMMAND_RATE=0 désactive le cadencement (benchmarks du transport seul)
+    return float(os.getenv('XTB_COMMAND_RATE', MAX_COMMANDS_PER_SECOND))
+
+def expected_candles(command):
+    """Nombre de bougies d'une requête getChart*, pour préallouer les colonnes"""
+    info = (command.get('arguments') or {}).get('info') or {}
+    try:
+        period_ms = int(info['period']) * 60000
+        end = int(info.get('end') or time.time() * 1000)
+        return max(0, (end - int(info['start'])) // period_ms) + 1
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        return None
+
 class Client(object):
-    def __init__(self):
+    def __init__(self, command_rate=None, command_burst=COMMAND_BURST, recorder=None):
         self.sock = None
         self.streaming_socket = None
         self.stream_session_id = None
         self.mutex = False
         self.symbol_array = []
+        # Copie brute des échanges (XAPI_RECORD_DIR), cf. xapi/recorder.py
+        self.recorder = recorder if recorder is not None else default_recorder()
+        # Réponses getChart* décodées pendant la réception (cf. xapi/chart_decoder.py)
+        self.stream_charts = os.getenv('XAPI_STREAM_CHARTS', '1') != '0'
+        # Toutes les commandes passent par le scheduler, seul à écrire sur le socket
+        self.scheduler = CommandScheduler(
+            self._transmit,
+            rate=command_rate if command_rate is not None else default_command_rate(),
+            burst=command_burst)
 
-    def connect(self, server='xapi.xtb.com', port=5124):
+    def connect(self, server=None, port=None):
         try:
-            # Configuration spécifique pour le serveur démo avec l'IP directe
-            server = 'xapi.xtb.com'  # Adresse IP du serveur démo XTB xapi.xtb.com
-            port = 5124  # Port standard pour le démo 5124
+            # Serveur démo par défaut, surchargeable par l'environnement (faux broker local des benchmarks)
+            server = server or os.getenv('XTB_SERVER', 'xapi.xtb.com')
+            port = int(port or os.getenv('XTB_PORT', 5124))  # Port standard pour le démo 5124
             
             self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            context = ssl.create_default_context()
-            context.check_hostname = False
-            context.verify_mode = ssl.CERT_NONE
-            self.sock = context.wrap_socket(self.sock)
+            if use_ssl():
+                context = ssl.create_default_context()
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+                self.sock = context.wrap_socket(self.sock)
             self.sock.connect((server, port))
             self.sock.settimeout(30.0)
+            self.scheduler.start()
             logger.info('Connected to XTB demo server')
         except Exception as e:
             logger.error(f'Connection error: {str(e)}')
             raise
 
     def disconnect(self):
+        self.scheduler.stop("Disconnected from XTB server")
         if self.sock:
             self.sock.close()
         logger.info('Disconnected from XTB server')
@@ -53,14 +89,24 @@ class Client(object):
             self.stream_session_id = response.get('streamSessionId')
         return response
 
-    def _send_command(self, dictionary):
+    def _send_command(self, dictionary, priority=None):
+        if not self.sock:
+            raise ConnectionError("Not connected to XTB server")
+        return self.scheduler.execute(dictionary, priority)
+
+    def _transmit(self, dictionary):
+        # Exécuté uniquement par le thread du scheduler
         if not self.sock:
             raise ConnectionError("Not connected to XTB server")
         
         try:
             cmd = json.dumps(dictionary)
             cmd = cmd.encode('utf-8')
+            if self.recorder:
+                self.recorder.record_request(dictionary, cmd)
             self.sock.send(cmd + b'\n')
+            if self.stream_charts and dictionary.get('command') in CHART_COMMANDS:
+                return self._read_chart_response(expected_candles(dictionary))
             return self._read_response()
         except Exception as e:
             logger.error(f'Send command error: {str(e)}')
@@ -73,13 +119,17 @@ class Client(object):
         try:
             buffer = bytearray()
             while True:
-                chunk = self.sock.recv(4096)
+                chunk = self.sock.recv(READ_SIZE)
                 if not chunk:
                     break
                 
                 buffer.extend(chunk)
                 
-                if b'\n' in buffer:
+                # Le serveur termine chaque réponse par "\n\n" : ignorer un séparateur isolé.
+                # Seul le dernier bloc est examiné, pas tout le tampon à chaque réception
+                if b'\n' in chunk and buffer.strip():
+                    if self.recorder:
+                        self.recorder.record(CHANNEL_RESPONSE, bytes(buffer))
                     try:
                         response = buffer.decode('utf-8').strip()
                         return json.loads(response)
@@ -97,10 +147,37 @@ class Client(object):
             logger.error(f'Read response error: {str(e)}')
             raise
 
-    def commandExecute(self, command, arguments=None):
+    def _read_chart_response(self, expected=None):
+        """Réponse getChart* : les bougies passent en colonnes NumPy à mesure qu'elles arrivent"""
+        if not self.sock:
+            raise ConnectionError("Not connected to XTB server")
+        decoder = ChartDecoder(expected)
+        chunks = [] if self.recorder else None
+        try:
+            while not decoder.done:
+                chunk = self.sock.recv(READ_SIZE)
+                if not chunk:
+                    raise ConnectionError("Connection closed while reading chart response")
+                if chunks is not None:
+                    chunks.append(chunk)
+                decoder.feed(chunk)
+            if chunks is not None:
+                self.recorder.record(CHANNEL_RESPONSE, b''.join(chunks))
+            return decoder.response()
+        except socket.timeout:
+            logger.error('Socket timeout while reading chart response')
+            raise
+        except Exception as e:
+            logger.error(f'Read chart response error: {str(e)}')
+            raise
+
+    def commandExecute(self, command, arguments=None, priority=None):
         cmd = {
             "command": command,
         }
         if arguments:
             cmd["arguments"] = arguments
-        return self._send_command(cmd)
+        return self._send_command(cmd, priority)
+
+    def scheduler_stats(self):
+        return self.scheduler.stats()
@@ -0,0 +1,92 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from xapi.scheduler import PRIORITY_ACCOUNT
+
+logger = logging.getLogger('XTB_API')
+
+SYNC_SAMPLES = 3
+RESYNC_INTERVAL = 300.0
+
+
+class ServerClock(object):
+    """Heure du serveur xAPI estimée à partir de getServerTime.
+
+    Pour chaque échantillon, l'écart local -> serveur est pris au milieu de
+    l'aller-retour (envoi réel sur le socket -> réponse), comme en NTP :
+    l'erreur est bornée par RTT/2. L'échantillon au plus petit RTT d'une
+    synchronisation est retenu ; la dérive est la pente de l'écart entre
+    deux synchronisations.
+    """
+
+    def __init__(self, resync_interval=RESYNC_INTERVAL):
+        self.resync_interval = resync_interval
+        self.offset_ms = 0.0
+        self.rtt_ms = None
+        self.drift_ms_per_hour = None
+        self.synced_at = None
+        self.syncs = 0
+        self.failures = 0
+        self._history = deque(maxlen=50)  # (instant local, écart, rtt)
+        self._lock = threading.Lock()
+
+    def now_ms(self):
+        """Heure serveur estimée, en millisecondes epoch"""
+        return time.time() * 1000.0 + self.offset_ms
+
+    def to_local(self, server_ms):
+        """Instant local (secondes epoch) correspondant à une heure serveur"""
+        return (server_ms - self.offset_ms) / 1000.0
+
+    def due(self):
+        return self.synced_at is None or time.time() - self.synced_at >= self.resync_interval
+
+    def sample(self, client, timeout=10.0):
+        """Un aller-retour getServerTime ; renvoie (écart ms, rtt ms)"""
+        future = client.scheduler.submit({"command": "getServerTime"}, PRIORITY_ACCOUNT)
+        response = future.result(timeout)
+        received = time.time()
+        if not response or not response.get('status'):
+            raise RuntimeError(f"getServerTime a échoué: {response}")
+        sent = future.dispatched_at or received
+        server_ms = response['returnData']['time']
+        rtt_ms = (received - sent) * 1000.0
+        return server_ms - (sent + received) * 500.0, rtt_ms
+
+    def sync(self, client, samples=SYNC_SAMPLES):
+        """Met à jour l'écart avec le meilleur de `samples` allers-retours"""
+        best = None
+        for _ in range(samples):
+            try:
+                offset, rtt = self.sample(client)
+            except Exception as e:
+                logger.warning(f"Synchronisation de l'horloge serveur: {str(e)}")
+                continue
+            if best is None or rtt < best[1]:
+                best = (offset, rtt)
+        if best is None:
+            self.failures += 1
+            return False
+        now = time.time()
+        with self._lock:
+            if self._history:
+                first_at, first_offset, _ = self._history[0]
+                if now - first_at > 0:
+                    self.drift_ms_per_hour = (best[0] - first_offset) / (now - first_at) * 3600.0
+            self._history.append((now, best[0], best[1]))
+            self.offset_ms, self.rtt_ms = best
+            self.synced_at = now
+            self.syncs += 1
+        return True
+
+    def stats(self):
+        return {
+            "offset_ms": round(self.offset_ms, 3),
+            "rtt_ms": round(self.rtt_ms, 3) if self.rtt_ms is not None else None,
+            "drift_ms_per_hour": round(self.drift_ms_per_hour, 3) if self.drift_ms_per_hour is not None else None,
+            "synced_at": self.synced_at,
+            "syncs": self.syncs,
+            "failures": self.failures,
+        }
@@ -0,0 +1,330 @@
+import abc
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger('XTB_API')
+
+# "latest" : seule la dernière valeur par symbole est gardée (ticks, bougies)
+# "queue"  : file bornée, jamais de perte ; pleine, elle freine le lecteur
+# "callback" : fonction appelée sur le thread lecteur (mises à jour O(1) uniquement)
+MODE_LATEST = 'latest'
+MODE_QUEUE = 'queue'
+MODE_CALLBACK = 'callback'
+
+DEFAULT_QUEUE_SIZE = 1000
+
+
+def _symbol_of(message):
+    data = message.get('data')
+    if isinstance(data, dict):
+        return data.get('symbol')
+    return None
+
+
+class Subscription(abc.ABC):
+    """Abonnement à une commande de streaming, éventuellement filtrée sur un symbole.
+
+    `get()` renvoie le prochain message, ou None après `timeout` ou une fois
+    l'abonnement fermé (`closed`). Les sous-classes fournissent le stockage
+    des messages en attente : `put`, `_pop` et `__len__`.
+    """
+
+    def __init__(self, command, symbol=None):
+        self.command = command
+        self.symbol = symbol
+        self.closed = False
+        self.delivered = 0
+        self._cond = threading.Condition()
+        self.latencies = deque(maxlen=1000)
+
+    @abc.abstractmethod
+    def put(self, message, stamp):
+        """Dépose un message (horodaté `stamp`, time.monotonic) ; False si l'abonnement est fermé"""
+
+    @abc.abstractmethod
+    def _pop(self):
+        """(message, stamp) le plus ancien en attente ; appelé sous `_cond` quand len(self) > 0"""
+
+    @abc.abstractmethod
+    def __len__(self):
+        """Nombre de messages en attente"""
+
+    def get(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not len(self):
+                if self.closed:
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            message, stamp = self._pop()
+            self._cond.notify_all()
+        self.delivered += 1
+        self.latencies.append(time.monotonic() - stamp)
+        return message
+
+    def __iter__(self):
+        while True:
+            message = self.get()
+            if message is None:
+                return
+            yield message
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+
+        def pct(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p / 100.0 * len(latencies)))] * 1000.0, 3)
+
+        return {
+            "command": self.command,
+            "symbol": self.symbol,
+            "pending": len(self),
+            "delivered": self.delivered,
+            "latency_ms": {"p50": pct(50), "p99": pct(99), "max": pct(100)},
+        }
+
+
+class LatestSubscription(Subscription):
+    """Coalescence par symbole : un consommateur lent ne voit que le prix le plus récent.
+
+    Un symbole déjà en attente garde sa place dans l'ordre de livraison, pour
+    qu'un symbole très actif n'en affame pas un autre.
+    """
+
+    mode = MODE_LATEST
+
+    def __init__(self, command, symbol=None):
+        super().__init__(command, symbol)
+        self._pending = {}
+        self.coalesced = 0
+
+    def put(self, message, stamp):
+        key = _symbol_of(message)
+        with self._cond:
+            if self.closed:
+                return False
+            if key in self._pending:
+                # L'horodatage d'origine est gardé : la latence mesurée inclut l'attente
+                self._pending[key] = (message, self._pending[key][1])
+                self.coalesced += 1
+            else:
+                self._pending[key] = (message, stamp)
+                self._cond.notify()
+        return True
+
+    def _pop(self):
+        key = next(iter(self._pending))
+        return self._pending.pop(key)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def stats(self):
+        stats = super().stats()
+        stats.update(mode=self.mode, coalesced=self.coalesced)
+        return stats
+
+
+class QueueSubscription(Subscription):
+    """File bornée sans perte : pleine, elle bloque le lecteur (backpressure)."""
+
+    mode = MODE_QUEUE
+
+    def __init__(self, command, symbol=None, maxsize=DEFAULT_QUEUE_SIZE):
+        super().__init__(command, symbol)
+        self.maxsize = maxsize
+        self._queue = deque()
+        self.max_depth = 0
+        self.blocked = 0
+        self.blocked_seconds = 0.0
+
+    def put(self, message, stamp):
+        with self._cond:
+            if len(self._queue) >= self.maxsize and not self.closed:
+                self.blocked += 1
+                t0 = time.monotonic()
+                while len(self._queue) >= self.maxsize and not self.closed:
+                    self._cond.wait()
+                self.blocked_seconds += time.monotonic() - t0
+            if self.closed:
+                return False
+            self._queue.append((message, stamp))
+            self.max_depth = max(self.max_depth, len(self._queue))
+            self._cond.notify_all()
+        return True
+
+    def _pop(self):
+        return self._queue.popleft()
+
+    def __len__(self):
+        return len(self._queue)
+
+    def stats(self):
+        stats = super().stats()
+        stats.update(mode=self.mode, maxsize=self.maxsize, max_depth=self.max_depth,
+                     blocked=self.blocked, blocked_seconds=round(self.blocked_seconds, 6))
+        return stats
+
+
+class CallbackSubscription(Subscription):
+    """Livraison immédiate à `callback(message)`, sans file ni thread consommateur."""
+
+    mode = MODE_CALLBACK
+
+    def __init__(self, command, symbol=None, callback=None):
+        super().__init__(command, symbol)
+        self.callback = callback
+        self.errors = 0
+
+    def put(self, message, stamp):
+        if self.closed:
+            return False
+        try:
+            self.callback(message)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Stream callback error ({self.command}): {e}")
+        self.delivered += 1
+        return True
+
+    def get(self, timeout=None):
+        raise TypeError("Callback subscriptions are not polled")
+
+    def _pop(self):
+        raise TypeError("Callback subscriptions are not polled")
+
+    def __len__(self):
+        return 0
+
+    def stats(self):
+        stats = super().stats()
+        stats.update(mode=self.mode, errors=self.errors)
+        return stats
+
+
+class StreamDispatcher(object):
+    """Aiguillage des messages de streaming par commande et symbole.
+
+    Un thread dédié lit le socket de streaming et dépose chaque message dans
+    les abonnements correspondants : (commande, symbole) puis (commande, tous
+    symboles). La table de routage est copiée à l'écriture, le lecteur la
+    parcourt sans verrou.
+    """
+
+    def __init__(self, streaming=None, name='xapi-stream-reader'):
+        self.streaming = streaming
+        self._name = name
+        self._routes = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._running = False
+        self.received = 0
+        self.unrouted = 0
+
+    @property
+    def running(self):
+        return self._running
+
+    def subscribe(self, command, symbol=None, mode=MODE_LATEST, maxsize=DEFAULT_QUEUE_SIZE, callback=None):
+        if callback is not None:
+            mode = MODE_CALLBACK
+        if mode == MODE_LATEST:
+            subscription = LatestSubscription(command, symbol)
+        elif mode == MODE_QUEUE:
+            subscription = QueueSubscription(command, symbol, maxsize)
+        elif mode == MODE_CALLBACK and callback is not None:
+            subscription = CallbackSubscription(command, symbol, callback)
+        else:
+            raise ValueError(f"Mode d'abonnement inconnu: {mode}")
+        key = (command, symbol)
+        with self._lock:
+            routes = dict(self._routes)
+            routes[key] = routes.get(key, ()) + (subscription,)
+            self._routes = routes
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.close()
+        key = (subscription.command, subscription.symbol)
+        with self._lock:
+            routes = dict(self._routes)
+            remaining = tuple(s for s in routes.get(key, ()) if s is not subscription)
+            if remaining:
+                routes[key] = remaining
+            else:
+                routes.pop(key, None)
+            self._routes = routes
+
+    def dispatch(self, message):
+        """Route un message décodé ; renvoie le nombre d'abonnements servis."""
+        self.received += 1
+        command = message.get('command')
+        symbol = _symbol_of(message)
+        routes = self._routes
+        subscriptions = routes.get((command, symbol), ())
+        if symbol is not None:
+            subscriptions += routes.get((command, None), ())
+        if not subscriptions:
+            self.unrouted += 1
+            return 0
+        stamp = time.monotonic()
+        for subscription in subscriptions:
+            subscription.put(message, stamp)
+        return len(subscriptions)
+
+    def start(self, streaming=None):
+        if streaming is not None:
+            self.streaming = streaming
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            for message in self.streaming.read_stream():
+                if not self._running:
+                    break
+                self.dispatch(message)
+        except Exception as e:
+            logger.error(f"Stream reader stopped: {e}")
+        finally:
+            self._running = False
+            logger.info("Stream reader stopped")
+
+    def stop(self):
+        """Ferme le streaming (débloque la lecture) et tous les abonnements."""
+        self._running = False
+        if self.streaming is not None:
+            self.streaming.interrupt()
+        for subscriptions in list(self._routes.values()):
+            for subscription in subscriptions:
+                subscription.close()
+        thread = self._thread
+        if thread and thread is not threading.current_thread():
+            thread.join(timeout=5)
+        self._thread = None
+        if self.streaming is not None:
+            # Fermeture après la fin de la lecture : le descripteur ne peut pas être réutilisé sous elle
+            self.streaming.disconnect()
+
+    def stats(self):
+        return {
+            "running": self._running,
+            "received": self.received,
+            "unrouted": self.unrouted,
+            "subscriptions": [s.stats() for subs in self._routes.values() for s in subs],
+        }
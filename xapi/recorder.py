@@ -0,0 +1,312 @@
+import atexit
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+
+logger = logging.getLogger('XTB_API')
+
+# Canaux enregistrés
+CHANNEL_REQUEST = 1
+CHANNEL_RESPONSE = 2
+CHANNEL_STREAM = 3
+CHANNEL_STREAM_REQUEST = 4
+CHANNEL_NAMES = {CHANNEL_REQUEST: 'request', CHANNEL_RESPONSE: 'response',
+                 CHANNEL_STREAM: 'stream', CHANNEL_STREAM_REQUEST: 'stream_request'}
+
+# Format d'un segment :
+#   en-tête   <4sHd   magic, version, instant de création
+#   blocs     <IIdd   taille compressée, nombre de messages, premier et dernier instant
+#             puis zlib(messages), chaque message : <dBI instant, canal, taille + octets bruts
+# Index (.idx à côté du segment) : <ddQ premier instant, dernier instant, position du bloc
+MAGIC = b'XREC'
+VERSION = 1
+SEGMENT_HEADER = struct.Struct('<4sHd')
+BLOCK_HEADER = struct.Struct('<IIdd')
+RECORD_HEADER = struct.Struct('<dBI')
+INDEX_ENTRY = struct.Struct('<ddQ')
+
+SEGMENT_BYTES = 64 * 1024 * 1024
+SEGMENT_SECONDS = 3600
+MAX_SEGMENTS = 48
+BLOCK_RECORDS = 4096
+FLUSH_INTERVAL = 0.2
+MAX_PENDING = 200000
+
+_REDACTED = '***'
+
+
+def redact(command):
+    """Copie de la commande sans le mot de passe de login"""
+    arguments = command.get('arguments')
+    if command.get('command') == 'login' and isinstance(arguments, dict) and 'password' in arguments:
+        return dict(command, arguments=dict(arguments, password=_REDACTED))
+    return command
+
+
+class Recorder(object):
+    """Enregistre les octets bruts échangés avec le broker dans des segments compressés.
+
+    `record()` ne fait qu'ajouter à une file en mémoire : le chemin de
+    trading ne touche jamais au disque. Un thread d'écriture regroupe les
+    messages par blocs, les compresse et les ajoute au segment courant ;
+    l'index des blocs (plage horaire -> position) permet à `RecordReader`
+    de rejouer une période sans décompresser tout le segment. Si l'écriture
+    prend du retard au-delà de `max_pending` messages, les nouveaux sont
+    comptés comme perdus plutôt que de bloquer.
+    """
+
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES, segment_seconds=SEGMENT_SECONDS,
+                 max_segments=MAX_SEGMENTS, block_records=BLOCK_RECORDS, flush_interval=FLUSH_INTERVAL,
+                 max_pending=MAX_PENDING, compresslevel=1, name='xapi-recorder'):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.max_segments = max_segments
+        self.block_records = block_records
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.compresslevel = compresslevel
+        self._name = name
+        self._pending = deque()
+        self._wake = threading.Event()
+        self._running = False
+        self._thread = None
+        self._segment = None
+        self._index = None
+        self._segment_path = None
+        self._segment_started = 0.0
+        self.recorded = 0
+        self.dropped = 0
+        self.raw_bytes = 0
+        self.written_bytes = 0
+        self.blocks = 0
+        self.segments = 0
+
+    def start(self):
+        if self._running:
+            return self
+        os.makedirs(self.directory, exist_ok=True)
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        """Vide la file puis ferme le segment courant"""
+        if not self._running:
+            return
+        self._running = False
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+        self._thread = None
+
+    # -- enregistrement (appelé par les threads réseau) ----------------------
+    def record(self, channel, data, timestamp=None):
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return False
+        self._pending.append((timestamp or time.time(), channel, data))
+        if len(self._pending) >= self.block_records:
+            self._wake.set()
+        return True
+
+    def record_request(self, command, payload, channel=CHANNEL_REQUEST):
+        """Requête envoyée ; celle de login est réécrite sans le mot de passe"""
+        if command.get('command') == 'login':
+            payload = json.dumps(redact(command)).encode('utf-8')
+        return self.record(channel, payload)
+
+    # -- écriture (thread dédié) ---------------------------------------------
+    def _run(self):
+        try:
+            while True:
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+                running = self._running
+                self._drain()
+                if not running:
+                    break
+        except Exception as e:
+            logger.error(f"Recorder stopped: {str(e)}")
+        finally:
+            self._close_segment()
+
+    def _drain(self):
+        pending = self._pending
+        while pending:
+            batch = []
+            try:
+                while len(batch) < self.block_records:
+                    batch.append(pending.popleft())
+            except IndexError:
+                pass
+            self._write_block(batch)
+        if self._segment:
+            self._segment.flush()
+            self._index.flush()
+
+    def _write_block(self, batch):
+        now = batch[0][0]
+        if self._segment is None or self._segment.tell() >= self.segment_bytes or \
+                now - self._segment_started >= self.segment_seconds:
+            self._rotate(now)
+        pack = RECORD_HEADER.pack
+        parts = []
+        raw = 0
+        for timestamp, channel, data in batch:
+            parts.append(pack(timestamp, channel, len(data)))
+            parts.append(data)
+            raw += len(data)
+        payload = zlib.compress(b''.join(parts), self.compresslevel)
+        offset = self._segment.tell()
+        self._segment.write(BLOCK_HEADER.pack(len(payload), len(batch), batch[0][0], batch[-1][0]))
+        self._segment.write(payload)
+        self._index.write(INDEX_ENTRY.pack(batch[0][0], batch[-1][0], offset))
+        self.recorded += len(batch)
+        self.raw_bytes += raw
+        self.written_bytes += BLOCK_HEADER.size + len(payload)
+        self.blocks += 1
+
+    def _rotate(self, now):
+        self._close_segment()
+        self._segment_path = os.path.join(self.directory, 'xapi-%015d.rec' % int(now * 1000))
+        self._segment = open(self._segment_path, 'ab', buffering=1024 * 1024)
+        if self._segment.tell() == 0:
+            self._segment.write(SEGMENT_HEADER.pack(MAGIC, VERSION, now))
+        self._index = open(self._segment_path + '.idx', 'ab')
+        self._segment_started = now
+        self.segments += 1
+        self._prune()
+
+    def _close_segment(self):
+        for f in (self._segment, self._index):
+            if f:
+                f.close()
+        self._segment = self._index = None
+
+    def _prune(self):
+        segments = RecordReader(self.directory).segments()
+        for path in segments[:max(0, len(segments) - self.max_segments)]:
+            for p in (path, path + '.idx'):
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+
+    def stats(self):
+        return {
+            "directory": self.directory,
+            "running": self._running,
+            "pending": len(self._pending),
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "raw_bytes": self.raw_bytes,
+            "written_bytes": self.written_bytes,
+            "compression_ratio": round(self.raw_bytes / self.written_bytes, 2) if self.written_bytes else None,
+            "blocks": self.blocks,
+            "segment": self._segment_path,
+        }
+
+
+class RecordReader(object):
+    """Relecture des segments : (instant, canal, octets) dans l'ordre d'enregistrement"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def segments(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return sorted(os.path.join(self.directory, n) for n in names if n.startswith('xapi-') and n.endswith('.rec'))
+
+    @staticmethod
+    def _segment_start(path):
+        return int(os.path.basename(path)[5:-4]) / 1000.0
+
+    def index(self, path):
+        """[(premier instant, dernier instant, position)] ; relu depuis le segment si l'index manque"""
+        try:
+            with open(path + '.idx', 'rb') as f:
+                data = f.read()
+            usable = len(data) - len(data) % INDEX_ENTRY.size
+            return list(INDEX_ENTRY.iter_unpack(data[:usable]))
+        except OSError:
+            pass
+        entries = []
+        with open(path, 'rb') as f:
+            offset = SEGMENT_HEADER.size
+            f.seek(offset)
+            while True:
+                header = f.read(BLOCK_HEADER.size)
+                if len(header) < BLOCK_HEADER.size:
+                    break
+                size, _, first, last = BLOCK_HEADER.unpack(header)
+                entries.append((first, last, offset))
+                offset += BLOCK_HEADER.size + size
+                f.seek(offset)
+        return entries
+
+    def replay(self, start=None, end=None, channels=None):
+        segments = self.segments()
+        for i, path in enumerate(segments):
+            # Un segment qui précède celui contenant `start` est sauté sans être ouvert
+            if start is not None and i + 1 < len(segments) and self._segment_start(segments[i + 1]) <= start:
+                continue
+            if end is not None and self._segment_start(path) > end:
+                return
+            yield from self._replay_segment(path, start, end, channels)
+
+    def _replay_segment(self, path, start, end, channels):
+        with open(path, 'rb') as f:
+            for first, last, offset in self.index(path):
+                if start is not None and last < start:
+                    continue
+                if end is not None and first > end:
+                    return
+                f.seek(offset)
+                header = f.read(BLOCK_HEADER.size)
+                if len(header) < BLOCK_HEADER.size:
+                    return
+                size, count, _, _ = BLOCK_HEADER.unpack(header)
+                try:
+                    block = zlib.decompress(f.read(size))
+                except zlib.error:
+                    # Bloc tronqué (arrêt brutal pendant l'écriture)
+                    return
+                pos = 0
+                for _ in range(count):
+                    timestamp, channel, length = RECORD_HEADER.unpack_from(block, pos)
+                    pos += RECORD_HEADER.size
+                    data = block[pos:pos + length]
+                    pos += length
+                    if start is not None and timestamp < start:
+                        continue
+                    if end is not None and timestamp > end:
+                        return
+                    if channels is None or channel in channels:
+                        yield timestamp, channel, data
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_recorder():
+    """Enregistreur du processus si XAPI_RECORD_DIR est défini, sinon None"""
+    global _default
+    directory = os.getenv('XAPI_RECORD_DIR')
+    if not directory:
+        return None
+    with _default_lock:
+        if _default is None:
+            _default = Recorder(directory).start()
+            atexit.register(_default.close)
+        return _default
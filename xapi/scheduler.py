@@ -0,0 +1,201 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+logger = logging.getLogger('XTB_API')
+
+# Limites xAPI par session : au plus 5 commandes par seconde, soit 200 ms
+# entre deux envois ; au-delà le serveur coupe la connexion.
+MAX_COMMANDS_PER_SECOND = 5.0
+COMMAND_BURST = 1
+
+# Plus petit = plus prioritaire
+PRIORITY_TRADE = 0
+PRIORITY_ACCOUNT = 1
+PRIORITY_DATA = 2
+PRIORITY_PING = 3
+
+COMMAND_PRIORITIES = {
+    'login': PRIORITY_TRADE,
+    'logout': PRIORITY_TRADE,
+    'tradeTransaction': PRIORITY_TRADE,
+    'tradeTransactionStatus': PRIORITY_TRADE,
+    'getTrades': PRIORITY_ACCOUNT,
+    'getMarginLevel': PRIORITY_ACCOUNT,
+    'getSymbol': PRIORITY_ACCOUNT,
+    'getServerTime': PRIORITY_ACCOUNT,
+    'getChartRangeRequest': PRIORITY_DATA,
+    'getChartLastRequest': PRIORITY_DATA,
+    'getTradesHistory': PRIORITY_DATA,
+    'ping': PRIORITY_PING,
+}
+
+PRIORITY_NAMES = {PRIORITY_TRADE: 'trade', PRIORITY_ACCOUNT: 'account', PRIORITY_DATA: 'data', PRIORITY_PING: 'ping'}
+
+
+class CommandFuture(Future):
+    """Future d'une commande ; `dispatched_at` (time.time()) marque l'envoi réel sur le socket."""
+
+    dispatched_at = None
+
+
+class TokenBucket(object):
+    """`rate` jetons par seconde, au plus `capacity` en réserve. rate=0 : illimité."""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(max(capacity, 1))
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+
+    def _refill(self, now):
+        if self.rate > 0:
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def delay(self, now):
+        """Secondes avant qu'un jeton soit disponible (0 s'il y en a un)."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        if self.tokens >= 1.0:
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+    def take(self, now):
+        if self.rate <= 0:
+            return
+        self._refill(now)
+        self.tokens -= 1.0
+
+
+class CommandScheduler(object):
+    """File de commandes à priorités, envoyées une à une au débit maximal autorisé.
+
+    Les commandes sont exécutées par un thread dédié, qui est le seul à
+    parler au socket : les appelants attendent leur réponse via un Future.
+    Le rythme est donné par un token bucket ; l'attente se fait sur une
+    Condition, réveillée dès qu'une commande plus prioritaire arrive.
+    """
+
+    def __init__(self, transmit, rate=MAX_COMMANDS_PER_SECOND, burst=COMMAND_BURST, name='xapi-scheduler'):
+        self._transmit = transmit
+        self._bucket = TokenBucket(rate, burst)
+        self._name = name
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._thread = None
+        self._running = False
+        self._waits = deque(maxlen=1000)
+        self._dispatched = 0
+        self._failed = 0
+        self._max_depth = 0
+
+    @property
+    def running(self):
+        return self._running
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+        self._thread.start()
+
+    def stop(self, reason="Scheduler stopped"):
+        with self._cond:
+            self._running = False
+            pending, self._heap = self._heap, []
+            self._cond.notify_all()
+        for _, _, _, _, future in pending:
+            if not future.done():
+                future.set_exception(ConnectionError(reason))
+        thread = self._thread
+        if thread and thread is not threading.current_thread():
+            thread.join(timeout=5)
+        self._thread = None
+
+    def submit(self, command, priority=None):
+        """Met la commande en file et renvoie un Future de la réponse."""
+        if priority is None:
+            priority = COMMAND_PRIORITIES.get(command.get('command'), PRIORITY_DATA)
+        future = CommandFuture()
+        with self._cond:
+            if not self._running:
+                raise ConnectionError("Not connected to XTB server")
+            heapq.heappush(self._heap, (priority, next(self._seq), time.monotonic(), command, future))
+            self._max_depth = max(self._max_depth, len(self._heap))
+            self._cond.notify()
+        return future
+
+    def execute(self, command, priority=None, timeout=None):
+        return self.submit(command, priority).result(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._heap:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                now = time.monotonic()
+                wait = self._bucket.delay(now)
+                if wait > 0:
+                    # Réveil anticipé possible : on réévalue la tête de file
+                    self._cond.wait(wait)
+                    continue
+                self._bucket.take(now)
+                priority, _, enqueued, command, future = heapq.heappop(self._heap)
+
+            if not future.set_running_or_notify_cancel():
+                continue
+            future.dispatched_at = time.time()
+            with self._cond:
+                self._waits.append((priority, now - enqueued))
+            try:
+                result = self._transmit(command)
+            except BaseException as e:
+                self._failed += 1
+                future.set_exception(e)
+            else:
+                self._dispatched += 1
+                future.set_result(result)
+
+    def stats(self):
+        """Profondeur de file et temps d'attente, pour dimensionner les pools."""
+        with self._cond:
+            depth = {name: 0 for name in PRIORITY_NAMES.values()}
+            for priority, _, _, _, _ in self._heap:
+                depth[PRIORITY_NAMES.get(priority, str(priority))] += 1
+            queued = len(self._heap)
+            # Copie sous le verrou : stats() est appelé depuis les threads HTTP (/metrics)
+            samples = list(self._waits)
+        waits = sorted(w for _, w in samples)
+        by_priority = {}
+        for priority, w in samples:
+            by_priority.setdefault(PRIORITY_NAMES.get(priority, str(priority)), []).append(w)
+
+        def pct(values, p):
+            if not values:
+                return None
+            values = sorted(values)
+            return round(values[min(len(values) - 1, int(p / 100.0 * len(values)))] * 1000.0, 3)
+
+        return {
+            "running": self._running,
+            "rate_per_second": self._bucket.rate,
+            "burst": self._bucket.capacity,
+            "queue_depth": queued,
+            "queue_depth_by_priority": depth,
+            "max_queue_depth": self._max_depth,
+            "dispatched": self._dispatched,
+            "failed": self._failed,
+            "wait_ms": {"p50": pct(waits, 50), "p99": pct(waits, 99), "max": pct(waits, 100)},
+            "wait_ms_p99_by_priority": {name: pct(values, 99) for name, values in by_priority.items()},
+        }
@@ -1,40 +1,265 @@
 import json
+import os
+import random
 import socket
 import logging
 import ssl
-from threading import Thread
+import threading
+import time
+from collections import deque
+from xapi.chart_decoder import decode_prices
+from xapi.client import use_ssl
+from xapi.recorder import CHANNEL_STREAM, CHANNEL_STREAM_REQUEST
+
+READ_SIZE = 65536
+CONNECT_TIMEOUT = 10.0
+# keepAlive toutes les ~3 s : sans rien reçu pendant ce délai, le lien est mort
+READ_TIMEOUT = 30.0
+RECONNECT_MIN_DELAY = 0.5
+RECONNECT_MAX_DELAY = 30.0
+CANDLE_PERIOD_MS = 60 * 1000  # les bougies streamées sont en M1
+
+STOP_COMMANDS = {
+    'getTickPrices': 'stopTickPrices',
+    'getCandles': 'stopCandles',
+    'getTrades': 'stopTrades',
+    'getBalance': 'stopBalance',
+    'getKeepAlive': 'stopKeepAlive',
+    'getProfits': 'stopProfits',
+    'getTradeStatus': 'stopTradeStatus',
+    'getNews': 'stopNews',
+}
+
+
+def rate_infos_to_candles(symbol, rate_infos, digits):
+    """Bougies getChartRangeRequest -> données de messages `candle` du streaming (en prix)"""
+    columns = decode_prices(rate_infos, digits)
+    return [{"symbol": symbol, "ctm": int(ctm), "open": float(o), "high": float(h), "low": float(l),
+             "close": float(c), "vol": float(v), "quoteId": None}
+            for ctm, o, h, l, c, v in zip(columns['ctm'], columns['open'], columns['high'], columns['low'],
+                                          columns['close'], columns['vol'])]
+
 
 class Streaming(object):
-    def __init__(self, client):
+    """Session de streaming xAPI : abonnements suivis, reconnexion automatique.
+
+    Après une coupure, la session se reconnecte avec un backoff exponentiel,
+    rejoue les abonnements, puis comble le trou des bougies M1 via
+    getChartRangeRequest : les messages `candle` manquants sont émis avec
+    `"backfill": true` avant la reprise du flux.
+    """
+
+    def __init__(self, client, reconnect=True):
         self.client = client
         self.sock = None
         self.stop = False
+        self.reconnect = reconnect
+        self.subscriptions = {}  # (commande, symbole) -> arguments
+        self.last_candle = {}  # symbole -> ctm de la dernière bougie reçue
+        self.reconnects = 0
+        self.recoveries = deque(maxlen=100)
+        self._attempts = 0
+        self._wake = threading.Event()
 
     def connect(self):
-        STREAM_PORT = 5125  # Pour compte démo, 5113 pour réel
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock = ssl.wrap_socket(self.sock)
-        self.sock.connect(('xapi.xtb.com', 5125))
+        self.stop = False
+        self._wake.clear()
+        self._open()
+
+    def _open(self):
+        STREAM_PORT = int(os.getenv('XTB_STREAM_PORT', 5125))  # Pour compte démo, 5113 pour réel
+        server = os.getenv('XTB_SERVER', 'xapi.xtb.com')
+        sock = socket.create_connection((server, STREAM_PORT), timeout=CONNECT_TIMEOUT)
+        if use_ssl():
+            context = ssl.create_default_context()
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+            sock = context.wrap_socket(sock, server_hostname=server)
+        sock.settimeout(READ_TIMEOUT)
+        self.sock = sock
         logging.info('Streaming connected')
 
     def disconnect(self):
-        if self.sock:
-            self.sock.close()
         self.stop = True
+        self._wake.set()
+        self._close_socket()
         logging.info('Streaming disconnected')
 
+    def interrupt(self):
+        """Réveille le thread de lecture sans fermer le socket.
+
+        Fermer le descripteur pendant un recv() d'un autre thread ne réveille
+        pas ce dernier, et le numéro peut être aussitôt réattribué (nouvelle
+        connexion) : la lecture attendrait alors sur un autre socket. Le
+        socket est fermé par `disconnect` une fois la lecture terminée.
+        """
+        self.stop = True
+        self._wake.set()
+        sock = self.sock
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _close_socket(self):
+        sock, self.sock = self.sock, None
+        if sock:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    # -- abonnements -------------------------------------------------------
+    def _send(self, command, arguments):
+        payload = dict(arguments, command=command, streamSessionId=self.client.stream_session_id)
+        data = json.dumps(payload).encode('utf-8')
+        recorder = self.client.recorder
+        if recorder:
+            recorder.record(CHANNEL_STREAM_REQUEST, data)
+        self.sock.sendall(data + b'\n')
+
+    def subscribe(self, command, symbol=None, **arguments):
+        """Abonne la session ; l'abonnement est rejoué à chaque reconnexion."""
+        if symbol is not None:
+            arguments['symbol'] = symbol
+        self.subscriptions[(command, symbol)] = arguments
+        if self.sock:
+            self._send(command, arguments)
+
+    def unsubscribe(self, command, symbol=None):
+        arguments = self.subscriptions.pop((command, symbol), None)
+        if arguments is not None and self.sock and command in STOP_COMMANDS:
+            self._send(STOP_COMMANDS[command], {'symbol': symbol} if symbol is not None else {})
+
+    def subscribe_ticks(self, symbol, min_arrival_time=0, max_level=None):
+        arguments = {'minArrivalTime': min_arrival_time}
+        if max_level is not None:
+            arguments['maxLevel'] = max_level
+        self.subscribe('getTickPrices', symbol, **arguments)
+
+    def subscribe_candles(self, symbol):
+        self.subscribe('getCandles', symbol)
+
+    def subscribe_trades(self):
+        self.subscribe('getTrades')
+
+    def subscribe_balance(self):
+        self.subscribe('getBalance')
+
+    def subscribe_keep_alive(self):
+        self.subscribe('getKeepAlive')
+
+    # -- lecture -----------------------------------------------------------
     def read_stream(self):
+        # Lecture par blocs : un message JSON par ligne, découpé dans le tampon
+        buffer = b''
+        recorder = self.client.recorder
         while not self.stop:
             try:
-                data = ""
-                while True:
-                    char = self.sock.recv(1).decode()
-                    if char == '\n':
-                        break
-                    data += char
-                if data:
-                    logging.debug(data)
-                    yield json.loads(data)
+                chunk = self.sock.recv(READ_SIZE)
+                if not chunk:
+                    raise ConnectionError('Stream closed by server')
+                buffer += chunk
+                if b'\n' not in chunk:
+                    continue
+                *lines, buffer = buffer.split(b'\n')
+                for line in lines:
+                    if line.strip():
+                        if recorder:
+                            recorder.record(CHANNEL_STREAM, line)
+                        message = json.loads(line)
+                        if message.get('command') == 'candle':
+                            self._track_candle(message.get('data') or {})
+                        yield message
+                continue
+            except socket.timeout:
+                # Sans keepAlive demandé, un flux calme n'est pas une panne
+                if ('getKeepAlive', None) not in self.subscriptions:
+                    continue
+                error = 'no data for %.0f s' % READ_TIMEOUT
             except Exception as e:
-                logging.error(f'Streaming error: {str(e)}')
+                error = str(e)
+            if self.stop:
+                break
+            logging.error(f'Streaming error: {error}')
+            if not self.reconnect:
+                break
+            disconnected_at = time.monotonic()
+            buffer = b''
+            if not self._reconnect():
                 break
+            yield from self._backfill(disconnected_at)
+
+    def _track_candle(self, data):
+        symbol, ctm = data.get('symbol'), data.get('ctm')
+        if symbol is not None and ctm is not None and ctm > self.last_candle.get(symbol, 0):
+            self.last_candle[symbol] = ctm
+
+    def _reconnect(self):
+        self._close_socket()
+        delay = RECONNECT_MIN_DELAY
+        attempts = 0
+        while not self.stop:
+            attempts += 1
+            try:
+                self._open()
+                if self.stop:
+                    self._close_socket()
+                    return False
+                for (command, _), arguments in list(self.subscriptions.items()):
+                    self._send(command, arguments)
+                self.reconnects += 1
+                self._attempts = attempts
+                logging.info(f'Streaming reconnected after {attempts} attempt(s), '
+                             f'{len(self.subscriptions)} subscription(s) replayed')
+                return True
+            except Exception as e:
+                self._close_socket()
+                # Jitter : plusieurs instances ne se reconnectent pas en rafale
+                wait = delay * random.uniform(0.5, 1.0)
+                logging.warning(f'Streaming reconnect failed ({str(e)}), retry in {wait:.1f}s')
+                self._wake.wait(wait)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+        return False
+
+    def _backfill(self, disconnected_at):
+        """Bougies M1 closes pendant la coupure, pour chaque abonnement getCandles"""
+        reconnected_at = time.monotonic()
+        end = int(time.time() * 1000)
+        missed = []
+        for command, symbol in list(self.subscriptions):
+            start = self.last_candle.get(symbol)
+            if command != 'getCandles' or start is None:
+                continue
+            try:
+                response = self.client.commandExecute('getChartRangeRequest', {'info': {
+                    'symbol': symbol, 'period': 1, 'start': start, 'end': end}})
+            except Exception as e:
+                logging.error(f'Backfill {symbol} failed: {str(e)}')
+                continue
+            data = (response or {}).get('returnData') or {}
+            for candle in rate_infos_to_candles(symbol, data.get('rateInfos') or [], data.get('digits', 5)):
+                # Seules les bougies closes : la bougie en cours arrivera par le flux
+                if start < candle['ctm'] and candle['ctm'] + CANDLE_PERIOD_MS <= end:
+                    missed.append({"command": "candle", "backfill": True, "data": candle})
+        recovered_at = time.monotonic()
+        self.recoveries.append({
+            "time": time.time(),
+            "attempts": self._attempts,
+            "reconnect_seconds": round(reconnected_at - disconnected_at, 6),
+            "backfill_seconds": round(recovered_at - reconnected_at, 6),
+            "recovery_seconds": round(recovered_at - disconnected_at, 6),
+            "backfilled": len(missed),
+        })
+        for message in missed:
+            self._track_candle(message['data'])
+            yield message
+
+    def stats(self):
+        return {
+            "connected": self.sock is not None,
+            "subscriptions": [[command, symbol] for command, symbol in self.subscriptions],
+            "reconnects": self.reconnects,
+            "last_recovery": self.recoveries[-1] if self.recoveries else None,
+        }